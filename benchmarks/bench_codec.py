@@ -0,0 +1,69 @@
+"""
+行编解码器与旧的 serialize/deserialize_complex_fields 的对比。
+在项目根目录运行：python -m benchmarks.bench_codec
+"""
+from dataclasses import asdict
+from datetime import datetime
+import random
+import time
+
+from core.codec import RowCodec, serialize_complex_fields, deserialize_complex_fields, orjson
+from core.models import Artwork, ArtworkType, ArtworkRestrict, Tag
+
+def make_artworks(count: int) -> list[Artwork]:
+    rng = random.Random(0)
+    artworks = []
+    for i in range(count):
+        tags = [Tag(f"tag{rng.randrange(3000)}", f"翻译{rng.randrange(3000)}") for _ in range(10)]
+        artworks.append(Artwork(
+            id=100000 + i,
+            title=f"[作品] {i}",
+            comment="{不是 JSON 的简介} " * 5,
+            pageCount=rng.randrange(1, 20),
+            user_id=rng.randrange(1, 10 ** 8),
+            user_name=f"作者{i}",
+            type=ArtworkType(rng.randrange(3)),
+            restrict=ArtworkRestrict(rng.randrange(3)),
+            aiType=1,
+            timestamp=datetime(2024, 1, 1),
+            width=1200,
+            height=1600,
+            tags=tags,
+            ugoiraInfo={},
+            data={"illust_details": {"id": i, "title": f"作品 {i}", "tags": [t.tag for t in tags],
+                                     "manga_a": [{"page": p, "url": f"https://i.pximg.net/{i}_p{p}.jpg"} for p in range(10)]},
+                  "author_details": {"user_id": i, "user_name": f"作者{i}"}},
+        ))
+    return artworks
+
+def as_db_row(artwork: Artwork) -> dict:
+    """模拟 MySQL 返回的行：复杂字段为 JSON 字符串，枚举为整数"""
+    row = serialize_complex_fields(asdict(artwork))
+    row["timestamp"] = artwork.timestamp
+    return row
+
+def timeit(label: str, func, items) -> float:
+    start = time.perf_counter()
+    for item in items:
+        func(item)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<40}{elapsed * 1000:>10.1f} ms  {len(items) / elapsed:>12,.0f} 行/秒")
+    return elapsed
+
+def main(count: int = 20000) -> None:
+    print(f"JSON 库: {'orjson' if orjson else 'json'}，{count} 行")
+    artworks = make_artworks(count)
+    rows = [as_db_row(a) for a in artworks]
+    codec = RowCodec(Artwork)
+
+    old_encode = timeit("serialize_complex_fields(asdict())", lambda a: serialize_complex_fields(asdict(a)), artworks)
+    new_encode = timeit("RowCodec.encode", codec.encode, artworks)
+    old_decode = timeit("deserialize_complex_fields + Artwork()", lambda r: Artwork(**deserialize_complex_fields(r)), rows)
+    new_decode = timeit("RowCodec.decode", codec.decode, rows)
+    print(f"编码加速 {old_encode / new_encode:.1f}x，解码加速 {old_decode / new_decode:.1f}x")
+
+    # 结果必须一致
+    assert codec.decode(rows[0]) == Artwork(**deserialize_complex_fields(rows[0]))
+
+if __name__ == "__main__":
+    main()
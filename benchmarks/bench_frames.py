@@ -0,0 +1,104 @@
+"""
+动图帧合成与重复帧合并的对比：逐帧 PIL.Image.alpha_composite 并保留所有帧（旧流程），
+与跳过不透明帧和重复帧的单遍合成（zip_to_webp）。
+在项目根目录运行：python -m benchmarks.bench_frames
+"""
+import tempfile
+import zipfile
+import time
+import os
+import io
+
+import numpy as np
+from PIL import Image as PILImage
+
+from core.frames import iter_encoder_frames
+from core.utils import zip_to_webp
+
+def make_frames(count: int, size: int, hold: int, alpha: bool, seed: int = 0) -> list[np.ndarray]:
+    """生成模拟帧：每个画面连续出现 hold 次，重复出现的帧带有轻微的 JPEG 式噪声"""
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:size, 0:size]
+    frames = []
+    for i in range(count):
+        key = i // hold
+        frame = np.zeros((size, size, 4), dtype=np.uint8)
+        frame[..., 0] = (xx + key * 7) % 256
+        frame[..., 1] = (yy + key * 13) % 256
+        frame[..., 2] = ((xx + yy) // 2 + key * 29) % 256
+        frame[..., 3] = 255
+        # 每个画面中移动的方块，保证不同画面之间有明显差异
+        x0 = (key * 37) % (size - 64)
+        frame[40:104, x0:x0 + 64, :3] = 255
+        if i % hold:
+            noise = rng.integers(-1, 2, size=(size, size, 3))
+            frame[..., :3] = np.clip(frame[..., :3].astype(np.int16) + noise, 0, 255)
+        if alpha:
+            frame[size // 2:, :, 3] = 0
+            frame[size // 4:size // 2, :, 3] = 128
+        frames.append(frame)
+    return frames
+
+def make_zip(frames: list[np.ndarray]) -> tuple[bytes, dict]:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zip_ref:
+        for i, frame in enumerate(frames):
+            png = io.BytesIO()
+            PILImage.fromarray(frame).save(png, "PNG")
+            zip_ref.writestr(f"{i:06d}.png", png.getvalue())
+    return buffer.getvalue(), {"frames": [{"file": f"{i:06d}.png", "delay": 60} for i in range(len(frames))]}
+
+def legacy_encode(zip_bytes: bytes, metadata: dict, webp_path: str, quality: int = 85) -> None:
+    """旧流程：逐帧与第一帧合成，所有帧保存在列表中后一次性编码"""
+    with zipfile.ZipFile(io.BytesIO(zip_bytes)) as zip_ref:
+        names = [frame["file"] for frame in metadata["frames"]]
+        background = PILImage.open(io.BytesIO(zip_ref.read(names[0]))).convert("RGBA")
+        frames = [PILImage.alpha_composite(background, PILImage.open(io.BytesIO(zip_ref.read(name))).convert("RGBA"))
+                  for name in names]
+    frames[0].save(webp_path, format="WebP", save_all=True, append_images=frames[1:], loop=0, lossless=False,
+                   quality=quality, duration=[frame["delay"] for frame in metadata["frames"]], method=6)
+
+def bench_composite(frames: list[np.ndarray]) -> tuple[float, float]:
+    pil_frames = [PILImage.fromarray(frame) for frame in frames]
+    start = time.perf_counter()
+    for frame in pil_frames:
+        PILImage.alpha_composite(pil_frames[0], frame)
+    pil_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in iter_encoder_frames(frames):
+        pass
+    new_time = time.perf_counter() - start
+    return pil_time, new_time
+
+def main(count: int = 48, size: int = 480) -> None:
+    cases = [
+        ("不透明，每个画面停留 3 帧", make_frames(count, size, hold=3, alpha=False)),
+        ("半透明，每个画面停留 2 帧", make_frames(count, size, hold=2, alpha=True)),
+        ("不透明，无重复帧", make_frames(count, size, hold=1, alpha=False)),
+    ]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for label, frames in cases:
+            print(f"{label}（{count} 帧，{size}x{size}）")
+            pil_time, new_time = bench_composite(frames)
+            print(f"  合成：PIL 逐帧 {pil_time * 1000:.1f} ms，单遍 {new_time * 1000:.1f} ms")
+
+            zip_bytes, metadata = make_zip(frames)
+            legacy_path = os.path.join(tmp_dir, "legacy.webp")
+            new_path = os.path.join(tmp_dir, "new.webp")
+            start = time.perf_counter()
+            legacy_encode(zip_bytes, metadata, legacy_path)
+            legacy_time = time.perf_counter() - start
+            start = time.perf_counter()
+            zip_to_webp(zip_bytes, new_path, metadata)
+            new_time = time.perf_counter() - start
+            legacy_size, new_size = os.path.getsize(legacy_path), os.path.getsize(new_path)
+            with PILImage.open(legacy_path) as image:
+                legacy_frames = image.n_frames
+            with PILImage.open(new_path) as image:
+                new_frames = image.n_frames
+            print(f"  编码：旧流程 {legacy_time:.2f} 秒 / {legacy_size / 1024:.1f} KB（{legacy_frames} 帧），"
+                  f"新流程 {new_time:.2f} 秒 / {new_size / 1024:.1f} KB（{new_frames} 帧），"
+                  f"耗时 {new_time / legacy_time:.0%}，体积 {new_size / legacy_size:.0%}")
+
+if __name__ == "__main__":
+    main()
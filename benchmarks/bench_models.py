@@ -0,0 +1,69 @@
+"""
+普通模型与 __slots__ 模型（标签驻留）的内存占用对比。
+用 10 万个作品的模拟数据库行分别构建两种模型，统计常驻内存与构建耗时（耗时包含生成模拟行和 tracemalloc 的开销，只用于相互比较）。
+在项目根目录运行：python -m benchmarks.bench_models
+"""
+from datetime import datetime
+import random
+import time
+import gc
+import tracemalloc
+
+from core.codec import get_codec, json_dumps
+from core.models import Artwork, CompactArtwork, Image, CompactImage, interned_tag_count
+
+def make_rows(count: int, unique_tags: int = 3000, tags_per_artwork: int = 10):
+    """生成模拟的 bookmarks / images 行：复杂字段为 JSON 字符串，原始数据已单独存放"""
+    rng = random.Random(0)
+    for i in range(count):
+        artwork_id = 100000 + i
+        tags = []
+        for _ in range(tags_per_artwork):
+            n = rng.randrange(unique_tags)
+            tag, translation = f"标签{n}", f"translation{n}" if n % 3 else f"标签{n}"
+            tags.append({"tag": tag, "translation": translation,
+                         "display_tag": f"{tag}({translation})" if tag != translation else tag})
+        bookmark = {
+            "id": artwork_id, "title": f"作品 {i}", "comment": "", "pageCount": 1,
+            "user_id": rng.randrange(1, 20000), "user_name": f"作者{rng.randrange(20000)}",
+            "type": 0, "restrict": 0, "aiType": 1, "timestamp": datetime(2024, 1, 1),
+            "width": 1200, "height": 1600, "tags": json_dumps(tags), "ugoiraInfo": "{}", "data": None,
+            "is_deleted": 0,
+        }
+        image = {
+            "id": f"{artwork_id}_p0", "idNum": artwork_id, "index": 0,
+            "url": f"https://i.pximg.net/img-original/img/2024/01/01/00/00/00/{artwork_id}_p0.png",
+            "width": 1200, "height": 1600, "ext": "png",
+            "original_path": f"D:/pixiv/Illustration/{artwork_id}_p0.png",
+            "compressed_path": f"D:/pixiv_webp/Illustration/{artwork_id}_p0.webp", "is_deleted": 0,
+        }
+        yield bookmark, image
+
+def load(count: int, artwork_type: type, image_type: type) -> tuple[int, float]:
+    """构建整个库并返回 (常驻内存字节数, 耗时)"""
+    artwork_codec, image_codec = get_codec(artwork_type), get_codec(image_type)
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    library = {}
+    for bookmark, image in make_rows(count):
+        # 行数据在循环中生成后即丢弃，只统计构建出的对象
+        library[bookmark["id"]] = (artwork_codec.decode(bookmark), [image_codec.decode(image)])
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del library
+    return current, elapsed
+
+def main(count: int = 100000) -> None:
+    print(f"{count} 个作品，每个 10 个标签，共 3000 个不同标签")
+    plain_bytes, plain_time = load(count, Artwork, Image)
+    compact_bytes, compact_time = load(count, CompactArtwork, CompactImage)
+    mb = 1024 * 1024
+    print(f"{'普通 dataclass':<24}{plain_bytes / mb:>10.1f} MB{plain_time:>10.2f} 秒")
+    print(f"{'slots + 标签驻留':<24}{compact_bytes / mb:>10.1f} MB{compact_time:>10.2f} 秒")
+    print(f"内存减少 {(1 - compact_bytes / plain_bytes) * 100:.1f}%，驻留标签 {interned_tag_count()} 个")
+
+if __name__ == "__main__":
+    main()
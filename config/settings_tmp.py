@@ -4,6 +4,9 @@ logger = get_logger('pixiv')
 
 # 目标用户 ID（需填写你要爬取的 Pixiv 用户的数字 ID，例如 '12345678'）
 TARGET_USER_ID = ""
+# 同时同步多个用户的收藏时填写用户 ID 列表，例如 ['12345678', '87654321']；留空时只同步 TARGET_USER_ID
+# 多个用户共同收藏的作品只获取、下载和压缩一次，用户与作品的对应关系记录在 user_bookmarks 表中
+TARGET_USER_IDS = []
 
 # MySQL 数据库配置
 DATABASE_CONFIG = {
@@ -19,15 +22,128 @@ HEADERS = {
     'Referer': 'https://www.pixiv.net/'
 }
 
+# 数据库批量写入：缓冲行数达到 DB_BATCH_SIZE 或距上次写入超过 DB_FLUSH_INTERVAL 秒时提交一次
+DB_BATCH_SIZE = 200
+DB_FLUSH_INTERVAL = 5
+# 写入失败时放回缓冲区等待重试的最多行数，超出的批次丢弃并记录错误，未入库的作品下次运行时重新处理
+DB_MAX_PENDING_ROWS = 10000
+# 关闭写入器时写入失败的重试次数
+DB_CLOSE_RETRIES = 3
+# 流式读取数据库时每次取回的行数
+DB_FETCH_CHUNK_SIZE = 1000
+
 # 本地和远程目录配置
 # LOCAL_DIR：图片压缩后保存的本地目录（如 r"D:\pixiv_images"）
 # REMOTE_DIR：原始图片下载保存目录（如 r"D:\pixiv_downloads"）
 LOCAL_DIR = r""
 REMOTE_DIR = r""
 
+# 下载后端
+# "aria2_rpc"：启动一个常驻的 aria2c RPC 进程，所有图片通过 JSON-RPC 排队下载（推荐）
+# "stream"：纯 Python 流式下载，复用连接池，支持断点续传，无需安装 aria2c
+# "aria2c"：每张图片单独启动一个 aria2c 进程（旧模式，作为后备）
+DOWNLOADER = "aria2_rpc"
+# stream 后端每次写入的块大小（字节）
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+# 已运行的 aria2 RPC 地址（如 "http://127.0.0.1:6800/jsonrpc"）及其密钥，留空则自动启动本地 aria2c
+ARIA2_RPC_URL = ""
+ARIA2_RPC_SECRET = ""
+# 下载调度
+# DOWNLOAD_MAX_MBPS：所有下载共享的带宽上限（MB/秒），0 为不限速；aria2 后端通过 aria2 自身的限速选项生效
+DOWNLOAD_MAX_MBPS = 0
+# DOWNLOAD_SMALL_FIRST：优先下载估计体积小的图片，压缩阶段更早拿到任务；为 False 时按作品轮流下载
+# 图片服务器 i.pximg.net 的连接数上限见 HOST_LIMITS
+DOWNLOAD_SMALL_FIRST = False
+
 # 代理配置（如需使用代理访问 Pixiv，填写代理地址，否则留空）
 PROXIES = {}
 # PROXIES = {
 #     "http": "",   # 例如 "http://127.0.0.1:7890"
 #     "https": "",  # 例如 "http://127.0.0.1:7890"
-# }
\ No newline at end of file
+# }
+
+# 并发配置
+# MAX_WORKERS：阻塞操作（压缩、数据库、ExifTool）的线程数，同时决定同步 HTTP 连接池大小
+MAX_WORKERS = 16
+# MAX_CONCURRENCY：同时进行的网络请求总数上限
+MAX_CONCURRENCY = 64
+# HOST_LIMITS：按主机限制同时进行的请求数，i.pximg.net 的值即图片下载的连接数上限
+HOST_LIMITS = {
+    "www.pixiv.net": 16,
+    "i.pximg.net": 32,
+}
+# RATE_LIMITS：各类接口的自适应限速（请求/秒），格式为 (初始速率, 最低速率, 最高速率)
+# 遇到 429/403 或延迟升高时自动降速，连续成功后逐步提速
+RATE_LIMITS = {
+    "bookmarks": (2, 0.2, 10),
+    "details": (5, 0.5, 30),
+    "pages": (5, 0.5, 30),
+    "image": (20, 1, 200),
+}
+# 重试策略：只重试网络中断、超时、429 和 5xx 等可重试的错误，404、作品已删除、文件损坏等不重试
+# RETRY_MAX_ATTEMPTS：各类操作的最多尝试次数（api：接口请求，download：图片下载，local：压缩编码等本地处理）
+RETRY_MAX_ATTEMPTS = {
+    "api": 6,
+    "download": 5,
+    "local": 2,
+}
+# 指数退避：第 n 次失败后等待 [0, RETRY_BASE_DELAY * 2^n] 秒内的随机时间，最长 RETRY_MAX_DELAY 秒
+RETRY_BASE_DELAY = 1
+RETRY_MAX_DELAY = 60
+# 每次运行所有操作共享的重试总次数，用完后失败的操作不再重试
+RETRY_BUDGET_TOTAL = 1000
+# 同一主机连续失败 CIRCUIT_BREAKER_THRESHOLD 次后暂停对它的请求 CIRCUIT_BREAKER_COOLDOWN 秒
+CIRCUIT_BREAKER_THRESHOLD = 20
+CIRCUIT_BREAKER_COOLDOWN = 30
+# 作品详情缓存：重新运行或中途失败后重试时，未过期的详情不再请求接口
+DETAILS_CACHE_ENABLED = True
+DETAILS_CACHE_PATH = "cache/details.sqlite3"
+DETAILS_CACHE_TTL = 7 * 24 * 3600  # 有效期（秒）
+DETAILS_CACHE_MAX_MB = 512  # 缓存容量上限，超出后淘汰最久未访问的条目
+# BOOKMARK_PAGING：收藏夹分页模式
+# "incremental"：逐页获取，遇到全部已存在的页即停止（日常同步）
+# "full"：先读取收藏总数，再并发获取所有页（首次完整同步）
+BOOKMARK_PAGING = "incremental"
+# METADATA_MODE：作品信息的获取方式
+# "details"：每个作品请求一次完整详情
+# "listing"：用收藏列表中已有的标题、标签、作者、页数、尺寸和上传时间构建作品，只请求轻量的分页接口获取原图地址；
+#            动图、被屏蔽的作品以及 METADATA_REQUIRE_COMMENT 为 True 时仍请求完整详情。列表中的标签没有翻译，简介为空
+METADATA_MODE = "details"
+METADATA_REQUIRE_COMMENT = False
+# BOOKMARK_PAGE_CONCURRENCY：full 模式下同时请求的页数
+BOOKMARK_PAGE_CONCURRENCY = 8
+# PIPELINE_QUEUE_SIZE：流水线各阶段之间队列的长度，决定内存中同时处理的作品数量上限
+PIPELINE_QUEUE_SIZE = 64
+# COMPRESS_WORKERS：WebP 压缩进程数，0 表示与 CPU 核心数相同
+COMPRESS_WORKERS = 0
+# EXIFTOOL_WORKERS：重新写入标签时使用的 ExifTool 实例数量，可根据 CPU 核心数调整（压缩时已直接写入 XMP，日常运行不使用）
+EXIFTOOL_WORKERS = 16
+# 重新写入标签（python main.py --retag）
+# RETAG_MODE："stay_open" 每个线程一个常驻 exiftool 进程，一批文件一次往返；"argfile" 每批写成一个 -@ 参数文件，启动一次 exiftool
+RETAG_MODE = "stay_open"
+# RETAG_BATCH_SIZE：每批处理的文件数
+RETAG_BATCH_SIZE = 200
+
+# 动图配置
+# FRAME_DIFF_THRESHOLD：相邻帧逐像素差值都不超过该值时视为重复帧，合并为一帧并累加持续时间，0 表示只合并完全相同的帧
+FRAME_DIFF_THRESHOLD = 2
+
+# 输出清单：记录每张图片的原图和 WebP 的大小、修改时间、哈希及编码参数，重新运行时跳过已完成的下载和压缩
+MANIFEST_ENABLED = True
+MANIFEST_PATH = "cache/manifest.sqlite3"
+# ENCODER_VERSION：修改压缩流程后递增，清单中旧版本生成的 WebP 会重新压缩
+ENCODER_VERSION = 1
+
+# 任务日志：记录每个作品获取详情、下载、压缩（含标签）、入库的进度，中断后用 --resume 继续未完成的作品
+JOURNAL_ENABLED = True
+JOURNAL_PATH = "cache/journal.sqlite3"
+
+# 分布式任务队列：多台机器共享数据库时，先用 --enqueue 把新收藏加入队列，再在各机器上运行 --worker 分担处理
+# WORK_QUEUE_BACKEND：mysql 使用 DATABASE_CONFIG 中的数据库；sqlite 为单机测试用的替身，队列表保存在 WORK_QUEUE_SQLITE_PATH
+WORK_QUEUE_BACKEND = "mysql"
+WORK_QUEUE_SQLITE_PATH = "cache/work_queue.sqlite3"
+# 每次领取的作品数、租约时长（秒，处理期间每 1/3 租约时长续约一次）、最多尝试次数、队列暂时为空时的轮询间隔（秒）
+WORK_QUEUE_BATCH_SIZE = 50
+WORK_QUEUE_LEASE_SECONDS = 300
+WORK_QUEUE_MAX_ATTEMPTS = 3
+WORK_QUEUE_POLL_INTERVAL = 10
@@ -0,0 +1,77 @@
+from dataclasses import dataclass, field
+import asyncio
+
+from config.settings import *
+from core.engine import CrawlEngine
+from core.bookmarks import fetch_new_bookmarks
+import core.database as db
+
+def target_user_ids() -> list[str]:
+    """要同步的用户列表，未配置 TARGET_USER_IDS 时只同步 TARGET_USER_ID，去掉重复和空值"""
+    user_ids = [str(user_id) for user_id in (TARGET_USER_IDS or [TARGET_USER_ID]) if user_id]
+    return list(dict.fromkeys(user_ids))
+
+@dataclass
+class SyncPlan:
+    """多个用户的新收藏合并去重后的结果"""
+    bookmarks: list[dict] = field(default_factory=list)           # 每个作品只出现一次，需要获取详情、下载和压缩
+    user_bookmarks: list[tuple] = field(default_factory=list)      # (user_id, artwork_id, private)
+    report: dict = field(default_factory=dict)
+
+def merge_user_bookmarks(new_bookmarks: dict[str, list[dict]], local_bookmarks_id_set: set) -> SyncPlan:
+    """
+    合并各用户的新收藏。同一作品无论被几个用户收藏，都只处理一次；
+    已经入库的作品（由其他用户同步过）只记录对应关系，不再处理。
+    """
+    plan = SyncPlan()
+    pending: dict[str, dict] = {}
+    shared = stored = saved_images = 0
+    for user_id, bookmarks in new_bookmarks.items():
+        for bookmark in bookmarks:
+            artwork_id = bookmark["id"]
+            private = int(bool((bookmark.get("bookmarkData") or {}).get("private")))
+            plan.user_bookmarks.append((user_id, int(artwork_id), private))
+            if artwork_id in local_bookmarks_id_set:
+                stored += 1
+            elif artwork_id in pending:
+                shared += 1
+            else:
+                pending[artwork_id] = bookmark
+                continue
+            saved_images += int(bookmark.get("pageCount") or 1)
+    plan.bookmarks = list(pending.values())
+    plan.report = {
+        "users": len(new_bookmarks),
+        "entries": len(plan.user_bookmarks),
+        "artworks": len(plan.bookmarks),
+        "shared": shared,                       # 本次多个用户共同收藏的作品
+        "stored": stored,                       # 已由其他用户同步入库的作品
+        "saved_artworks": shared + stored,      # 省去的详情请求次数
+        "saved_images": saved_images,           # 省去的下载和压缩次数
+    }
+    return plan
+
+async def plan_user_sync(engine: CrawlEngine, user_ids: list[str], local_bookmarks_id_set: set) -> SyncPlan:
+    """
+    并发获取每个用户的新收藏并合并去重，同时写入用户与作品的对应关系。
+    用户的已知收藏取对应关系与已入库作品的交集，上次处理失败的作品会重新出现在新收藏中。
+    """
+    await engine.run_blocking(db.ensure_user_bookmarks_table, TARGET_USER_ID)
+
+    async def fetch_user(user_id: str) -> list[dict]:
+        known = {str(artwork_id) for artwork_id in await engine.run_blocking(db.get_user_bookmark_ids, user_id)}
+        bookmarks = await fetch_new_bookmarks(engine, user_id, known & local_bookmarks_id_set)
+        logger.info(f"用户 {user_id} 新收藏 {len(bookmarks)} 个")
+        return bookmarks
+
+    results = await asyncio.gather(*[fetch_user(user_id) for user_id in user_ids], return_exceptions=True)
+    new_bookmarks = {}
+    for user_id, result in zip(user_ids, results):
+        if isinstance(result, Exception):
+            logger.error(f"获取用户 {user_id} 的收藏夹失败: {result}")
+            continue
+        new_bookmarks[user_id] = result
+
+    plan = merge_user_bookmarks(new_bookmarks, local_bookmarks_id_set)
+    await engine.run_blocking(db.add_user_bookmarks, plan.user_bookmarks)
+    return plan
@@ -2,121 +2,99 @@ from typing import Optional
 import subprocess
 import os
 
-import requests
-import time
-
 from config.settings import *
 from core.utils import load_cookies_from_file
+from core.aria2 import get_daemon, Aria2Error, ERROR_STATUS
+from core.downloader import DownloadError
+from core.retry import get_policy, host_of
+from core.ratelimit import get_limiter
 
 COOKIES = load_cookies_from_file("config/cookies.txt")
 
-def download_image(url: str, save_path: str, use_cookies: bool = False, retry: int = 5) -> None:
-    """使用aria2下载图片，带重试和完整性检查"""
-    for attempt in range(retry):
-        try:
-            # 构建aria2c命令
-            # if os.path.exists(save_path):
-            #     logger.info(f"文件已存在，跳过下载: {save_path}")
-            #     raise FileExistsError(f"文件已存在: {save_path}")
-            cmd = [
-                'aria2c',
-                '--user-agent=' + HEADERS.get('User-Agent', ''),
-                '--referer=' + HEADERS.get('Referer', ''),
-                '--dir=' + os.path.dirname(save_path),
-                '--out=' + os.path.basename(save_path),
-                '--max-tries=10',
-                '--retry-wait=1',
-                '--timeout=30',
-                '--continue=true',
-                '--check-integrity=true',
-                '--allow-overwrite=true',
-                url
-            ]
+def download_image(url: str, save_path: str, use_cookies: bool = False) -> None:
+    """
+    使用 aria2 后端下载图片，失败时按下载重试策略重试。
+    stream 后端由 CrawlEngine.stream_download 以协程下载，不经过这里。
+    """
+    backend = download_image_rpc if DOWNLOADER == "aria2_rpc" else download_image_aria2c
+    get_policy("download").run(backend, url, save_path, use_cookies, host=host_of(url), label=url)
+
+def _remove_partial(*paths: str) -> None:
+    for path in paths:
+        if os.path.exists(path):
+            try:
+                os.remove(path)
+            except:
+                pass
 
-            # 如果配置了代理，添加代理选项
-            if PROXIES and 'http' in PROXIES:
-                cmd.extend(['--all-proxy=' + PROXIES['http']])
+def download_image_rpc(url: str, save_path: str, use_cookies: bool = False) -> None:
+    """通过常驻的 aria2 RPC 守护进程下载图片"""
+    daemon = get_daemon()
+    headers = []
+    if use_cookies and COOKIES:
+        cookie_str = '; '.join([f"{k}={v}" for k, v in COOKIES.items()])
+        headers.append('Cookie: ' + cookie_str)
+    try:
+        get_limiter("image").acquire()
+        daemon.download(url, save_path, headers)
+        if not (os.path.exists(save_path) and os.path.getsize(save_path) > 0):
+            raise DownloadError("Downloaded file is empty or missing")
+    except Exception:
+        _remove_partial(save_path, save_path + ".aria2")
+        raise
 
-            # 如果使用cookies，添加cookie选项
-            if use_cookies and COOKIES:
-                cookie_str = '; '.join([f"{k}={v}" for k, v in COOKIES.items()])
-                cmd.extend(['--header=Cookie: ' + cookie_str])
+def download_image_aria2c(url: str, save_path: str, use_cookies: bool = False) -> None:
+    """启动一个 aria2c 进程下载一张图片，带完整性检查"""
+    # 构建aria2c命令
+    cmd = [
+        'aria2c',
+        '--user-agent=' + HEADERS.get('User-Agent', ''),
+        '--referer=' + HEADERS.get('Referer', ''),
+        '--dir=' + os.path.dirname(save_path),
+        '--out=' + os.path.basename(save_path),
+        # 重试由 core.retry 的下载策略统一控制
+        '--max-tries=1',
+        '--timeout=30',
+        '--continue=true',
+        '--check-integrity=true',
+        '--allow-overwrite=true',
+        url
+    ]
 
-            # 执行下载
-            result = subprocess.run(cmd, capture_output=True, text=True, encoding='utf-8', errors='ignore', timeout=600)
-            
-            if result.returncode == 0:
-                # 检查文件是否存在且大小大于0
-                if os.path.exists(save_path) and os.path.getsize(save_path) > 0:
-                    return
-                else:
-                    raise Exception("Downloaded file is empty or missing")
-            else:
-                # 收集所有可用的错误信息
-                error_details = []
-                error_details.append(f"退出码: {result.returncode}")
-                if result.stderr.strip():
-                    error_details.append(f"stderr: {result.stderr.strip()}")
-                if result.stdout.strip():
-                    error_details.append(f"stdout: {result.stdout.strip()}")
-                error_details.append(f"命令: {' '.join(cmd)}")
-                
-                raise Exception(f"aria2c failed: {'; '.join(error_details)}")
+    # 每个 aria2c 进程平分全局带宽上限
+    if DOWNLOAD_MAX_MBPS > 0:
+        connections = HOST_LIMITS.get("i.pximg.net", MAX_WORKERS)
+        cmd.append(f'--max-download-limit={int(DOWNLOAD_MAX_MBPS * 1024 * 1024 / connections)}')
 
-        except Exception as e:
-            logger.warning(f"[{url}][尝试 {attempt + 1}/{retry}] 下载失败：{e}")
-            # 清理可能的不完整文件
-            if os.path.exists(save_path):
-                try:
-                    os.remove(save_path)
-                except:
-                    pass
-            time.sleep(1)
+    # 如果配置了代理，添加代理选项
+    if PROXIES and 'http' in PROXIES:
+        cmd.extend(['--all-proxy=' + PROXIES['http']])
 
-    raise Exception(f"多次尝试后仍无法下载：{url}")
+    # 如果使用cookies，添加cookie选项
+    if use_cookies and COOKIES:
+        cookie_str = '; '.join([f"{k}={v}" for k, v in COOKIES.items()])
+        cmd.extend(['--header=Cookie: ' + cookie_str])
 
-def get_bookmarks(user_id: str, offset: int = 0, limit: int = 100, lang: str = "zh") -> Optional[dict]:
-    """获取用户的收藏夹信息"""
-    url = f"https://www.pixiv.net/ajax/user/{user_id}/illusts/bookmarks?tag=&rest=show&offset={offset}&limit={limit}&lang={lang}"
-    # print(url)
-    response = requests.get(url, headers=HEADERS, cookies=COOKIES, proxies=PROXIES)
-    if response.status_code == 200:
-        data: dict = response.json()
-        if not data.get("error"):
-            body: dict = data.get("body", {})
-            body.pop("ads", None)
-            return body
-        else:
-            raise Exception(f"Error fetching bookmarks: {data.get('message', 'Unknown error')}")
-    else:
-        raise Exception(f"Failed to fetch bookmarks, status code: {response.status_code}")
+    try:
+        get_limiter("image").acquire()
+        # 执行下载
+        result = subprocess.run(cmd, capture_output=True, text=True, encoding='utf-8', errors='ignore', timeout=600)
 
-def get_illust_details(illust_id: int, lang: str = "zh", use_cookies = False, retry: int = 16) -> Optional[dict]:
-    """获取插画的详细信息"""
-    for attempt in range(retry):
-        try:
-            url = f"https://www.pixiv.net/touch/ajax/illust/details?illust_id={illust_id}&lang={lang}"
-            if use_cookies:
-                response = requests.get(url, headers=HEADERS, cookies=COOKIES, proxies=PROXIES)
-            else:
-                response = requests.get(url, headers=HEADERS, proxies=PROXIES)
-            if response.status_code == 200:
-                data: dict = response.json()
-                if not data.get("error"):
-                    body: dict = data.get("body", {})
-                    body.pop("ads", None)
-                    illust_details = body.get("illust_details", {})
-                    if illust_details.get("mask_reason"):
-                        logger.warning(f"插画 {illust_id} 被屏蔽，尝试使用 cookies 重新获取")
-                        return get_illust_details(illust_id, lang, use_cookies=True, retry=retry)
-                    return body
-                else:
-                    raise Exception(f"Error fetching illust details: {data.get('message', 'Unknown error')}")
-            else:
-                raise Exception(f"Failed to fetch illust details, status code: {response.status_code}")
-        except Exception as e:
-            if attempt < retry - 1:
-                logger.warning(f"[插画 {illust_id}][尝试 {attempt + 1}/{retry}] 获取详情失败：{e}")
-                time.sleep(1)
-            else:
-                raise Exception(f"多次尝试后仍无法获取插画详情 {illust_id}: {e}")
\ No newline at end of file
+        if result.returncode == 0:
+            # 检查文件是否存在且大小大于0
+            if os.path.exists(save_path) and os.path.getsize(save_path) > 0:
+                return
+            raise DownloadError("Downloaded file is empty or missing")
+        # 收集所有可用的错误信息
+        error_details = []
+        error_details.append(f"退出码: {result.returncode}")
+        if result.stderr.strip():
+            error_details.append(f"stderr: {result.stderr.strip()}")
+        if result.stdout.strip():
+            error_details.append(f"stdout: {result.stdout.strip()}")
+        error_details.append(f"命令: {' '.join(cmd)}")
+        raise Aria2Error(f"aria2c failed: {'; '.join(error_details)}", ERROR_STATUS.get(result.returncode))
+    except Exception:
+        # 清理可能的不完整文件
+        _remove_partial(save_path)
+        raise
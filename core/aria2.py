@@ -0,0 +1,228 @@
+from typing import Dict, List, Optional
+import subprocess
+import threading
+import secrets
+import socket
+import atexit
+import shutil
+import time
+import os
+
+import requests
+
+from config.settings import *
+
+# aria2 的错误码对应的 HTTP 状态：3 资源不存在，24 需要认证
+ERROR_STATUS = {3: 404, 24: 401}
+
+class Aria2Error(Exception):
+    """aria2 RPC 调用或下载失败，能对应到 HTTP 状态码时记录在 status 中"""
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+class Aria2Daemon:
+    """
+    常驻的 aria2c RPC 后端。
+    只启动一个 aria2c 进程（或连接已有的 RPC 服务），通过 JSON-RPC 提交下载任务，
+    由后台线程轮询任务状态并通知等待者，aria2 可以在文件之间复用连接。
+    """
+    def __init__(self, rpc_url: str = "", secret: str = "", max_concurrent: int = MAX_WORKERS,
+                 poll_interval: float = 0.2):
+        self.rpc_url = rpc_url
+        self.secret = secret or secrets.token_hex(16)
+        self.max_concurrent = max_concurrent
+        self.poll_interval = poll_interval
+        self.process: Optional[subprocess.Popen] = None
+        # RPC 在本机，不走代理
+        self.rpc_session = requests.Session()
+        self.rpc_session.trust_env = False
+        self._pending: Dict[str, threading.Event] = {}
+        self._results: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._running = False
+        self._poller: Optional[threading.Thread] = None
+        self._rpc_id = 0
+
+    def start(self) -> None:
+        """启动 aria2c 守护进程（未配置 RPC 地址时）并开始轮询"""
+        if self._running:
+            return
+        if not self.rpc_url:
+            self._spawn()
+        self._wait_ready()
+        if DOWNLOAD_MAX_MBPS > 0:
+            # 已有的 RPC 服务同样适用全局带宽上限
+            self.call("aria2.changeGlobalOption", {"max-overall-download-limit": str(int(DOWNLOAD_MAX_MBPS * 1024 * 1024))})
+        self._running = True
+        self._poller = threading.Thread(target=self._poll_loop, name="aria2-poller", daemon=True)
+        self._poller.start()
+
+    def _spawn(self) -> None:
+        if not shutil.which("aria2c"):
+            raise Aria2Error("未找到 aria2c，请安装或改用其他下载后端")
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+        cmd = [
+            'aria2c',
+            '--enable-rpc=true',
+            '--rpc-listen-all=false',
+            f'--rpc-listen-port={port}',
+            f'--rpc-secret={self.secret}',
+            f'--max-concurrent-downloads={self.max_concurrent}',
+            '--max-connection-per-server=16',
+            '--split=1',
+            # 重试由 core.retry 的下载策略统一控制
+            '--max-tries=1',
+            '--retry-wait=1',
+            '--timeout=30',
+            '--continue=true',
+            '--auto-file-renaming=false',
+            '--allow-overwrite=true',
+            '--console-log-level=warn',
+            '--summary-interval=0',
+        ]
+        self.process = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self.rpc_url = f"http://127.0.0.1:{port}/jsonrpc"
+        logger.info(f"已启动 aria2c RPC 守护进程: {self.rpc_url}")
+
+    def _wait_ready(self, timeout: float = 10) -> None:
+        deadline = time.time() + timeout
+        while True:
+            try:
+                self.call("aria2.getVersion")
+                return
+            except Exception as e:
+                if self.process and self.process.poll() is not None:
+                    raise Aria2Error(f"aria2c 进程已退出，退出码: {self.process.returncode}")
+                if time.time() > deadline:
+                    raise Aria2Error(f"无法连接 aria2 RPC {self.rpc_url}: {e}")
+                time.sleep(0.1)
+
+    def call(self, method: str, *params):
+        """调用一个 JSON-RPC 方法"""
+        with self._lock:
+            self._rpc_id += 1
+            rpc_id = self._rpc_id
+        payload = {
+            "jsonrpc": "2.0",
+            "id": str(rpc_id),
+            "method": method,
+            "params": [f"token:{self.secret}", *params],
+        }
+        response = self.rpc_session.post(self.rpc_url, json=payload, timeout=30)
+        data: dict = response.json()
+        if "error" in data:
+            raise Aria2Error(f"{method} 调用失败: {data['error'].get('message', data['error'])}")
+        return data.get("result")
+
+    def add(self, url: str, save_path: str, headers: Optional[List[str]] = None) -> str:
+        """提交一个下载任务，返回 gid"""
+        options = {
+            "dir": os.path.dirname(save_path),
+            "out": os.path.basename(save_path),
+            "user-agent": HEADERS.get('User-Agent', ''),
+            "referer": HEADERS.get('Referer', ''),
+        }
+        if headers:
+            options["header"] = headers
+        if PROXIES and 'http' in PROXIES:
+            options["all-proxy"] = PROXIES['http']
+        gid = self.call("aria2.addUri", [url], options)
+        with self._lock:
+            self._pending[gid] = threading.Event()
+        return gid
+
+    def wait(self, gid: str, timeout: float = 600) -> dict:
+        """等待任务完成事件，失败时抛出异常"""
+        with self._lock:
+            event = self._pending.get(gid)
+        if event is None:
+            raise Aria2Error(f"未知的下载任务: {gid}")
+        if not event.wait(timeout):
+            try:
+                self.call("aria2.forceRemove", gid)
+            except Exception:
+                pass
+            with self._lock:
+                self._pending.pop(gid, None)
+                # 超时后轮询线程仍可能已写入结果
+                self._results.pop(gid, None)
+            raise Aria2Error(f"下载超时: {gid}")
+        with self._lock:
+            self._pending.pop(gid, None)
+            status = self._results.pop(gid)
+        if status.get("status") != "complete":
+            code = int(status.get("errorCode") or 0)
+            raise Aria2Error(f"aria2 下载失败: 错误码 {code}，{status.get('errorMessage', '')}", ERROR_STATUS.get(code))
+        return status
+
+    def download(self, url: str, save_path: str, headers: Optional[List[str]] = None, timeout: float = 600) -> None:
+        """提交任务并等待完成"""
+        gid = self.add(url, save_path, headers)
+        self.wait(gid, timeout)
+
+    def _poll_loop(self) -> None:
+        keys = ["gid", "status", "errorCode", "errorMessage"]
+        while self._running:
+            with self._lock:
+                gids = [gid for gid, event in self._pending.items() if not event.is_set()]
+            if gids:
+                try:
+                    calls = [{"methodName": "aria2.tellStatus", "params": [f"token:{self.secret}", gid, keys]} for gid in gids]
+                    results = self.call_multi(calls)
+                    for gid, result in zip(gids, results):
+                        status = result[0] if isinstance(result, list) else {"status": "error", "errorMessage": str(result)}
+                        if status.get("status") in ("complete", "error", "removed"):
+                            with self._lock:
+                                event = self._pending.get(gid)
+                                # 已超时放弃的任务不再保存结果
+                                if event:
+                                    self._results[gid] = status
+                            if event:
+                                event.set()
+                            self._purge(gid)
+                except Exception as e:
+                    logger.warning(f"轮询 aria2 任务状态失败: {e}")
+            time.sleep(self.poll_interval)
+
+    def call_multi(self, calls: list) -> list:
+        """使用 system.multicall 批量调用，secret 已包含在各自参数中"""
+        payload = {"jsonrpc": "2.0", "id": "multicall", "method": "system.multicall", "params": [calls]}
+        response = self.rpc_session.post(self.rpc_url, json=payload, timeout=30)
+        data: dict = response.json()
+        if "error" in data:
+            raise Aria2Error(f"system.multicall 调用失败: {data['error'].get('message', data['error'])}")
+        return data.get("result", [])
+
+    def _purge(self, gid: str) -> None:
+        try:
+            self.call("aria2.removeDownloadResult", gid)
+        except Exception:
+            pass
+
+    def close(self) -> None:
+        """停止轮询并关闭自己启动的 aria2c"""
+        self._running = False
+        if self.process and self.process.poll() is None:
+            try:
+                self.call("aria2.shutdown")
+                self.process.wait(timeout=10)
+            except Exception:
+                self.process.terminate()
+        self.rpc_session.close()
+
+_daemon: Optional[Aria2Daemon] = None
+_daemon_lock = threading.Lock()
+
+def get_daemon() -> Aria2Daemon:
+    """获取全局共享的 aria2 守护进程，首次调用时启动"""
+    global _daemon
+    with _daemon_lock:
+        if _daemon is None:
+            daemon = Aria2Daemon(ARIA2_RPC_URL, ARIA2_RPC_SECRET)
+            daemon.start()
+            atexit.register(daemon.close)
+            _daemon = daemon
+        return _daemon
@@ -0,0 +1,55 @@
+import asyncio
+
+from config.settings import *
+from core.engine import CrawlEngine
+
+async def fetch_bookmarks_incremental(engine: CrawlEngine, user_id: str, local_bookmarks_id_set: set, limit: int = 100) -> list:
+    """逐页获取收藏夹，遇到全部已存在的页时停止"""
+    all_new_bookmarks = []
+    offset = 0
+    while True:
+        page_data: dict = await engine.get_bookmarks(user_id, offset=offset, limit=limit, lang="zh")
+        bookmarks: list = page_data.get("works", [])
+        if not bookmarks:
+            break
+        bookmarks_id_set = {artwork["id"] for artwork in bookmarks}
+        new_bookmarks = bookmarks_id_set - local_bookmarks_id_set
+        if not new_bookmarks:
+            break
+        else:
+            all_new_bookmarks.extend([b for b in bookmarks if b["id"] in new_bookmarks])
+        logger.info(f"新增收藏数量: {len(new_bookmarks)}，当前总收藏数量: {len(all_new_bookmarks)}")
+        offset += limit
+    return all_new_bookmarks
+
+async def fetch_all_bookmark_pages(engine: CrawlEngine, user_id: str, limit: int = 100,
+                                   concurrency: int = BOOKMARK_PAGE_CONCURRENCY) -> list:
+    """
+    读取第一页返回的 total，然后并发获取其余所有页，按顺序返回全部收藏。
+    并发数受 concurrency 限制，同时仍受引擎的全局和主机并发上限约束。
+    """
+    first_page: dict = await engine.get_bookmarks(user_id, offset=0, limit=limit, lang="zh")
+    total = int(first_page.get("total", 0))
+    offsets = list(range(limit, total, limit))
+    logger.info(f"收藏总数: {total}，共 {len(offsets) + 1} 页，并发数: {concurrency}")
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch_page(offset: int) -> list:
+        async with semaphore:
+            page_data: dict = await engine.get_bookmarks(user_id, offset=offset, limit=limit, lang="zh")
+            return page_data.get("works", [])
+
+    pages = await asyncio.gather(*[fetch_page(offset) for offset in offsets])
+    all_bookmarks = list(first_page.get("works", []))
+    for page in pages:
+        all_bookmarks.extend(page)
+    return all_bookmarks
+
+async def fetch_new_bookmarks(engine: CrawlEngine, user_id: str, local_bookmarks_id_set: set,
+                              mode: str = BOOKMARK_PAGING) -> list:
+    """按配置的分页模式获取新收藏"""
+    if mode == "full":
+        all_bookmarks = await fetch_all_bookmark_pages(engine, user_id)
+        return [b for b in all_bookmarks if b["id"] not in local_bookmarks_id_set]
+    return await fetch_bookmarks_incremental(engine, user_id, local_bookmarks_id_set)
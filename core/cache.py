@@ -0,0 +1,105 @@
+from typing import Optional
+import threading
+import hashlib
+import sqlite3
+import json
+import time
+import zlib
+import os
+
+from config.settings import *
+
+class DetailsCache:
+    """
+    get_illust_details 响应的本地磁盘缓存。
+    以请求内容（接口、作品 ID、语言）的哈希作键，超过 TTL 的条目视为失效，
+    总大小超过上限时按最近访问时间淘汰。
+    """
+    def __init__(self, path: str = DETAILS_CACHE_PATH, ttl: float = DETAILS_CACHE_TTL,
+                 max_bytes: int = DETAILS_CACHE_MAX_MB * 1024 * 1024):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS details_cache ("
+            "`key` TEXT PRIMARY KEY, illust_id INTEGER, stored_at REAL, accessed_at REAL, size INTEGER, payload BLOB)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_details_cache_accessed ON details_cache(accessed_at)")
+        self._lock = threading.Lock()
+        self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM details_cache").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(illust_id: int, lang: str) -> str:
+        return hashlib.sha1(f"touch/ajax/illust/details:{illust_id}:{lang}".encode("utf-8")).hexdigest()
+
+    def get(self, illust_id: int, lang: str = "zh") -> Optional[dict]:
+        """读取未过期的缓存，不存在或已过期时返回 None"""
+        key = self.make_key(illust_id, lang)
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute("SELECT stored_at, size, payload FROM details_cache WHERE `key` = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            stored_at, size, payload = row
+            if now - stored_at > self.ttl:
+                self.conn.execute("DELETE FROM details_cache WHERE `key` = ?", (key,))
+                self.total_bytes -= size
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE details_cache SET accessed_at = ? WHERE `key` = ?", (now, key))
+            self.hits += 1
+        return json.loads(zlib.decompress(payload))
+
+    def put(self, illust_id: int, lang: str, body: dict) -> None:
+        """写入缓存，超出容量时淘汰最久未访问的条目"""
+        key = self.make_key(illust_id, lang)
+        payload = zlib.compress(json.dumps(body, ensure_ascii=False).encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            old = self.conn.execute("SELECT size FROM details_cache WHERE `key` = ?", (key,)).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO details_cache (`key`, illust_id, stored_at, accessed_at, size, payload) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, illust_id, now, now, len(payload), payload)
+            )
+            self.total_bytes += len(payload) - (old[0] if old else 0)
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        # 淘汰到上限的 90%，避免每次写入都触发淘汰
+        target = self.max_bytes * 0.9
+        rows = self.conn.execute("SELECT `key`, size FROM details_cache ORDER BY accessed_at").fetchall()
+        evicted = []
+        for key, size in rows:
+            if self.total_bytes <= target:
+                break
+            evicted.append((key,))
+            self.total_bytes -= size
+        self.conn.executemany("DELETE FROM details_cache WHERE `key` = ?", evicted)
+        logger.debug(f"详情缓存超出容量，淘汰 {len(evicted)} 条")
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "bytes": self.total_bytes}
+
+    def close(self) -> None:
+        self.conn.close()
+
+_cache: Optional[DetailsCache] = None
+_cache_lock = threading.Lock()
+
+def get_details_cache() -> Optional[DetailsCache]:
+    """获取全局共享的详情缓存，未启用时返回 None"""
+    global _cache
+    if not DETAILS_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = DetailsCache()
+        return _cache
@@ -0,0 +1,159 @@
+from dataclasses import asdict, fields, is_dataclass, MISSING
+from typing import Any, Dict, get_type_hints, get_origin, get_args
+from functools import lru_cache
+from datetime import datetime
+from enum import Enum
+import hashlib
+import json
+import zlib
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+def json_dumps(value: Any) -> str:
+    """序列化为 JSON 字符串，安装了 orjson 时使用 orjson"""
+    if orjson is not None:
+        return orjson.dumps(value).decode("utf-8")
+    return json.dumps(value, ensure_ascii=False)
+
+def json_loads(value: Any) -> Any:
+    if orjson is not None:
+        return orjson.loads(value)
+    return json.loads(value)
+
+def pack_payload(data: dict) -> tuple[str, str, int, bytes]:
+    """
+    压缩原始详情数据，返回 (压缩算法, 内容哈希, 原始大小, 压缩后数据)。
+    键排序后再序列化，内容不变时哈希不变。安装了 zstandard 时使用 zstd，否则使用 zlib。
+    """
+    if orjson is not None:
+        raw = orjson.dumps(data, option=orjson.OPT_SORT_KEYS)
+    else:
+        raw = json.dumps(data, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    digest = hashlib.sha1(raw).hexdigest()
+    if zstandard is not None:
+        return "zstd", digest, len(raw), zstandard.ZstdCompressor(level=10).compress(raw)
+    return "zlib", digest, len(raw), zlib.compress(raw, 6)
+
+def unpack_payload(codec: str, blob: bytes) -> dict:
+    """解压 pack_payload 生成的数据"""
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("读取 zstd 压缩的数据需要安装 zstandard")
+        raw = zstandard.ZstdDecompressor().decompress(blob)
+    else:
+        raw = zlib.decompress(blob)
+    return json_loads(raw)
+
+def serialize_complex_fields(data_dict: Dict[str, Any]) -> Dict[str, Any]:
+    """将复杂数据类型序列化为JSON字符串"""
+    result = data_dict.copy()
+    for key, value in result.items():
+        # 处理枚举类型
+        if isinstance(value, Enum):
+            result[key] = value.value
+        elif isinstance(value, (list, dict)):
+            # 对于包含 dataclass 的复杂类型，先转换为可序列化的格式
+            if isinstance(value, list) and value and hasattr(value[0], '__dataclass_fields__'):
+                serializable_value = [asdict(item) for item in value]
+            else:
+                serializable_value = value
+            result[key] = json.dumps(serializable_value, ensure_ascii=False)
+    return result
+
+def deserialize_complex_fields(row: Dict[str, Any]) -> Dict[str, Any]:
+    """将JSON字符串反序列化为复杂数据类型"""
+    result = row.copy()
+    for key, value in result.items():
+        if isinstance(value, str) and (value.startswith('[') or value.startswith('{')):
+            try:
+                result[key] = json.loads(value)
+            except json.JSONDecodeError:
+                pass
+    return result
+
+class RowCodec:
+    """
+    按实体类字段构建的行编解码器。
+    构建时根据类型注解确定哪些列是 JSON、枚举、日期时间或布尔值，编解码时只处理这些列。
+    """
+    def __init__(self, entity_type: type, exclude: tuple = ()):
+        self.entity_type = entity_type
+        hints = get_type_hints(entity_type)
+        entity_fields = [f for f in fields(entity_type) if f.name not in exclude]
+        self.columns = tuple(f.name for f in entity_fields)
+        self.required = tuple(f.name for f in entity_fields if f.default is MISSING and f.default_factory is MISSING)
+        self.encoders: Dict[str, Any] = {}
+        self.decoders: Dict[str, Any] = {}
+        self.defaults: Dict[str, Any] = {}
+        for f in entity_fields:
+            hint = hints[f.name]
+            origin = get_origin(hint) or hint
+            if origin in (list, dict):
+                args = get_args(hint)
+                item_type = args[0] if origin is list and args else None
+                if item_type is not None and is_dataclass(item_type):
+                    item_fields = tuple(item_field.name for item_field in fields(item_type))
+                    self.encoders[f.name] = self._nested_encoder(item_fields)
+                else:
+                    self.encoders[f.name] = json_dumps
+                self.decoders[f.name] = json_loads
+                if f.default_factory is not MISSING:
+                    self.defaults[f.name] = f.default_factory
+            elif isinstance(origin, type) and issubclass(origin, Enum):
+                self.encoders[f.name] = self._enum_value
+                self.decoders[f.name] = origin
+            elif origin is datetime:
+                self.decoders[f.name] = self._parse_datetime
+            elif origin is bool:
+                self.decoders[f.name] = bool
+
+    @staticmethod
+    def _nested_encoder(item_fields: tuple):
+        def encode(items):
+            return json_dumps([{name: getattr(item, name) for name in item_fields} if is_dataclass(item) else item
+                               for item in items])
+        return encode
+
+    @staticmethod
+    def _enum_value(value):
+        return value.value if isinstance(value, Enum) else value
+
+    @staticmethod
+    def _parse_datetime(value):
+        return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+    def encode(self, entity: Any) -> tuple:
+        """把实体编码为按 columns 顺序排列的参数元组"""
+        encoders = self.encoders
+        row = []
+        for name in self.columns:
+            value = getattr(entity, name)
+            encoder = encoders.get(name)
+            row.append(encoder(value) if encoder is not None and value is not None else value)
+        return tuple(row)
+
+    def decode(self, row: Dict[str, Any]) -> Any:
+        """把数据库行解码为实体，只处理已知的复杂列，未查询的必填字段用 None 补齐"""
+        decoders = self.decoders
+        values = dict.fromkeys(self.required)
+        for name, value in row.items():
+            if value is None:
+                factory = self.defaults.get(name)
+                values[name] = factory() if factory else None
+                continue
+            decoder = decoders.get(name)
+            values[name] = decoder(value) if decoder is not None else value
+        return self.entity_type(**values)
+
+@lru_cache(maxsize=None)
+def get_codec(entity_type: type, exclude: tuple = ()) -> RowCodec:
+    """每个实体类只构建一次编解码器"""
+    return RowCodec(entity_type, exclude)
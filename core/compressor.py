@@ -0,0 +1,132 @@
+from concurrent.futures import ProcessPoolExecutor, Future
+from dataclasses import dataclass, field
+from typing import Optional
+import threading
+import hashlib
+import asyncio
+import time
+import os
+
+from config.settings import *
+from core.utils import zip_to_webp, compress_to_webp, gif_to_webp
+
+@dataclass
+class CompressJob:
+    """一个压缩任务，只包含可在进程间传递的路径和参数"""
+    kind: str  # "image" / "ugoira" / "gif"
+    input_path: str
+    output_path: str
+    quality: int = 85
+    metadata: dict = field(default_factory=dict)
+    input_bytes: Optional[bytes] = None  # 下载时保留在内存中的原始数据，有值时不再从磁盘读取
+    xmp: bytes = b""  # 编码时写入的 XMP 数据包
+    exif: bytes = b""  # 编码时写入的 EXIF 数据
+
+@dataclass
+class CompressResult:
+    output_path: str
+    pid: int
+    seconds: float
+    input_bytes: int
+    output_bytes: int
+    input_hash: str = ""  # 原始文件的 sha1，读取输入时顺便计算，不额外读取文件
+
+def encoder_settings(job: CompressJob) -> str:
+    """
+    影响输出结果的编码参数，记录在输出清单中，参数变化后才重新压缩。
+    修改编码流程（而不只是参数）时递增 ENCODER_VERSION。
+    """
+    settings = f"v{ENCODER_VERSION}:{job.kind}:q{job.quality}:m6"
+    if job.kind in ("ugoira", "gif"):
+        settings += f":d{FRAME_DIFF_THRESHOLD}"
+    return settings
+
+def run_compress_job(job: CompressJob) -> CompressResult:
+    """在工作进程中执行压缩任务"""
+    start = time.perf_counter()
+    if job.input_bytes is not None:
+        data = job.input_bytes
+    else:
+        with open(job.input_path, "rb") as f:
+            data = f.read()
+    # 解码直接使用已读入的数据，哈希不需要再读一次文件
+    input_hash = hashlib.sha1(data).hexdigest()
+    if job.kind == "ugoira":
+        zip_to_webp(data, job.output_path, job.metadata, quality=job.quality, xmp=job.xmp, exif=job.exif)
+    elif job.kind == "gif":
+        gif_to_webp(data, job.output_path, quality=job.quality, xmp=job.xmp, exif=job.exif)
+    else:
+        compress_to_webp(data, job.output_path, quality=job.quality, xmp=job.xmp, exif=job.exif)
+    if not os.path.exists(job.output_path):
+        raise ValueError(f"压缩失败，未生成文件: {job.output_path}")
+    return CompressResult(
+        output_path=job.output_path,
+        pid=os.getpid(),
+        seconds=time.perf_counter() - start,
+        input_bytes=len(data),
+        output_bytes=os.path.getsize(job.output_path),
+        input_hash=input_hash,
+    )
+
+class CompressStage:
+    """
+    独立的 WebP 压缩阶段，使用与 CPU 核心数相同的进程池，
+    编码不再与下载线程争抢 GIL。任务以文件路径提交，返回结果路径。
+    """
+    def __init__(self, workers: int = COMPRESS_WORKERS):
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        self.worker_stats: dict[int, dict] = {}
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+
+    def submit(self, job: CompressJob) -> Future:
+        """提交任务，返回 concurrent.futures.Future"""
+        future = self.executor.submit(run_compress_job, job)
+        future.add_done_callback(self._record)
+        return future
+
+    async def run(self, job: CompressJob) -> CompressResult:
+        """在协程中等待压缩完成，返回压缩结果"""
+        return await asyncio.wrap_future(self.submit(job))
+
+    def _record(self, future: Future) -> None:
+        if future.cancelled() or future.exception():
+            return
+        result: CompressResult = future.result()
+        with self._lock:
+            stats = self.worker_stats.setdefault(result.pid, {"files": 0, "seconds": 0.0, "input_bytes": 0, "output_bytes": 0})
+            stats["files"] += 1
+            stats["seconds"] += result.seconds
+            stats["input_bytes"] += result.input_bytes
+            stats["output_bytes"] += result.output_bytes
+
+    def report(self) -> list[dict]:
+        """每个工作进程的吞吐量统计"""
+        with self._lock:
+            rows = []
+            for pid, stats in sorted(self.worker_stats.items()):
+                busy = stats["seconds"] or 1e-9
+                rows.append({
+                    "pid": pid,
+                    "files": stats["files"],
+                    "busy_seconds": round(stats["seconds"], 2),
+                    "files_per_sec": round(stats["files"] / busy, 2),
+                    "input_mb_per_sec": round(stats["input_bytes"] / busy / 1024 / 1024, 2),
+                    "ratio": round(stats["output_bytes"] / stats["input_bytes"], 3) if stats["input_bytes"] else 0,
+                })
+            return rows
+
+    def log_report(self) -> None:
+        for row in self.report():
+            logger.info(f"[压缩进程 {row['pid']}] {row['files']} 个文件，忙碌 {row['busy_seconds']} 秒，"
+                        f"{row['files_per_sec']} 个/秒，{row['input_mb_per_sec']} MB/秒，压缩率 {row['ratio']}")
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -1,13 +1,16 @@
 from dbutils.pooled_db import PooledDB
 import mysql.connector
-from dataclasses import asdict
-import json
-from typing import List, Dict, Any, TypeVar, Type
+from typing import List, Dict, Any, TypeVar, Type, Iterator, Optional, Sequence, Callable
 from contextlib import contextmanager
-from enum import Enum
+from functools import lru_cache
+import threading
+import atexit
+import time
 
-from config.settings import DATABASE_CONFIG
-from core.models import Artwork, Image
+from config.settings import (DATABASE_CONFIG, DB_BATCH_SIZE, DB_FLUSH_INTERVAL, DB_FETCH_CHUNK_SIZE, DB_MAX_PENDING_ROWS,
+                             DB_CLOSE_RETRIES, logger)
+from core.models import Artwork, Image, CompactArtwork, CompactImage
+from core.codec import get_codec, pack_payload, unpack_payload
 
 DB_POOL = PooledDB(
     creator=mysql.connector,
@@ -19,11 +22,25 @@ DB_POOL = PooledDB(
     **DATABASE_CONFIG
 )
 
+T = TypeVar('T')
+
+# 原始详情数据（Artwork.data）压缩后单独存放在 bookmark_payloads 表，bookmarks 表不再写入 data 列
+PAYLOAD_TABLE = 'bookmark_payloads'
+PAYLOAD_COLUMNS = ('id', 'codec', 'hash', 'raw_size', 'stored_size', 'payload')
+TABLE_EXCLUDE = {'bookmarks': ('data',)}
+_payload_storage_ready = False
+# 用户与收藏作品的对应关系，同一作品被多个用户收藏时只存一份作品数据
+USER_BOOKMARKS_TABLE = 'user_bookmarks'
+_payload_storage_lock = threading.Lock()
+
 @contextmanager
-def get_db_cursor(dictionary=False):
-    """数据库连接和游标的上下文管理器"""
+def get_db_cursor(dictionary=False, buffered=None):
+    """数据库连接和游标的上下文管理器，buffered=False 时使用不缓冲的流式游标"""
     conn: mysql.connector.MySQLConnection = DB_POOL.connection()
-    cursor = conn.cursor(dictionary=dictionary)
+    if buffered is None:
+        cursor = conn.cursor(dictionary=dictionary)
+    else:
+        cursor = conn.cursor(dictionary=dictionary, buffered=buffered)
     try:
         yield conn, cursor
     except mysql.connector.Error as e:
@@ -34,56 +51,225 @@ def get_db_cursor(dictionary=False):
         cursor.close()
         conn.close()
 
-def serialize_complex_fields(data_dict: Dict[str, Any]) -> Dict[str, Any]:
-    """将复杂数据类型序列化为JSON字符串"""
-    result = data_dict.copy()
-    for key, value in result.items():
-        # 处理枚举类型
-        if isinstance(value, Enum):
-            result[key] = value.value
-        elif isinstance(value, (list, dict)):
-            # 对于包含 dataclass 的复杂类型，先转换为可序列化的格式
-            if isinstance(value, list) and value and hasattr(value[0], '__dataclass_fields__'):
-                serializable_value = [asdict(item) for item in value]
-            else:
-                serializable_value = value
-            result[key] = json.dumps(serializable_value, ensure_ascii=False)
-    return result
-
-def deserialize_complex_fields(row: Dict[str, Any]) -> Dict[str, Any]:
-    """将JSON字符串反序列化为复杂数据类型"""
-    result = row.copy()
-    for key, value in result.items():
-        if isinstance(value, str) and (value.startswith('[') or value.startswith('{')):
-            try:
-                result[key] = json.loads(value)
-            except json.JSONDecodeError:
-                pass
-    return result
+@lru_cache(maxsize=None)
+def build_upsert_sql(table_name: str, columns: tuple) -> str:
+    """构建 INSERT ... ON DUPLICATE KEY UPDATE 语句，每个表只构建一次"""
+    column_list = ', '.join([f"`{col}`" for col in columns])
+    placeholders = ', '.join(['%s'] * len(columns))
+    # 构建UPDATE子句，排除主键id，为列名添加反引号
+    update_assignments = ', '.join([f"`{col}` = VALUES(`{col}`)" for col in columns if col != 'id'])
+    return (
+        f"INSERT INTO {table_name} ({column_list}) VALUES ({placeholders}) "
+        f"ON DUPLICATE KEY UPDATE {update_assignments}"
+    )
+
+def entity_columns(entity_type: type, table_name: Optional[str] = None) -> tuple:
+    """实体类对应的列名，单独存放的列（如 bookmarks.data）不包含在内"""
+    return get_codec(entity_type, TABLE_EXCLUDE.get(table_name, ())).columns
+
+def entity_row(entity: Any, table_name: Optional[str] = None) -> tuple:
+    """把实体转换为按列顺序排列的参数元组"""
+    return get_codec(type(entity), TABLE_EXCLUDE.get(table_name, ())).encode(entity)
 
 def upsert_entity(entity: Any, table_name: str) -> None:
     """通用的插入或更新实体到数据库"""
     with get_db_cursor() as (conn, cursor):
-        entity_dict = serialize_complex_fields(asdict(entity))
-        
-        columns = ', '.join([f"`{col}`" for col in entity_dict.keys()])
-        placeholders = ', '.join(['%s'] * len(entity_dict))
-        values = tuple(entity_dict.values())
-        
-        # 构建UPDATE子句，排除主键id，为列名添加反引号
-        update_assignments = ', '.join([f"`{col}` = VALUES(`{col}`)" for col in entity_dict.keys() if col != 'id'])
-        
-        cursor.execute(
-            f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders}) "
-            f"ON DUPLICATE KEY UPDATE {update_assignments}",
-            values
-        )
+        sql = build_upsert_sql(table_name, entity_columns(type(entity), table_name))
+        cursor.execute(sql, entity_row(entity, table_name))
         conn.commit()
 
+def ensure_payload_storage() -> None:
+    """
+    创建原始数据表，并把 bookmarks.data 改为可空。会修改表结构，只在程序启动和迁移时调用，
+    写入器和读写函数不再调用；进程内只执行一次，表结构已是最新时不执行 ALTER。
+    """
+    global _payload_storage_ready
+    with _payload_storage_lock:
+        if _payload_storage_ready:
+            return
+        with get_db_cursor() as (conn, cursor):
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {PAYLOAD_TABLE} ("
+                "`id` BIGINT PRIMARY KEY, `codec` VARCHAR(8) NOT NULL, `hash` CHAR(40) NOT NULL, "
+                "`raw_size` INT NOT NULL, `stored_size` INT NOT NULL, `payload` LONGBLOB NOT NULL)"
+            )
+            cursor.execute(
+                "SELECT COLUMN_TYPE, IS_NULLABLE FROM information_schema.COLUMNS "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'bookmarks' AND COLUMN_NAME = 'data'"
+            )
+            column = cursor.fetchone()
+            if column and column[1] == 'NO':
+                cursor.execute(f"ALTER TABLE bookmarks MODIFY `data` {column[0]} NULL")
+            conn.commit()
+        _payload_storage_ready = True
+
+def payload_row(artwork: Artwork) -> Optional[tuple]:
+    """压缩 artwork.data，返回 bookmark_payloads 表的一行；没有原始数据时返回 None，不覆盖已有数据"""
+    if not artwork.data:
+        return None
+    codec, digest, raw_size, blob = pack_payload(artwork.data)
+    return (artwork.id, codec, digest, raw_size, len(blob), blob)
+
+def filter_changed_payloads(cursor, rows: List[tuple]) -> List[tuple]:
+    """去掉内容哈希与数据库中相同的行"""
+    if not rows:
+        return rows
+    placeholders = ', '.join(['%s'] * len(rows))
+    cursor.execute(f"SELECT id, hash FROM {PAYLOAD_TABLE} WHERE id IN ({placeholders})", [row[0] for row in rows])
+    stored = dict(cursor.fetchall())
+    return [row for row in rows if stored.get(row[0]) != row[2]]
+
+def upsert_payload(artwork: Artwork) -> bool:
+    """写入原始数据，内容未变化时跳过，返回是否写入"""
+    row = payload_row(artwork)
+    if row is None:
+        return False
+    with get_db_cursor() as (conn, cursor):
+        if not filter_changed_payloads(cursor, [row]):
+            return False
+        cursor.execute(build_upsert_sql(PAYLOAD_TABLE, PAYLOAD_COLUMNS), row)
+        conn.commit()
+        return True
+
+class BatchWriter:
+    """
+    批量写入器：先把行缓冲起来，再用 executemany 多行 INSERT ... ON DUPLICATE KEY UPDATE 写入。
+    缓冲行数达到 batch_size 或距上次写入超过 flush_interval 秒时写入，每批一个事务，关闭或退出时保证写入。
+    写入失败的行放回缓冲区等待下次写入，最多保留 max_pending 行；关闭时写入失败会退避重试 close_retries 次。
+    on_flush 在每批事务提交成功后以本批写入的书签 ID 列表调用。
+    """
+    def __init__(self, batch_size: int = DB_BATCH_SIZE, flush_interval: float = DB_FLUSH_INTERVAL,
+                 on_flush: Optional[Callable[[List[int]], None]] = None, max_pending: int = DB_MAX_PENDING_ROWS,
+                 close_retries: int = DB_CLOSE_RETRIES):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.on_flush = on_flush
+        self.max_pending = max_pending
+        self.close_retries = close_retries
+        self._buffers: Dict[str, List[tuple]] = {}
+        self._columns: Dict[str, tuple] = {PAYLOAD_TABLE: PAYLOAD_COLUMNS}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._closed = threading.Event()
+        self.rows_written = 0
+        self.flushes = 0
+        self.payloads_skipped = 0
+        self.rows_dropped = 0
+        self._timer = threading.Thread(target=self._flush_loop, name="db-writer", daemon=True)
+        self._timer.start()
+        atexit.register(self.close)
+
+    def add(self, entity: Any, table_name: str) -> None:
+        """缓冲一行，缓冲区满时立即写入"""
+        with self._lock:
+            self._columns.setdefault(table_name, entity_columns(type(entity), table_name))
+        self._append(table_name, entity_row(entity, table_name))
+
+    def _append(self, table_name: str, row: tuple) -> None:
+        with self._lock:
+            buffer = self._buffers.setdefault(table_name, [])
+            buffer.append(row)
+            full = sum(len(rows) for rows in self._buffers.values()) >= self.batch_size
+        if full:
+            self.flush()
+
+    def add_bookmark(self, artwork: Artwork) -> None:
+        """缓冲书签行和压缩后的原始数据"""
+        self.add(artwork, 'bookmarks')
+        row = payload_row(artwork)
+        if row is not None:
+            self._append(PAYLOAD_TABLE, row)
+
+    def add_image(self, image: Image) -> None:
+        self.add(image, 'images')
+
+    def flush(self) -> bool:
+        """在一个事务中写入所有缓冲的行，写入失败时返回 False"""
+        with self._flush_lock:
+            with self._lock:
+                buffers = {table: rows for table, rows in self._buffers.items() if rows}
+                self._buffers = {}
+                self._last_flush = time.monotonic()
+            if not buffers:
+                return True
+            skipped = 0
+            try:
+                with get_db_cursor() as (conn, cursor):
+                    for table_name, rows in buffers.items():
+                        if table_name == PAYLOAD_TABLE:
+                            changed = filter_changed_payloads(cursor, rows)
+                            skipped = len(rows) - len(changed)
+                            rows = changed
+                        if rows:
+                            cursor.executemany(build_upsert_sql(table_name, self._columns[table_name]), rows)
+                    conn.commit()
+            except Exception as e:
+                logger.error(f"批量写入数据库失败: {e}")
+                self._requeue(buffers)
+                return False
+            self.rows_written += sum(len(rows) for rows in buffers.values()) - skipped
+            self.payloads_skipped += skipped
+            self.flushes += 1
+            if self.on_flush and buffers.get('bookmarks'):
+                id_index = self._columns['bookmarks'].index('id')
+                try:
+                    self.on_flush([row[id_index] for row in buffers['bookmarks']])
+                except Exception as e:
+                    logger.error(f"批量写入的回调出错: {e}", exc_info=True)
+            return True
+
+    def _requeue(self, buffers: Dict[str, List[tuple]]) -> None:
+        """写入失败的行放回缓冲区等待下次写入，缓冲区放不下时丢弃这一批并记录其中的书签"""
+        failed = sum(len(rows) for rows in buffers.values())
+        with self._lock:
+            pending = sum(len(rows) for rows in self._buffers.values())
+            if pending + failed <= self.max_pending:
+                for table_name, rows in buffers.items():
+                    self._buffers.setdefault(table_name, [])[:0] = rows
+                return
+            self.rows_dropped += failed
+        self._log_dropped(buffers, f"待写入的行超过 {self.max_pending} 行")
+
+    def _log_dropped(self, buffers: Dict[str, List[tuple]], reason: str) -> None:
+        ids = []
+        if buffers.get('bookmarks'):
+            id_index = self._columns['bookmarks'].index('id')
+            ids = [row[id_index] for row in buffers['bookmarks']]
+        logger.error(f"{reason}，丢弃 {sum(len(rows) for rows in buffers.values())} 行未写入数据库的数据，"
+                     f"涉及 {len(ids)} 个作品: {ids}，这些作品没有入库，下次运行时会重新处理")
+
+    def _flush_loop(self) -> None:
+        while not self._closed.wait(self.flush_interval / 2):
+            if time.monotonic() - self._last_flush >= self.flush_interval:
+                self.flush()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            pending = sum(len(rows) for rows in self._buffers.values())
+        return {"rows": self.rows_written, "flushes": self.flushes, "pending": pending,
+                "payloads_skipped": self.payloads_skipped, "dropped": self.rows_dropped}
+
+    def close(self) -> None:
+        """停止定时写入并写入剩余的行，写入失败时退避重试，仍然失败时记录丢弃的数据"""
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        for attempt in range(self.close_retries + 1):
+            if self.flush():
+                return
+            if attempt < self.close_retries:
+                time.sleep(min(2 ** attempt, 30))
+        with self._lock:
+            buffers, self._buffers = self._buffers, {}
+            self.rows_dropped += sum(len(rows) for rows in buffers.values())
+        self._log_dropped(buffers, f"关闭时重试 {self.close_retries} 次仍无法写入数据库")
+
 def upsert_bookmark(artwork: Artwork) -> None:
     """插入或更新插画信息到数据库"""
     try:
         upsert_entity(artwork, 'bookmarks')
+        upsert_payload(artwork)
     except Exception as e:
         print(f"Error upserting bookmark: {e}")
         
@@ -92,6 +278,7 @@ def delete_bookmark(artwork_id: int) -> None:
     try:
         with get_db_cursor() as (conn, cursor):
             cursor.execute("DELETE FROM bookmarks WHERE id = %s", (artwork_id,))
+            cursor.execute(f"DELETE FROM {PAYLOAD_TABLE} WHERE id = %s", (artwork_id,))
             conn.commit()
     except Exception as e:
         print(f"Error deleting bookmark: {e}")
@@ -105,21 +292,80 @@ def delete_image(image_id: str) -> None:
     except Exception as e:
         print(f"Error deleting image: {e}")
         
-def get_bookmarks() -> dict[int, Artwork]:
-    """获取所有书签"""
+def build_entity(entity_type: Type[T], row: Dict[str, Any]) -> T:
+    """从行构建实体，未查询的必填字段用 None 补齐"""
+    return get_codec(entity_type).decode(row)
+
+def iter_rows(table_name: str, columns: Optional[Sequence[str]] = None, chunk_size: int = DB_FETCH_CHUNK_SIZE) -> Iterator[Dict[str, Any]]:
+    """使用不缓冲的游标按固定大小分块读取表，只查询指定的列"""
+    column_list = ', '.join([f"`{col}`" for col in columns]) if columns else '*'
+    with get_db_cursor(dictionary=True, buffered=False) as (conn, cursor):
+        cursor.execute(f"SELECT {column_list} FROM {table_name}")
+        exhausted = False
+        try:
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    exhausted = True
+                    break
+                yield from rows
+        finally:
+            if not exhausted:
+                # 调用方提前结束时读完剩余结果，否则连接无法放回连接池
+                cursor.fetchall()
+
+def iter_bookmarks(columns: Optional[Sequence[str]] = None, chunk_size: int = DB_FETCH_CHUNK_SIZE,
+                   compact: bool = False) -> Iterator[Artwork]:
+    """流式遍历书签，按需构建 Artwork。只需要部分字段时传入 columns，避免读取 data 列；
+    compact 为 True 时构建占用内存更少的 CompactArtwork"""
+    entity_type = CompactArtwork if compact else Artwork
     try:
-        with get_db_cursor(dictionary=True) as (conn, cursor):
-            cursor.execute("SELECT * FROM bookmarks")
-            rows = cursor.fetchall()
-            bookmarks = {}
-            for row in rows:
-                deserialized_row = deserialize_complex_fields(row)
-                artwork = Artwork(**deserialized_row)
-                bookmarks[artwork.id] = artwork
-            return bookmarks
+        for row in iter_rows('bookmarks', columns, chunk_size):
+            yield build_entity(entity_type, row)
     except Exception as e:
-        print(f"Error fetching bookmarks: {e}")
-        return {}
+        print(f"Error iterating bookmarks: {e}")
+
+def iter_images(columns: Optional[Sequence[str]] = None, chunk_size: int = DB_FETCH_CHUNK_SIZE,
+                compact: bool = False) -> Iterator[Image]:
+    """流式遍历图片信息，按需构建 Image；compact 为 True 时构建 CompactImage"""
+    entity_type = CompactImage if compact else Image
+    try:
+        for row in iter_rows('images', columns, chunk_size):
+            yield build_entity(entity_type, row)
+    except Exception as e:
+        print(f"Error iterating images: {e}")
+
+def iter_artwork_images(chunk_size: int = DB_FETCH_CHUNK_SIZE) -> Iterator[tuple[Artwork, List[Image]]]:
+    """
+    流式遍历书签及其图片：按 chunk_size 个作品一组读取书签（不读取原始数据），
+    每组用一次 IN 查询取回对应的图片，内存中只保留一组数据。
+    """
+    def images_for(artworks: List[Artwork]) -> Dict[int, List[Image]]:
+        placeholders = ', '.join(['%s'] * len(artworks))
+        images: Dict[int, List[Image]] = {artwork.id: [] for artwork in artworks}
+        with get_db_cursor(dictionary=True) as (conn, cursor):
+            cursor.execute(f"SELECT * FROM images WHERE idNum IN ({placeholders})", [artwork.id for artwork in artworks])
+            for row in cursor.fetchall():
+                image = build_entity(Image, row)
+                images.setdefault(image.idNum, []).append(image)
+        return images
+
+    chunk: List[Artwork] = []
+    for artwork in iter_bookmarks(entity_columns(Artwork, 'bookmarks'), chunk_size):
+        chunk.append(artwork)
+        if len(chunk) >= chunk_size:
+            images = images_for(chunk)
+            for item in chunk:
+                yield item, images[item.id]
+            chunk = []
+    if chunk:
+        images = images_for(chunk)
+        for item in chunk:
+            yield item, images[item.id]
+
+def get_bookmarks(compact: bool = False) -> dict[int, Artwork]:
+    """获取所有书签"""
+    return {artwork.id: artwork for artwork in iter_bookmarks(compact=compact)}
     
 def get_bookmark_ids() -> List[int]:
     """获取所有书签的ID列表"""
@@ -132,21 +378,50 @@ def get_bookmark_ids() -> List[int]:
         print(f"Error fetching bookmark IDs: {e}")
         return []
     
-def get_images() -> dict[str, Image]:
-    """获取所有图片信息"""
+def ensure_user_bookmarks_table(legacy_user_id: Optional[str] = None) -> None:
+    """
+    创建用户收藏对应表。新建的表为空时，把已有的全部书签记为 legacy_user_id 的收藏，
+    单用户时期同步的数据不会被当作新收藏重新获取。
+    """
+    with get_db_cursor() as (conn, cursor):
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {USER_BOOKMARKS_TABLE} ("
+            "`user_id` VARCHAR(32) NOT NULL, `artwork_id` BIGINT NOT NULL, `private` TINYINT NOT NULL DEFAULT 0, "
+            "`created_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP, "
+            "PRIMARY KEY (`user_id`, `artwork_id`), KEY `idx_artwork` (`artwork_id`))"
+        )
+        cursor.execute(f"SELECT 1 FROM {USER_BOOKMARKS_TABLE} LIMIT 1")
+        empty = cursor.fetchone() is None
+        if empty and legacy_user_id:
+            cursor.execute(
+                f"INSERT IGNORE INTO {USER_BOOKMARKS_TABLE} (user_id, artwork_id) SELECT %s, id FROM bookmarks",
+                (str(legacy_user_id),)
+            )
+        conn.commit()
+
+def get_user_bookmark_ids(user_id: str) -> List[int]:
+    """获取用户已记录的收藏作品ID列表"""
     try:
-        with get_db_cursor(dictionary=True) as (conn, cursor):
-            cursor.execute("SELECT * FROM images")
-            rows = cursor.fetchall()
-            images = {}
-            for row in rows:
-                deserialized_row = deserialize_complex_fields(row)
-                image = Image(**deserialized_row)
-                images[image.id] = image
-            return images
+        with get_db_cursor() as (conn, cursor):
+            cursor.execute(f"SELECT artwork_id FROM {USER_BOOKMARKS_TABLE} WHERE user_id = %s", (str(user_id),))
+            return [row[0] for row in cursor.fetchall()]
     except Exception as e:
-        print(f"Error fetching images: {e}")
-        return {}
+        print(f"Error fetching user bookmark IDs: {e}")
+        return []
+
+def add_user_bookmarks(rows: List[tuple]) -> None:
+    """批量写入 (user_id, artwork_id, private) 对应关系，已存在的保持不变"""
+    if not rows:
+        return
+    with get_db_cursor() as (conn, cursor):
+        cursor.executemany(
+            f"INSERT IGNORE INTO {USER_BOOKMARKS_TABLE} (user_id, artwork_id, private) VALUES (%s, %s, %s)", rows
+        )
+        conn.commit()
+
+def get_images(compact: bool = False) -> dict[str, Image]:
+    """获取所有图片信息"""
+    return {image.id: image for image in iter_images(compact=compact)}
     
 def get_images_by_artwork_id(artwork_id: int) -> List[Image]:
     """根据插画ID获取所有相关图片信息"""
@@ -156,24 +431,40 @@ def get_images_by_artwork_id(artwork_id: int) -> List[Image]:
             rows = cursor.fetchall()
             images = []
             for row in rows:
-                deserialized_row = deserialize_complex_fields(row)
-                image = Image(**deserialized_row)
+                image = build_entity(Image, row)
                 images.append(image)
             return images
     except Exception as e:
         print(f"Error fetching images by artwork id: {e}")
         return []
         
-def get_bookmark_by_id(artwork_id: int) -> Artwork:
-    """根据ID获取单个书签"""
+def get_payload(artwork_id: int) -> dict:
+    """按需读取并解压作品的原始详情数据，尚未迁移的旧数据从 bookmarks.data 读取"""
+    try:
+        with get_db_cursor() as (conn, cursor):
+            cursor.execute(f"SELECT codec, payload FROM {PAYLOAD_TABLE} WHERE id = %s", (artwork_id,))
+            row = cursor.fetchone()
+            if row:
+                return unpack_payload(row[0], bytes(row[1]))
+            cursor.execute("SELECT data FROM bookmarks WHERE id = %s", (artwork_id,))
+            row = cursor.fetchone()
+            return get_codec(Artwork).decoders['data'](row[0]) if row and row[0] else {}
+    except Exception as e:
+        print(f"Error fetching payload: {e}")
+        return {}
+
+def get_bookmark_by_id(artwork_id: int, with_payload: bool = False) -> Artwork:
+    """根据ID获取单个书签，with_payload 为 True 时同时加载原始详情数据"""
     try:
         with get_db_cursor(dictionary=True) as (conn, cursor):
             cursor.execute("SELECT * FROM bookmarks WHERE id = %s", (artwork_id,))
             row = cursor.fetchone()
-            if row:
-                deserialized_row = deserialize_complex_fields(row)
-                return Artwork(**deserialized_row)
-            return None
+        if row:
+            artwork = build_entity(Artwork, row)
+            if with_payload and not artwork.data:
+                artwork.data = get_payload(artwork_id)
+            return artwork
+        return None
     except Exception as e:
         print(f"Error fetching bookmark by id: {e}")
         return None
@@ -185,13 +476,71 @@ def get_image_by_id(image_id: str) -> Image:
             cursor.execute("SELECT * FROM images WHERE id = %s", (image_id,))
             row = cursor.fetchone()
             if row:
-                deserialized_row = deserialize_complex_fields(row)
-                return Image(**deserialized_row)
+                return build_entity(Image, row)
             return None
     except Exception as e:
         print(f"Error fetching image by id: {e}")
         return None
         
+def measure_bookmarks_scan() -> Dict[str, float]:
+    """统计 bookmarks 表的磁盘占用，并计时一次完整的 SELECT * 扫描"""
+    with get_db_cursor() as (conn, cursor):
+        cursor.execute(
+            "SELECT DATA_LENGTH FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'bookmarks'"
+        )
+        row = cursor.fetchone()
+    start = time.perf_counter()
+    count = sum(1 for _ in iter_rows('bookmarks'))
+    return {"rows": count, "table_bytes": row[0] if row else 0, "scan_seconds": time.perf_counter() - start}
+
+def migrate_payloads(chunk_size: int = DB_FETCH_CHUNK_SIZE) -> Dict[str, float]:
+    """
+    把 bookmarks.data 中的原始数据压缩后迁移到 bookmark_payloads 表，清空 data 列并整理表空间。
+    返回迁移前后的表大小、扫描耗时以及原始数据压缩前后的大小。
+    """
+    ensure_payload_storage()
+    before = measure_bookmarks_scan()
+    migrated = raw_bytes = stored_bytes = 0
+    rows = []
+    writer_sql = build_upsert_sql(PAYLOAD_TABLE, PAYLOAD_COLUMNS)
+    data_decoder = get_codec(Artwork).decoders['data']
+    with get_db_cursor() as (conn, write_cursor):
+        def write_chunk():
+            nonlocal migrated
+            write_cursor.executemany(writer_sql, rows)
+            write_cursor.executemany("UPDATE bookmarks SET `data` = NULL WHERE id = %s", [(row[0],) for row in rows])
+            conn.commit()
+            migrated += len(rows)
+            rows.clear()
+
+        # 读使用单独的流式连接，写入不会打断未读完的结果集
+        for source in iter_rows('bookmarks', ('id', 'data'), chunk_size):
+            if not source['data']:
+                continue
+            row = payload_row(Artwork(id=source['id'], data=data_decoder(source['data'])))
+            if row is None:
+                continue
+            raw_bytes += row[3]
+            stored_bytes += row[4]
+            rows.append(row)
+            if len(rows) >= chunk_size:
+                write_chunk()
+        if rows:
+            write_chunk()
+    with get_db_cursor() as (conn, cursor):
+        cursor.execute("OPTIMIZE TABLE bookmarks")
+        cursor.fetchall()
+    after = measure_bookmarks_scan()
+    return {
+        "migrated": migrated,
+        "raw_bytes": raw_bytes,
+        "stored_bytes": stored_bytes,
+        "table_bytes_before": before["table_bytes"],
+        "table_bytes_after": after["table_bytes"],
+        "scan_seconds_before": before["scan_seconds"],
+        "scan_seconds_after": after["scan_seconds"],
+    }
+
 def upsert_image(image: Image) -> None:
     """插入或更新图片信息到数据库"""
     try:
@@ -0,0 +1,102 @@
+from typing import Callable, Optional
+from collections import OrderedDict
+import threading
+import asyncio
+import heapq
+import time
+
+from config.settings import *
+
+class BandwidthLimiter:
+    """
+    全局下载带宽限制：以字节为单位的令牌桶，桶容量为一秒的流量。
+    每写入一块数据扣除对应字节数，余额不足时按欠额等待，长期平均速率不超过 rate。
+    rate 为 0 时不限速，只统计流量。同步与异步调用方共用同一个桶。
+    """
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.allowance = rate
+        self.updated = time.monotonic()
+        self.total = 0
+        # 每收到一块数据时调用，用于显示实时吞吐量
+        self.on_bytes: Optional[Callable[[int], None]] = None
+        self._lock = threading.Lock()
+
+    def record(self, size: int) -> float:
+        """记录 size 字节的流量，返回需要等待的秒数"""
+        with self._lock:
+            self.total += size
+            wait = 0.0
+            if self.rate > 0:
+                now = time.monotonic()
+                self.allowance = min(self.rate, self.allowance + (now - self.updated) * self.rate) - size
+                self.updated = now
+                if self.allowance < 0:
+                    wait = -self.allowance / self.rate
+        if self.on_bytes:
+            self.on_bytes(size)
+        return wait
+
+    def acquire(self, size: int) -> None:
+        wait = self.record(size)
+        if wait:
+            time.sleep(wait)
+
+    async def acquire_async(self, size: int) -> None:
+        wait = self.record(size)
+        if wait:
+            await asyncio.sleep(wait)
+
+BANDWIDTH = BandwidthLimiter(DOWNLOAD_MAX_MBPS * 1024 * 1024)
+
+def get_bandwidth() -> BandwidthLimiter:
+    """获取所有下载共享的带宽限制器"""
+    return BANDWIDTH
+
+def estimate_size(job, image) -> int:
+    """按像素数估计下载量，动图再乘以帧数"""
+    width = image.width or job.artwork.width or 0
+    height = image.height or job.artwork.height or 0
+    frames = len((job.artwork.ugoiraInfo or {}).get("frames") or ()) or 1
+    return width * height * frames
+
+class FairDownloadQueue(asyncio.Queue):
+    """
+    下载阶段的有界队列，元素为 (ArtworkJob, Image)。
+    每个作品的图片单独排队，出队时按作品轮流取一张，200 页的漫画不会挡住其他作品；
+    small_first 为 True 时总是先取估计下载量最小的图片，压缩阶段更早拿到任务。
+    """
+    def __init__(self, maxsize: int = 0, small_first: bool = DOWNLOAD_SMALL_FIRST):
+        self.small_first = small_first
+        super().__init__(maxsize)
+
+    def _init(self, maxsize: int) -> None:
+        self._queue: OrderedDict[int, list] = OrderedDict()  # 作品 ID → 该作品待下载的图片（堆）
+        self._size = 0
+        self._seq = 0
+
+    def qsize(self) -> int:
+        return self._size
+
+    def empty(self) -> bool:
+        return self._size == 0
+
+    def _put(self, item) -> None:
+        job, image = item
+        self._seq += 1
+        priority = estimate_size(job, image) if self.small_first else 0
+        heapq.heappush(self._queue.setdefault(job.artwork.id, []), (priority, self._seq, item))
+        self._size += 1
+
+    def _get(self):
+        if self.small_first:
+            artwork_id = min(self._queue, key=lambda key: self._queue[key][0][:2])
+        else:
+            artwork_id = next(iter(self._queue))
+        pending = self._queue.pop(artwork_id)
+        _, _, item = heapq.heappop(pending)
+        if pending:
+            # 排到队尾，下次轮到其他作品
+            self._queue[artwork_id] = pending
+        self._size -= 1
+        return item
@@ -0,0 +1,39 @@
+from typing import Optional
+import os
+import re
+
+from config.settings import *
+
+class DownloadError(Exception):
+    """下载失败或文件不完整，服务器返回错误状态时记录在 status 中"""
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+_CONTENT_RANGE = re.compile(r"bytes (\d+)-(\d+)/(\d+|\*)")
+
+def parse_expected_size(status: int, headers, offset: int) -> Optional[int]:
+    """根据 Content-Range / Content-Length 计算文件总大小"""
+    if status == 206:
+        match = _CONTENT_RANGE.match(headers.get("Content-Range", ""))
+        if not match or int(match.group(1)) != offset:
+            raise DownloadError(f"无效的 Content-Range: {headers.get('Content-Range')}")
+        if match.group(3) != "*":
+            return int(match.group(3))
+        return None
+    length = headers.get("Content-Length")
+    return int(length) if length is not None else None
+
+def finish_part_file(tmp_path: str, save_path: str, expected: Optional[int]) -> Optional[int]:
+    """校验临时文件大小并原子地重命名到目标路径，文件还不完整时返回 None"""
+    size = os.path.getsize(tmp_path)
+    if expected is not None and size < expected:
+        return None
+    if expected is not None and size != expected:
+        os.remove(tmp_path)
+        raise DownloadError(f"文件大小与 Content-Length 不一致: {size}/{expected} 字节")
+    if size == 0:
+        os.remove(tmp_path)
+        raise DownloadError("下载的文件为空")
+    os.replace(tmp_path, save_path)
+    return size
@@ -0,0 +1,239 @@
+from typing import Callable, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from urllib.parse import urlparse
+import functools
+import asyncio
+import time
+import os
+
+import aiohttp
+
+from config.settings import *
+from core.downloader import DownloadError, parse_expected_size, finish_part_file
+from core.ratelimit import get_limiter, parse_retry_after
+from core.retry import get_policy, host_of, needs_cookies, HTTPStatusError, ApiError, AuthRequiredError
+from core.cache import get_details_cache
+from core.download_scheduler import get_bandwidth
+import core.api as api
+
+class CrawlEngine:
+    """
+    基于 asyncio 的爬取引擎。
+    收藏分页、详情获取和图片下载都以协程运行，受一个全局并发预算和按主机的并发上限约束，
+    PIL、exiftool、MySQL 等阻塞操作交给线程池执行。
+    """
+    def __init__(self, max_concurrency: int = MAX_CONCURRENCY, host_limits: Optional[Dict[str, int]] = None,
+                 blocking_workers: int = MAX_WORKERS):
+        self.max_concurrency = max_concurrency
+        self.host_limits = host_limits or HOST_LIMITS
+        self.proxy = PROXIES.get('https') or PROXIES.get('http') if PROXIES else None
+        self.executor = ThreadPoolExecutor(max_workers=blocking_workers, thread_name_prefix="blocking")
+        # aria2 后端的下载会阻塞线程，单独使用一个线程池，大小与图片服务器的并发上限一致
+        self.download_executor = ThreadPoolExecutor(max_workers=self.host_limits.get("i.pximg.net", MAX_WORKERS),
+                                                    thread_name_prefix="download")
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.cookie_session: Optional[aiohttp.ClientSession] = None
+        self._global: Optional[asyncio.Semaphore] = None
+        self._hosts: Dict[str, asyncio.Semaphore] = {}
+        self._conn_stats = {"opened": 0, "reused": 0}
+        self.bandwidth = get_bandwidth()
+
+    async def __aenter__(self) -> "CrawlEngine":
+        self._global = asyncio.Semaphore(self.max_concurrency)
+        self._hosts = {host: asyncio.Semaphore(limit) for host, limit in self.host_limits.items()}
+
+        trace = aiohttp.TraceConfig()
+        trace.on_connection_create_end.append(self._on_connection_create)
+        trace.on_connection_reuseconn.append(self._on_connection_reuse)
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency, ttl_dns_cache=300)
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=30)
+        self.session = aiohttp.ClientSession(connector=connector, headers=HEADERS, timeout=timeout,
+                                             trace_configs=[trace])
+        self.cookie_session = aiohttp.ClientSession(connector=connector, connector_owner=False, headers=HEADERS,
+                                                    timeout=timeout, cookies=api.COOKIES, trace_configs=[trace])
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback) -> None:
+        await self.cookie_session.close()
+        await self.session.close()
+        self.download_executor.shutdown(wait=True)
+        self.executor.shutdown(wait=True)
+
+    async def _on_connection_create(self, session, context, params) -> None:
+        self._conn_stats["opened"] += 1
+
+    async def _on_connection_reuse(self, session, context, params) -> None:
+        self._conn_stats["reused"] += 1
+
+    def connection_stats(self) -> Dict[str, int]:
+        """统计新建连接数与复用连接数"""
+        return dict(self._conn_stats)
+
+    @asynccontextmanager
+    async def slot(self, url: str):
+        """占用一个全局并发名额和对应主机的并发名额"""
+        host_sem = self._hosts.get(urlparse(url).hostname)
+        # 先等主机名额再占全局名额，避免排队中的请求占着全局预算
+        if host_sem:
+            async with host_sem:
+                async with self._global:
+                    yield
+        else:
+            async with self._global:
+                yield
+
+    async def run_blocking(self, func: Callable, *args, **kwargs):
+        """在线程池中执行阻塞函数"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    @asynccontextmanager
+    async def request(self, session: aiohttp.ClientSession, url: str, family: Optional[str] = None, **kwargs):
+        """占用并发名额并经过限速器发送请求，响应状态和延迟反馈给限速器"""
+        limiter = get_limiter(family) if family else None
+        async with self.slot(url):
+            if limiter:
+                await limiter.acquire_async()
+            start = time.monotonic()
+            async with session.get(url, proxy=self.proxy, **kwargs) as response:
+                if limiter:
+                    limiter.feedback(response.status, time.monotonic() - start,
+                                     parse_retry_after(response.headers.get("Retry-After")))
+                yield response
+
+    async def get_json(self, url: str, use_cookies: bool = False, family: Optional[str] = None) -> dict:
+        """请求一次 Pixiv ajax 接口并返回 body，重试由调用方的重试策略负责"""
+        session = self.cookie_session if use_cookies else self.session
+        async with self.request(session, url, family) as response:
+            if response.status != 200:
+                raise HTTPStatusError(response.status, url)
+            data: dict = await response.json(content_type=None)
+        if data.get("error"):
+            raise ApiError(f"Error fetching {url}: {data.get('message', 'Unknown error')}")
+        body = data.get("body", {})
+        if isinstance(body, dict):
+            body.pop("ads", None)
+        return body
+
+    async def _get_details_json(self, url: str, use_cookies: bool = False) -> dict:
+        """请求一次作品详情，匿名请求到被屏蔽的作品时抛出 AuthRequiredError"""
+        body = await self.get_json(url, use_cookies=use_cookies, family="details")
+        if body.get("illust_details", {}).get("mask_reason") and not use_cookies:
+            raise AuthRequiredError("被屏蔽")
+        return body
+
+    async def get_bookmarks(self, user_id: str, offset: int = 0, limit: int = 100, lang: str = "zh") -> dict:
+        """获取用户的收藏夹信息"""
+        url = f"https://www.pixiv.net/ajax/user/{user_id}/illusts/bookmarks?tag=&rest=show&offset={offset}&limit={limit}&lang={lang}"
+        return await get_policy("api").run_async(self.get_json, url, use_cookies=True, family="bookmarks",
+                                                 host="www.pixiv.net", label=f"收藏夹 {user_id}")
+
+    async def get_illust_pages(self, illust_id: int, lang: str = "zh", use_cookies: bool = False) -> list:
+        """获取作品每一页的原图地址和尺寸，比作品详情接口轻得多"""
+        url = f"https://www.pixiv.net/ajax/illust/{illust_id}/pages?lang={lang}"
+        policy = get_policy("api")
+        try:
+            return await policy.run_async(self.get_json, url, use_cookies=use_cookies, family="pages",
+                                          host="www.pixiv.net", label=f"插画 {illust_id} 分页")
+        except Exception as e:
+            if not needs_cookies(e, use_cookies):
+                raise
+            logger.warning(f"插画 {illust_id} 的分页需要登录，尝试使用 cookies 重新获取")
+            return await policy.run_async(self.get_json, url, use_cookies=True, family="pages",
+                                          host="www.pixiv.net", label=f"插画 {illust_id} 分页")
+
+    async def get_illust_details(self, illust_id: int, lang: str = "zh", use_cookies: bool = False,
+                                 use_cache: bool = True) -> dict:
+        """
+        获取插画的详细信息，匿名请求的结果会写入本地缓存；需要 cookies 的屏蔽作品不走缓存。
+        被屏蔽或需要登录的作品匿名请求后改用 cookies 请求一次，作品不存在等错误不重试。
+        """
+        cache = get_details_cache() if use_cache and not use_cookies else None
+        if cache:
+            body = await self.run_blocking(cache.get, illust_id, lang)
+            if body is not None:
+                return body
+        url = f"https://www.pixiv.net/touch/ajax/illust/details?illust_id={illust_id}&lang={lang}"
+        policy = get_policy("api")
+        try:
+            body = await policy.run_async(self._get_details_json, url, use_cookies=use_cookies,
+                                          host="www.pixiv.net", label=f"插画 {illust_id}")
+        except Exception as e:
+            if not needs_cookies(e, use_cookies):
+                raise
+            logger.warning(f"插画 {illust_id} {e}，尝试使用 cookies 重新获取")
+            return await policy.run_async(self._get_details_json, url, use_cookies=True,
+                                          host="www.pixiv.net", label=f"插画 {illust_id}")
+        if cache:
+            await self.run_blocking(cache.put, illust_id, lang, body)
+        return body
+
+    async def download(self, url: str, save_path: str, use_cookies: bool = False,
+                       buffer: Optional[bytearray] = None) -> None:
+        """
+        下载图片。stream 后端直接以协程下载并按下载重试策略重试，aria2 后端在下载线程池中执行。
+        传入 buffer 时 stream 后端会把完整内容同时保留在内存中，续传或其他后端下载时 buffer 不完整，调用方应改为读取文件。
+        """
+        if DOWNLOADER != "stream":
+            async with self.slot(url):
+                loop = asyncio.get_running_loop()
+                await loop.run_in_executor(self.download_executor, api.download_image, url, save_path, use_cookies)
+            # aria2 自行限速，这里只统计流量
+            self.bandwidth.record(os.path.getsize(save_path))
+            return
+        await get_policy("download").run_async(self.stream_download, url, save_path, use_cookies, buffer=buffer,
+                                               host=host_of(url), label=url)
+
+    async def stream_download(self, url: str, save_path: str, use_cookies: bool = False, max_resumes: int = 5,
+                              buffer: Optional[bytearray] = None) -> int:
+        """
+        在进程内流式下载文件，返回文件大小：分块写入临时文件、Range 续传、校验 Content-Length 后原子地重命名。
+        没有收到任何数据的失败直接抛出，由下载重试策略退避后重试。
+        """
+        session = self.cookie_session if use_cookies else self.session
+        tmp_path = save_path + ".part"
+        os.makedirs(os.path.dirname(save_path) or ".", exist_ok=True)
+        expected = None
+        resumes = 0
+        while True:
+            offset = os.path.getsize(tmp_path) if os.path.exists(tmp_path) else 0
+            headers = {"Range": f"bytes={offset}-"} if offset else {}
+            received = 0
+            try:
+                async with self.request(session, url, "image", headers=headers) as response:
+                    if response.status == 416:
+                        os.remove(tmp_path)
+                        continue
+                    if response.status not in (200, 206):
+                        raise DownloadError(f"下载失败，状态码: {response.status}", response.status)
+                    if response.status == 200:
+                        offset = 0
+                    expected = parse_expected_size(response.status, response.headers, offset) or expected
+                    if buffer is not None:
+                        buffer.clear()
+                        if offset:
+                            # 续传时内存中没有前面的数据，不再保留
+                            buffer = None
+                    with open(tmp_path, "ab" if offset else "wb") as f:
+                        async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                            await self.run_blocking(f.write, chunk)
+                            received += len(chunk)
+                            await self.bandwidth.acquire_async(len(chunk))
+                            if buffer is not None:
+                                buffer.extend(chunk)
+            except (aiohttp.ClientPayloadError, aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                if not received:
+                    raise
+                resumes += 1
+                if resumes > max_resumes:
+                    raise DownloadError(f"连接多次中断，放弃续传：{e}")
+                logger.warning(f"[{url}] 连接中断，从 {os.path.getsize(tmp_path)} 字节处续传：{e}")
+                continue
+
+            size = finish_part_file(tmp_path, save_path, expected)
+            if size is not None:
+                return size
+            resumes += 1
+            if not received or resumes > max_resumes:
+                raise DownloadError(f"文件不完整: {os.path.getsize(tmp_path)}/{expected} 字节")
@@ -0,0 +1,44 @@
+from typing import Iterable, Iterator, Optional
+
+import numpy as np
+from PIL import Image as PILImage
+
+from config.settings import *
+
+def composite_frame(frame: np.ndarray, background: PILImage.Image) -> PILImage.Image:
+    """
+    把 RGBA 帧合成到背景上。完全不透明的帧合成后不变，直接使用（ugoira 常见的 JPEG 帧都是这种情况）；
+    含透明像素的帧交给 PIL.Image.alpha_composite，它的 C 实现比等价的 NumPy 运算更快。
+    """
+    image = PILImage.fromarray(frame)
+    if frame[..., 3].min() == 255:
+        return image
+    return PILImage.alpha_composite(background, image)
+
+def frame_difference(a: np.ndarray, b: np.ndarray) -> int:
+    """两帧逐通道差值的最大值（0~255），尺寸不同时返回 255"""
+    if a.shape != b.shape:
+        return 255
+    # 用 uint8 的 max - min 代替转换为 int16 后取绝对值，不分配更宽的临时数组
+    return int((np.maximum(a, b) - np.minimum(a, b)).max())
+
+def iter_encoder_frames(frames: Iterable[np.ndarray],
+                        threshold: float = FRAME_DIFF_THRESHOLD) -> Iterator[PILImage.Image]:
+    """
+    把每帧合成到第一帧上，逐帧产生交给编码器的图像，每帧只解码和比较一次。
+    与上一个保留的帧相同或几乎相同的帧（任意像素任意通道的差值都不超过 threshold，用于吸收 JPEG 重新编码带来的细微噪声）
+    不再合成，直接重复上一个输出图像；libwebp 的动画编码器会把完全相同的连续帧合并为一帧并累加持续时间，
+    因此不需要预先统计合并后的帧数。threshold 为 0 时只合并完全相同的帧。
+    每帧与上一个保留的帧比较（而不是紧邻的前一帧），缓慢渐变不会因为累积误差被整段合并。
+    """
+    background: Optional[PILImage.Image] = None
+    last: Optional[np.ndarray] = None
+    last_image: Optional[PILImage.Image] = None
+    for frame in frames:
+        if last is not None and (frame_difference(frame, last) <= threshold if threshold > 0 else np.array_equal(frame, last)):
+            yield last_image
+            continue
+        if background is None:
+            background = PILImage.fromarray(frame)
+        last, last_image = frame, composite_frame(frame, background)
+        yield last_image
@@ -0,0 +1,157 @@
+from typing import Iterable, Optional
+import threading
+import sqlite3
+import json
+import time
+import os
+
+from config.settings import *
+from core.codec import pack_payload, unpack_payload
+
+# 作品和图片依次经过的阶段。压缩时已写入 XMP 标签，压缩和标记是同一步，完成后即为 tagged
+STAGES = ("queued", "fetched", "downloaded", "tagged", "committed")
+STAGE_INDEX = {stage: index for index, stage in enumerate(STAGES)}
+
+class Journal:
+    """
+    同步任务日志，保存在本地 SQLite 中，每次状态变化立即写入，进程崩溃后不丢失。
+    记录每个作品的收藏信息和详情，以及每张图片的下载、压缩路径，
+    恢复时已获取详情的作品不再请求接口，已下载、已压缩的图片不再重复处理。
+    """
+    def __init__(self, path: str = JOURNAL_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS journal_artworks ("
+            "artwork_id INTEGER PRIMARY KEY, bookmark TEXT NOT NULL, codec TEXT, details BLOB, status TEXT, updated_at REAL)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS journal_images ("
+            "image_id TEXT PRIMARY KEY, artwork_id INTEGER, status TEXT, original_path TEXT, compressed_path TEXT, "
+            "updated_at REAL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_journal_images_artwork ON journal_images(artwork_id)")
+        self._lock = threading.Lock()
+        self.details_reused = 0
+
+    def add_bookmarks(self, bookmarks: Iterable[dict]) -> None:
+        """登记待处理的收藏，保存完整的收藏信息供恢复时使用；已登记的作品只更新收藏信息，保留原有进度"""
+        now = time.time()
+        rows = [(int(bookmark["id"]), json.dumps(bookmark, ensure_ascii=False), "queued", now) for bookmark in bookmarks]
+        with self._lock:
+            self.conn.executemany(
+                "INSERT INTO journal_artworks (artwork_id, bookmark, status, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(artwork_id) DO UPDATE SET bookmark = excluded.bookmark",
+                rows
+            )
+
+    def get_details(self, artwork_id: int) -> Optional[dict]:
+        """已获取过的作品详情，没有时返回 None"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT codec, details FROM journal_artworks WHERE artwork_id = ? AND details IS NOT NULL", (artwork_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            self.details_reused += 1
+        return unpack_payload(row[0], row[1])
+
+    def mark_fetched(self, artwork_id: int, details: dict, image_ids: Iterable) -> None:
+        """保存详情并登记作品的所有图片，作品须已由 add_bookmarks 登记"""
+        codec, _, _, blob = pack_payload(details)
+        now = time.time()
+        with self._lock:
+            self.conn.execute("BEGIN")
+            self.conn.execute(
+                "UPDATE journal_artworks SET codec = ?, details = ?, status = ?, updated_at = ? WHERE artwork_id = ?",
+                (codec, blob, "fetched", now, artwork_id)
+            )
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO journal_images (image_id, artwork_id, status, updated_at) VALUES (?, ?, ?, ?)",
+                [(str(image_id), artwork_id, "fetched", now) for image_id in image_ids]
+            )
+            self.conn.execute("COMMIT")
+
+    def image_state(self, image_id) -> Optional[tuple[str, str, str]]:
+        """返回图片的 (阶段, 原图路径, 压缩后路径)"""
+        with self._lock:
+            return self.conn.execute(
+                "SELECT status, original_path, compressed_path FROM journal_images WHERE image_id = ?", (str(image_id),)
+            ).fetchone()
+
+    def mark_image(self, image_id, artwork_id: int, status: str, original_path: Optional[str] = None,
+                   compressed_path: Optional[str] = None) -> None:
+        """更新图片的阶段，作品的阶段取其所有图片中最靠前的阶段"""
+        now = time.time()
+        with self._lock:
+            self.conn.execute("BEGIN")
+            self.conn.execute(
+                "UPDATE journal_images SET status = ?, original_path = COALESCE(?, original_path), "
+                "compressed_path = COALESCE(?, compressed_path), updated_at = ? WHERE image_id = ?",
+                (status, original_path, compressed_path, now, str(image_id))
+            )
+            statuses = [row[0] for row in self.conn.execute(
+                "SELECT status FROM journal_images WHERE artwork_id = ?", (artwork_id,))]
+            artwork_status = min(statuses, key=STAGE_INDEX.__getitem__) if statuses else status
+            self.conn.execute(
+                "UPDATE journal_artworks SET status = ?, updated_at = ? WHERE artwork_id = ? AND status != 'committed'",
+                (artwork_status, now, artwork_id)
+            )
+            self.conn.execute("COMMIT")
+
+    def mark_committed(self, artwork_ids: Iterable[int]) -> None:
+        """数据库写入成功后调用"""
+        now = time.time()
+        ids = [(now, int(artwork_id)) for artwork_id in artwork_ids]
+        with self._lock:
+            self.conn.execute("BEGIN")
+            self.conn.executemany("UPDATE journal_artworks SET status = 'committed', updated_at = ? WHERE artwork_id = ?", ids)
+            self.conn.executemany(
+                "UPDATE journal_images SET status = 'committed', updated_at = ? WHERE artwork_id = ?", ids
+            )
+            self.conn.execute("COMMIT")
+
+    def unfinished(self) -> list[dict]:
+        """所有未写入数据库的作品登记时保存的收藏信息"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT bookmark FROM journal_artworks WHERE status != 'committed' AND bookmark IS NOT NULL "
+                "ORDER BY artwork_id"
+            ).fetchall()
+        return [json.loads(bookmark) for (bookmark,) in rows]
+
+    def purge_committed(self) -> int:
+        """删除已完成的记录，返回删除的作品数"""
+        with self._lock:
+            self.conn.execute("BEGIN")
+            self.conn.execute(
+                "DELETE FROM journal_images WHERE artwork_id IN "
+                "(SELECT artwork_id FROM journal_artworks WHERE status = 'committed')"
+            )
+            count = self.conn.execute("DELETE FROM journal_artworks WHERE status = 'committed'").rowcount
+            self.conn.execute("COMMIT")
+            return count
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = dict(self.conn.execute("SELECT status, COUNT(*) FROM journal_artworks GROUP BY status").fetchall())
+        unfinished = sum(count for status, count in counts.items() if status != "committed")
+        return {"details_reused": self.details_reused, "unfinished": unfinished, "committed": counts.get("committed", 0)}
+
+    def close(self) -> None:
+        self.conn.close()
+
+_journal: Optional[Journal] = None
+_journal_lock = threading.Lock()
+
+def get_journal() -> Optional[Journal]:
+    """获取全局共享的任务日志，未启用时返回 None"""
+    global _journal
+    if not JOURNAL_ENABLED:
+        return None
+    with _journal_lock:
+        if _journal is None:
+            _journal = Journal()
+        return _journal
@@ -0,0 +1,103 @@
+from typing import Optional
+import threading
+import sqlite3
+import time
+import os
+
+from config.settings import *
+
+class OutputManifest:
+    """
+    输出清单：按图片 ID 记录原图的路径、大小、修改时间和哈希，以及 WebP 的路径、大小、修改时间和编码参数。
+    重新运行时用 stat 与清单比较，原图完整就跳过下载，原图未变化且 WebP 与当前编码参数一致就跳过压缩，不需要读取文件内容。
+    """
+    def __init__(self, path: str = MANIFEST_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS manifest ("
+            "image_id TEXT PRIMARY KEY, original_path TEXT, original_size INTEGER, original_mtime INTEGER, "
+            "original_hash TEXT, compressed_path TEXT, compressed_size INTEGER, compressed_mtime INTEGER, "
+            "encoder TEXT, updated_at REAL)"
+        )
+        self._lock = threading.Lock()
+        self.skipped_downloads = 0
+        self.skipped_encodes = 0
+
+    @staticmethod
+    def _stat(path: str) -> Optional[os.stat_result]:
+        try:
+            return os.stat(path)
+        except OSError:
+            return None
+
+    def _get(self, image_id, columns: str) -> Optional[tuple]:
+        with self._lock:
+            return self.conn.execute(f"SELECT {columns} FROM manifest WHERE image_id = ?", (str(image_id),)).fetchone()
+
+    def original_ok(self, image_id, path: str) -> bool:
+        """原图存在且大小、修改时间与清单记录一致"""
+        row = self._get(image_id, "original_path, original_size, original_mtime")
+        if row is None or row[0] != path:
+            return False
+        st = self._stat(path)
+        if st is None or st.st_size != row[1] or st.st_mtime_ns != row[2]:
+            return False
+        with self._lock:
+            self.skipped_downloads += 1
+        return True
+
+    def compressed_ok(self, image_id, original_path: str, path: str, encoder: str) -> bool:
+        """
+        WebP 存在、大小和修改时间与清单记录一致，并且是用相同的编码参数、从当前的原图生成的。
+        原图重新下载或被修改后大小或修改时间会变化，此时需要重新编码。
+        """
+        row = self._get(image_id, "compressed_path, compressed_size, compressed_mtime, encoder, "
+                                  "original_path, original_size, original_mtime")
+        if row is None or row[0] != path or row[3] != encoder or row[4] != original_path:
+            return False
+        st = self._stat(path)
+        if st is None or st.st_size != row[1] or st.st_mtime_ns != row[2]:
+            return False
+        original = self._stat(original_path)
+        if original is None or original.st_size != row[5] or original.st_mtime_ns != row[6]:
+            return False
+        with self._lock:
+            self.skipped_encodes += 1
+        return True
+
+    def record(self, image_id, original_path: str, original_hash: str, compressed_path: str, encoder: str) -> None:
+        """压缩完成后记录原图和 WebP 的当前状态"""
+        original = self._stat(original_path)
+        compressed = self._stat(compressed_path)
+        if original is None or compressed is None:
+            return
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO manifest (image_id, original_path, original_size, original_mtime, original_hash, "
+                "compressed_path, compressed_size, compressed_mtime, encoder, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (str(image_id), original_path, original.st_size, original.st_mtime_ns, original_hash,
+                 compressed_path, compressed.st_size, compressed.st_mtime_ns, encoder, time.time())
+            )
+
+    def stats(self) -> dict:
+        return {"skipped_downloads": self.skipped_downloads, "skipped_encodes": self.skipped_encodes}
+
+    def close(self) -> None:
+        self.conn.close()
+
+_manifest: Optional[OutputManifest] = None
+_manifest_lock = threading.Lock()
+
+def get_manifest() -> Optional[OutputManifest]:
+    """获取全局共享的输出清单，未启用时返回 None"""
+    global _manifest
+    if not MANIFEST_ENABLED:
+        return None
+    with _manifest_lock:
+        if _manifest is None:
+            _manifest = OutputManifest()
+        return _manifest
@@ -1,6 +1,8 @@
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, fields
 from datetime import datetime
 from enum import IntEnum
+import threading
+import sys
 
 class ArtworkType(IntEnum):
     ILLUST = 0
@@ -77,4 +79,103 @@ class Image:
     ext: str
     original_path: str = ""
     compressed_path: str = ""
-    is_deleted: bool = False
\ No newline at end of file
+    is_deleted: bool = False
+
+# 以下为 __slots__ 版本的模型，字段与上面的模型一致，可以直接用同一套编解码器读写数据库。
+# 大量作品常驻内存时（如全库遍历、比对）使用，单个实例没有 __dict__，标签在进程内共享。
+
+@dataclass(frozen=True, slots=True)
+class CompactTag:
+    tag: str
+    translation: str
+    display_tag: str = ""
+
+_TAG_TABLE: dict[tuple[str, str], CompactTag] = {}
+_tag_table_lock = threading.Lock()
+
+def intern_tag(tag: str, translation: str = None) -> CompactTag:
+    """返回进程内唯一的标签对象，相同的 (标签, 翻译) 只创建一次"""
+    if translation is None:
+        translation = tag
+    key = (tag, translation)
+    cached = _TAG_TABLE.get(key)
+    if cached is not None:
+        return cached
+    with _tag_table_lock:
+        cached = _TAG_TABLE.get(key)
+        if cached is None:
+            tag, translation = sys.intern(tag), sys.intern(translation)
+            display_tag = f"{tag}({translation})" if tag != translation else tag
+            cached = _TAG_TABLE[key] = CompactTag(tag, translation, display_tag)
+        return cached
+
+def interned_tag_count() -> int:
+    return len(_TAG_TABLE)
+
+def _to_compact_tag(tag) -> CompactTag:
+    if isinstance(tag, CompactTag):
+        return tag
+    if isinstance(tag, dict):
+        return intern_tag(tag.get("tag", ""), tag.get("translation"))
+    return intern_tag(tag.tag, tag.translation)
+
+@dataclass(slots=True)
+class CompactArtwork:
+    id: int
+    title: str = None
+    comment: str = None
+    pageCount: int = None
+    user_id: int = None
+    user_name: str = None
+    type: ArtworkType = ArtworkType.ILLUST
+    restrict: ArtworkRestrict = ArtworkRestrict.NORMAL
+    aiType: int = None
+    timestamp: datetime = None
+    width: int = None
+    height: int = None
+    tags: list[CompactTag] = field(default_factory=list)
+    ugoiraInfo: dict = field(default_factory=dict)
+    data: dict = field(default_factory=dict)
+    is_deleted: bool = False
+
+    def __post_init__(self):
+        if self.tags:
+            self.tags = [_to_compact_tag(tag) for tag in self.tags]
+        if not isinstance(self.type, ArtworkType):
+            self.type = ArtworkType(self.type)
+        if not isinstance(self.restrict, ArtworkRestrict):
+            self.restrict = ArtworkRestrict(self.restrict)
+        if self.user_name:
+            self.user_name = sys.intern(self.user_name)
+
+    @classmethod
+    def from_artwork(cls, artwork: Artwork) -> "CompactArtwork":
+        return cls(**{f.name: getattr(artwork, f.name) for f in fields(Artwork)})
+
+    def to_artwork(self) -> Artwork:
+        values = {f.name: getattr(self, f.name) for f in fields(self)}
+        values["tags"] = [Tag(tag.tag, tag.translation) for tag in self.tags]
+        return Artwork(**values)
+
+    def __str__(self):
+        return "\n".join([f.name + ": " + str(getattr(self, f.name)) for f in fields(self)]) + "\n" + "-" * 40
+
+@dataclass(slots=True)
+class CompactImage:
+    id: str
+    idNum: int
+    index: int
+    url: str
+    width: int
+    height: int
+    ext: str
+    original_path: str = ""
+    compressed_path: str = ""
+    is_deleted: bool = False
+
+    @classmethod
+    def from_image(cls, image: Image) -> "CompactImage":
+        return cls(**{f.name: getattr(image, f.name) for f in fields(Image)})
+
+    def to_image(self) -> Image:
+        return Image(**{f.name: getattr(self, f.name) for f in fields(self)})
@@ -0,0 +1,152 @@
+from datetime import datetime
+
+from core.models import Artwork, Tag, ArtworkType, ArtworkRestrict, Image
+
+def get_type_dir(artwork_type: ArtworkType) -> str:
+    """根据作品类型获取保存目录名"""
+    if artwork_type == ArtworkType.ILLUST:
+        return "Illustration"
+    elif artwork_type == ArtworkType.MANGA:
+        return "Manga"
+    elif artwork_type == ArtworkType.UGOIRA:
+        return "Ugoira"
+    else:
+        raise ValueError(f"未知的插画类型: {artwork_type}")
+
+def make_save_name(image: Image, artwork: Artwork) -> str:
+    """生成图片保存文件名，去除文件名中的非法字符"""
+    save_name = f"{image.idNum}_p{str(image.index).zfill(3)} - {artwork.title} - {artwork.user_name}.{image.ext}"
+    for char in ("<", ">", ":", "\"", "/", "\\", "|", "?", "*", "\b"):
+        save_name = save_name.replace(char, "")
+    return save_name
+
+def parse_artwork(artwork_id: int, details: dict) -> tuple[Artwork, list[Image], bool]:
+    """根据作品详情构建作品与图片信息，返回 (作品, 图片列表, 是否需要 cookies)"""
+    images: list[Image] = []
+    illust_details: dict = details.get("illust_details", {})
+    author_details: dict = details.get("author_details", {})
+    manga_a: list = illust_details.get("manga_a", [])
+    illust_images: list = illust_details.get("illust_images", [])
+    display_tags = illust_details.get("display_tags", [])
+    tags: list[Tag] = []
+    use_cookies = True if illust_details.get("mask_reason") else False
+
+    for tag in display_tags:
+        tags.append(Tag(
+            tag=tag.get("tag", ""),
+            translation=tag.get("translation", tag.get("tag", "")),
+        ))
+
+    artwork = Artwork(
+        id=int(artwork_id),
+        title=illust_details.get("title", ""),
+        comment=illust_details.get("comment_html", ""),
+        pageCount=int(illust_details.get("page_count", 0)),
+        user_id=int(author_details.get("user_id", 0)),
+        user_name=author_details.get("user_name", ""),
+        type=ArtworkType(int(illust_details.get("type", ArtworkType.ILLUST))),
+        restrict=ArtworkRestrict(int(illust_details.get("x_restrict", ArtworkRestrict.NORMAL))),
+        aiType=int(illust_details.get("ai_type")),
+        timestamp=datetime.fromtimestamp(illust_details.get("upload_timestamp")),
+        width=int(illust_details.get("width")),
+        height=int(illust_details.get("height")),
+        tags=tags,
+        ugoiraInfo=illust_details.get("ugoira_meta", {}),
+        data=details,
+    )
+
+    # 准备图片信息
+    if artwork.type in [ArtworkType.ILLUST, ArtworkType.MANGA]:
+        if artwork.pageCount == 1:
+            image_url = illust_details.get("url_big", "")
+            images.append(Image(
+                id=f"{artwork.id}_p0",
+                idNum=artwork.id,
+                index=0,
+                url=image_url,
+                height=artwork.height,
+                width=artwork.width,
+                ext=image_url.split(".")[-1].lower(),
+            ))
+        else:
+            for manga, illust_image in zip(manga_a, illust_images):
+                image_url = manga.get("url_big", "")
+                images.append(Image(
+                    id=f"{artwork.id}_p{manga['page']}",
+                    idNum=artwork.id,
+                    index=manga["page"],
+                    url=image_url,
+                    height=illust_image.get("illust_image_width", 0),
+                    width=illust_image.get("illust_image_height", 0),
+                    ext=image_url.split(".")[-1].lower()
+                ))
+    elif artwork.type == ArtworkType.UGOIRA:
+        ugoira_info = artwork.ugoiraInfo
+        if ugoira_info:
+            images.append(Image(
+                id=artwork.id,
+                idNum=artwork.id,
+                index=0,
+                url=ugoira_info.get("src", ""),
+                height=artwork.height,
+                width=artwork.width,
+                ext="zip"
+            ))
+
+    return artwork, images, use_cookies
+
+# 收藏列表中构建作品必需的字段
+LISTING_FIELDS = ("title", "illustType", "userId", "userName", "pageCount", "width", "height", "createDate", "tags")
+
+def listing_is_sufficient(work: dict, require_comment: bool = False) -> bool:
+    """
+    收藏列表中的条目能否代替作品详情：动图需要详情中的 ugoira_meta，被屏蔽的作品需要带 cookies 获取详情，
+    列表中没有简介，需要简介时也只能获取详情。
+    """
+    if require_comment or work.get("isMasked"):
+        return False
+    if int(work.get("illustType", ArtworkType.ILLUST)) == ArtworkType.UGOIRA:
+        return False
+    return all(work.get(key) not in (None, "") for key in LISTING_FIELDS)
+
+def parse_listing_artwork(artwork_id: int, work: dict, pages: list) -> tuple[Artwork, list[Image], bool]:
+    """
+    根据收藏列表中的条目和 /ajax/illust/{id}/pages 的结果构建作品与图片信息。
+    列表中的标签没有翻译，简介为空。
+    """
+    artwork = Artwork(
+        id=int(artwork_id),
+        title=work.get("title", ""),
+        comment=work.get("description", ""),
+        pageCount=int(work.get("pageCount", 0)),
+        user_id=int(work.get("userId", 0)),
+        user_name=work.get("userName", ""),
+        type=ArtworkType(int(work.get("illustType", ArtworkType.ILLUST))),
+        restrict=ArtworkRestrict(int(work.get("xRestrict", ArtworkRestrict.NORMAL))),
+        aiType=int(work.get("aiType", 0)),
+        # 与详情中的 upload_timestamp 一样转换为本地时间
+        timestamp=datetime.fromtimestamp(datetime.fromisoformat(work["createDate"]).timestamp()),
+        width=int(work.get("width")),
+        height=int(work.get("height")),
+        tags=[Tag(tag=tag, translation=tag) for tag in work.get("tags", [])],
+        data={"listing": work, "pages": pages},
+    )
+    images = []
+    for index, page in enumerate(pages):
+        image_url = page.get("urls", {}).get("original", "")
+        images.append(Image(
+            id=f"{artwork.id}_p{index}",
+            idNum=artwork.id,
+            index=index,
+            url=image_url,
+            height=page.get("height", 0),
+            width=page.get("width", 0),
+            ext=image_url.split(".")[-1].lower(),
+        ))
+    return artwork, images, False
+
+def parse_metadata(artwork_id: int, data: dict) -> tuple[Artwork, list[Image], bool]:
+    """按数据来源（作品详情或收藏列表加分页信息）构建作品与图片信息"""
+    if "listing" in data:
+        return parse_listing_artwork(artwork_id, data["listing"], data.get("pages", []))
+    return parse_artwork(artwork_id, data)
@@ -0,0 +1,299 @@
+from typing import Iterable, Optional
+from dataclasses import dataclass, field
+import asyncio
+import os
+
+from tqdm import tqdm
+
+from config.settings import *
+from core.engine import CrawlEngine
+from core.models import Artwork, ArtworkType, Image
+from core.parser import parse_metadata, listing_is_sufficient, get_type_dir, make_save_name
+from core.compressor import CompressStage, CompressJob, encoder_settings
+from core.manifest import OutputManifest, get_manifest
+from core.journal import Journal, STAGE_INDEX, get_journal
+from core.xmp import build_xmp, build_exif
+from core.download_scheduler import FairDownloadQueue
+import core.database as db
+
+@dataclass
+class ArtworkJob:
+    """一个作品在流水线中的处理状态"""
+    artwork: Artwork
+    images: list[Image]
+    use_cookies: bool
+    remaining: int = 0
+    done: list[Image] = field(default_factory=list)
+    failed: bool = False
+    zip_buffers: dict[str, bytes] = field(default_factory=dict)  # 动图压缩包下载后保留在内存中，压缩时直接读取
+
+class Pipeline:
+    """
+    无屏障的流式流水线：获取详情 → 下载 → 压缩（同时写入 XMP 标签）→ 入库。
+    各阶段之间用有界队列连接，作品详情一到就开始下载，下载完成就开始压缩，
+    内存峰值由队列长度决定，而不是新收藏的数量。
+    每个作品和图片的进度写入任务日志，中断后重新运行时已完成的步骤直接跳过。
+    """
+    def __init__(self, engine: CrawlEngine, queue_size: int = PIPELINE_QUEUE_SIZE,
+                 fetch_workers: Optional[int] = None, download_workers: Optional[int] = None,
+                 compressor: Optional[CompressStage] = None, writer: Optional[db.BatchWriter] = None,
+                 manifest: Optional[OutputManifest] = None, journal: Optional[Journal] = None,
+                 metadata_mode: str = METADATA_MODE):
+        self.engine = engine
+        self.fetch_workers = fetch_workers or engine.host_limits.get("www.pixiv.net", MAX_WORKERS)
+        self.download_workers = download_workers or engine.host_limits.get("i.pximg.net", MAX_WORKERS)
+        self.compressor = compressor
+        self.writer = writer
+        self.manifest = manifest or get_manifest()
+        self.journal = journal or get_journal()
+        self.fetch_queue: asyncio.Queue[dict] = asyncio.Queue(queue_size)
+        # 按作品轮流（或小图优先）出队，大作品不会独占下载
+        self.download_queue: FairDownloadQueue = FairDownloadQueue(queue_size)
+        self.compress_queue: asyncio.Queue[tuple[ArtworkJob, Image]] = asyncio.Queue(queue_size)
+        self.commit_queue: asyncio.Queue[ArtworkJob] = asyncio.Queue(queue_size)
+        self.metadata_mode = metadata_mode
+        self.stats = {"artworks": 0, "failed_artworks": 0, "images": 0, "failed_images": 0,
+                      "details_calls": 0, "pages_calls": 0, "listing_artworks": 0}
+        self.pbar: Optional[tqdm] = None
+        self.images_total = 0
+        self.images_finished = 0
+
+    async def run(self, bookmarks: Iterable[dict]) -> dict:
+        """处理收藏列表中的所有作品，返回统计信息"""
+        owns_compressor = self.compressor is None
+        if owns_compressor:
+            self.compressor = CompressStage()
+        owns_writer = self.writer is None
+        if owns_writer:
+            self.writer = db.BatchWriter()
+        if self.journal and self.writer.on_flush is None:
+            # 作品只有在数据库事务提交后才算完成
+            self.writer.on_flush = self.journal.mark_committed
+        bookmarks = list(bookmarks)
+        if self.journal:
+            await self.engine.run_blocking(self.journal.add_bookmarks, bookmarks)
+
+        stages = [
+            (self.fetch_queue, self._fetch, self.fetch_workers),
+            (self.download_queue, self._download, self.download_workers),
+            # 每个压缩进程保持两个任务在排队，进程池不会空转
+            (self.compress_queue, self._compress, self.compressor.workers * 2),
+            (self.commit_queue, self._commit, 1),
+        ]
+        tasks = [
+            asyncio.create_task(self._worker(queue, handler))
+            for queue, handler, count in stages
+            for _ in range(count)
+        ]
+        try:
+            # 进度条显示实时下载吞吐量，图片进度显示在右侧
+            with tqdm(desc="下载", unit="B", unit_scale=True, unit_divisor=1024) as self.pbar:
+                self.engine.bandwidth.on_bytes = self.pbar.update
+                for bookmark in bookmarks:
+                    await self.fetch_queue.put(bookmark)
+                # 上游队列清空后下游才可能收到最后一批任务，依次等待各阶段完成
+                for queue, _, _ in stages:
+                    await queue.join()
+        finally:
+            self.engine.bandwidth.on_bytes = None
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.compressor.log_report()
+            if owns_compressor:
+                self.compressor.close()
+            if owns_writer:
+                await self.engine.run_blocking(self.writer.close)
+            if self.metadata_mode == "listing":
+                logger.info(f"元数据: 详情请求 {self.stats['details_calls']} 次，分页请求 {self.stats['pages_calls']} 次，"
+                            f"省去详情请求 {self.stats['listing_artworks']} 次")
+            writer_stats = self.writer.stats()
+            logger.info(f"数据库批量写入: {writer_stats['rows']} 行，{writer_stats['flushes']} 次提交，"
+                        f"原始数据未变化跳过 {writer_stats['payloads_skipped']} 行"
+                        + (f"，写入失败丢弃 {writer_stats['dropped']} 行" if writer_stats['dropped'] else ""))
+            if self.manifest:
+                manifest_stats = self.manifest.stats()
+                logger.info(f"输出清单: 跳过下载 {manifest_stats['skipped_downloads']} 张，"
+                            f"跳过压缩 {manifest_stats['skipped_encodes']} 张")
+            if self.journal:
+                journal_stats = await self.engine.run_blocking(self.journal.stats)
+                logger.info(f"任务日志: 复用已获取的详情 {journal_stats['details_reused']} 个，"
+                            f"未完成的作品 {journal_stats['unfinished']} 个")
+        return self.stats
+
+    async def _worker(self, queue: asyncio.Queue, handler) -> None:
+        while True:
+            item = await queue.get()
+            try:
+                await handler(item)
+            except Exception as e:
+                logger.error(f"流水线处理 {item} 时出错: {e}", exc_info=True)
+            finally:
+                queue.task_done()
+
+    async def _fetch(self, bookmark: dict) -> None:
+        """获取详情并把作品的每张图片送入下载队列"""
+        artwork_id = int(bookmark["id"])
+        try:
+            if not bookmark['userId']:
+                await self._mark_deleted(artwork_id)
+                return
+            details = await self.engine.run_blocking(self.journal.get_details, artwork_id) if self.journal else None
+            fetched = details is None
+            if fetched:
+                details = await self._fetch_metadata(bookmark)
+            artwork, images, use_cookies = parse_metadata(artwork_id, details)
+            if fetched and "listing" in details:
+                # 只统计确实没有请求详情就构建出来的作品
+                self.stats["listing_artworks"] += 1
+            if self.journal and fetched:
+                await self.engine.run_blocking(self.journal.mark_fetched, artwork_id, details,
+                                               [image.id for image in images])
+        except Exception as e:
+            logger.error(f"获取插画 {artwork_id} 详情失败: {e}", exc_info=True)
+            self.stats["failed_artworks"] += 1
+            return
+
+        job = ArtworkJob(artwork, images, use_cookies, remaining=len(images))
+        if not images:
+            await self.commit_queue.put(job)
+            return
+        self.images_total += len(images)
+        self._show_progress()
+        for image in images:
+            await self.download_queue.put((job, image))
+
+    async def _fetch_metadata(self, bookmark: dict) -> dict:
+        """
+        listing 模式下收藏列表中的信息足够时，只请求分页接口获取原图地址；
+        动图、被屏蔽的作品和需要简介时仍获取完整详情。
+        """
+        artwork_id = int(bookmark["id"])
+        if self.metadata_mode == "listing" and listing_is_sufficient(bookmark, METADATA_REQUIRE_COMMENT):
+            # R-18 作品的分页信息需要登录
+            use_cookies = int(bookmark.get("xRestrict", 0)) > 0
+            pages = await self.engine.get_illust_pages(artwork_id, lang="zh", use_cookies=use_cookies)
+            self.stats["pages_calls"] += 1
+            return {"listing": bookmark, "pages": pages}
+        self.stats["details_calls"] += 1
+        return await self.engine.get_illust_details(artwork_id, lang="zh")
+
+    async def _mark_deleted(self, artwork_id: int) -> None:
+        local_artwork = await self.engine.run_blocking(db.get_bookmark_by_id, artwork_id)
+        if local_artwork:
+            local_artwork.is_deleted = True
+        else:
+            local_artwork = Artwork(
+                id=artwork_id,
+                is_deleted=True
+            )
+        await self.engine.run_blocking(self.writer.add_bookmark, local_artwork)
+        logger.info(f"作品 {artwork_id} 已被删除，跳过处理。")
+
+    async def _download(self, item: tuple[ArtworkJob, Image]) -> None:
+        job, image = item
+        if job.failed:
+            # 同一作品的其他图片已失败，不再继续下载
+            await self._finish_image(job, image, ok=False)
+            return
+        try:
+            type_dir = get_type_dir(job.artwork.type)
+            save_path = os.path.join(REMOTE_DIR, type_dir, make_save_name(image, job.artwork))
+            if self.manifest and await self.engine.run_blocking(self.manifest.original_ok, image.id, save_path):
+                # 原图已存在且与清单记录一致
+                image.original_path = save_path
+            elif await self._journal_done(image, "downloaded", save_path):
+                # 上次运行中已下载完成
+                image.original_path = save_path
+            else:
+                buffer = bytearray() if job.artwork.type == ArtworkType.UGOIRA else None
+                await self.engine.download(image.url, save_path, job.use_cookies, buffer=buffer)
+                image.original_path = save_path
+                if buffer and len(buffer) == os.path.getsize(save_path):
+                    job.zip_buffers[image.id] = bytes(buffer)
+                if self.journal:
+                    await self.engine.run_blocking(self.journal.mark_image, image.id, job.artwork.id,
+                                                   "downloaded", save_path)
+        except Exception as e:
+            logger.error(f"下载图片 {image.id} 时出错: {e}", exc_info=True)
+            await self._finish_image(job, image, ok=False)
+            return
+        await self.compress_queue.put(item)
+
+    async def _compress(self, item: tuple[ArtworkJob, Image]) -> None:
+        job, image = item
+        artwork = job.artwork
+        try:
+            type_dir = get_type_dir(artwork.type)
+            if artwork.type == ArtworkType.UGOIRA:
+                zip_name = os.path.basename(image.original_path)
+                webp_path = os.path.join(LOCAL_DIR, type_dir, zip_name.replace(".zip", ".webp"))
+                compress_job = CompressJob("ugoira", image.original_path, webp_path, metadata=artwork.ugoiraInfo,
+                                           input_bytes=job.zip_buffers.pop(image.id, None))
+            else:
+                image_name = os.path.basename(image.original_path)
+                webp_path = os.path.join(LOCAL_DIR, type_dir, image_name.replace(f".{image.ext}", ".webp"))
+                compress_job = CompressJob("image", image.original_path, webp_path, quality=85)
+            encoder = encoder_settings(compress_job)
+            if self.manifest and await self.engine.run_blocking(self.manifest.compressed_ok, image.id,
+                                                                  image.original_path, webp_path, encoder):
+                # 原图未变化，WebP 已存在且编码参数相同
+                image.compressed_path = webp_path
+            elif await self._journal_done(image, "tagged", webp_path):
+                # 上次运行中已压缩并写入标签
+                image.compressed_path = webp_path
+            else:
+                # 标签在编码时写入，每个文件只写一次
+                compress_job.xmp = build_xmp(image, artwork)
+                compress_job.exif = build_exif(artwork)
+                result = await self.compressor.run(compress_job)
+                image.compressed_path = result.output_path
+                if self.manifest:
+                    await self.engine.run_blocking(self.manifest.record, image.id, image.original_path,
+                                                   result.input_hash, result.output_path, encoder)
+            if self.journal:
+                # 压缩时已写入标签，压缩和标记在同一步完成
+                await self.engine.run_blocking(self.journal.mark_image, image.id, artwork.id,
+                                               "tagged", None, image.compressed_path)
+        except Exception as e:
+            logger.error(f"压缩图片 {image.id} 时出错: {e}", exc_info=True)
+            await self._finish_image(job, image, ok=False)
+            return
+        await self._finish_image(job, image, ok=True)
+
+    async def _journal_done(self, image: Image, stage: str, path: str) -> bool:
+        """任务日志中的图片已完成 stage，且对应的文件仍然存在"""
+        if not self.journal:
+            return False
+        state = await self.engine.run_blocking(self.journal.image_state, image.id)
+        if state is None or STAGE_INDEX[state[0]] < STAGE_INDEX[stage]:
+            return False
+        recorded = state[1] if stage == "downloaded" else state[2]
+        return recorded == path and os.path.exists(path)
+
+    async def _finish_image(self, job: ArtworkJob, image: Image, ok: bool) -> None:
+        """记录一张图片的结果，作品的所有图片都结束后送入入库队列"""
+        self.images_finished += 1
+        self._show_progress()
+        if ok:
+            job.done.append(image)
+            self.stats["images"] += 1
+        else:
+            job.failed = True
+            self.stats["failed_images"] += 1
+        job.remaining -= 1
+        if job.remaining == 0:
+            await self.commit_queue.put(job)
+
+    def _show_progress(self) -> None:
+        self.pbar.set_postfix_str(f"图片 {self.images_finished}/{self.images_total}")
+
+    async def _commit(self, job: ArtworkJob) -> None:
+        for image in job.done:
+            await self.engine.run_blocking(self.writer.add_image, image)
+        if job.failed:
+            self.stats["failed_artworks"] += 1
+            logger.warning(f"作品 {job.artwork.id} 下载失败，部分图片未能成功处理。")
+            return
+        await self.engine.run_blocking(self.writer.add_bookmark, job.artwork)
+        self.stats["artworks"] += 1
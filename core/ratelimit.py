@@ -0,0 +1,107 @@
+from typing import Dict, Optional
+import threading
+import asyncio
+import time
+
+from config.settings import *
+
+class AdaptiveRateLimiter:
+    """
+    自适应令牌桶限速器。
+    遇到 429/403 或延迟明显升高时按比例降低速率，连续成功一段时间后逐步提高速率，
+    使请求速率稳定在不会被限流的最高水平附近。同步与异步调用方共用同一个桶。
+    """
+    def __init__(self, name: str, rate: float, min_rate: float, max_rate: float,
+                 success_threshold: int = 20, decrease_factor: float = 0.5,
+                 latency_factor: float = 2.0, cooldown: float = 2.0):
+        self.name = name
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.success_threshold = success_threshold
+        self.decrease_factor = decrease_factor
+        self.latency_factor = latency_factor
+        self.cooldown = cooldown
+        # 桶容量为一秒的请求量，允许少量突发
+        self.tokens = max(rate, 1.0)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.successes = 0
+        self.last_decrease = 0.0
+        self.fast_latency: Optional[float] = None
+        self.slow_latency: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """预约一个令牌，返回需要等待的秒数。令牌可以透支，等待者按预约顺序放行"""
+        with self._lock:
+            now = time.monotonic()
+            capacity = max(self.rate, 1.0)
+            self.tokens = min(capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            return max(wait, self.paused_until - now)
+
+    def acquire(self) -> None:
+        """同步获取令牌"""
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self) -> None:
+        """在协程中获取令牌"""
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def feedback(self, status: Optional[int], latency: float, retry_after: Optional[float] = None) -> None:
+        """根据响应状态码和延迟调整速率"""
+        with self._lock:
+            now = time.monotonic()
+            if status in (429, 403):
+                if retry_after:
+                    self.paused_until = max(self.paused_until, now + retry_after)
+                self._decrease(now, f"状态码 {status}")
+                return
+
+            # 快慢两条指数滑动平均，快线明显高于慢线说明服务器开始变慢
+            if self.fast_latency is None:
+                self.fast_latency = self.slow_latency = latency
+            else:
+                self.fast_latency = self.fast_latency * 0.7 + latency * 0.3
+                self.slow_latency = self.slow_latency * 0.95 + latency * 0.05
+            if self.fast_latency > self.slow_latency * self.latency_factor:
+                self._decrease(now, f"延迟升高至 {self.fast_latency:.2f} 秒")
+                return
+
+            self.successes += 1
+            if self.successes >= self.success_threshold:
+                self.successes = 0
+                self.rate = min(self.max_rate, self.rate + max(self.rate * 0.1, 0.1))
+
+    def _decrease(self, now: float, reason: str) -> None:
+        self.successes = 0
+        # 并发请求会同时收到限流响应，冷却期内只降一次
+        if now - self.last_decrease < self.cooldown:
+            return
+        self.last_decrease = now
+        old_rate = self.rate
+        self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+        logger.warning(f"[{self.name}] {reason}，请求速率从 {old_rate:.2f}/秒 降至 {self.rate:.2f}/秒")
+
+LIMITERS: Dict[str, AdaptiveRateLimiter] = {
+    family: AdaptiveRateLimiter(family, rate, min_rate, max_rate)
+    for family, (rate, min_rate, max_rate) in RATE_LIMITS.items()
+}
+
+def get_limiter(family: str) -> Optional[AdaptiveRateLimiter]:
+    """获取接口类别（bookmarks / details / image）共享的限速器"""
+    return LIMITERS.get(family)
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析 Retry-After 响应头（只支持秒数）"""
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
@@ -0,0 +1,138 @@
+from typing import Iterable, Iterator, Optional
+import subprocess
+import tempfile
+import threading
+import queue
+import time
+import re
+import os
+
+from tqdm import tqdm
+
+from config.settings import *
+from core.models import Artwork, Image
+from core.utils import ExifToolWorker
+from core.xmp import build_exiftool_args
+
+_RESULT_PATTERN = re.compile(r"(\d+) image files? (updated|unchanged)")
+
+def count_results(output: str) -> int:
+    """从 exiftool 的输出中统计处理成功（已更新或无需更新）的文件数"""
+    return sum(int(count) for count, _ in _RESULT_PATTERN.findall(output))
+
+def write_argfile(items: list[tuple[Image, Artwork]], path: str) -> None:
+    """写入 -@ 参数文件，每行一个参数，每个文件的参数之间用 -execute 分隔"""
+    lines = []
+    for index, (image, artwork) in enumerate(items):
+        if index:
+            lines.append(b"-execute")
+        lines.extend(build_exiftool_args(image, artwork))
+    with open(path, "wb") as f:
+        f.write(b"\n".join(lines) + b"\n")
+
+def run_argfile(items: list[tuple[Image, Artwork]], executable: str = "exiftool") -> str:
+    """把一批文件写成参数文件，由一次 exiftool 调用处理，返回 exiftool 的输出"""
+    fd, path = tempfile.mkstemp(suffix=".args", prefix="retag_")
+    os.close(fd)
+    try:
+        write_argfile(items, path)
+        result = subprocess.run([executable, "-@", path], capture_output=True)
+        return result.stdout.decode("utf-8", "replace") + result.stderr.decode("utf-8", "replace")
+    finally:
+        os.remove(path)
+
+def iter_library_files(chunk_size: int = DB_FETCH_CHUNK_SIZE) -> Iterator[tuple[Image, Artwork]]:
+    """从数据库流式读取所有已压缩的图片及其作品"""
+    # 只在读取数据库时才导入，批量标记本身不需要数据库连接
+    import core.database as db
+    for artwork, images in db.iter_artwork_images(chunk_size):
+        for image in images:
+            if image.compressed_path:
+                yield image, artwork
+
+class BulkRetagger:
+    """
+    批量重新写入标签。
+    每 batch_size 个文件组成一批放入共享队列，空闲的工作线程从队列中取出批次执行，
+    忙碌的线程不会被分配任务。stay_open 模式下每个线程持有一个常驻 exiftool 进程，
+    一批文件只需一次往返；argfile 模式下每批写成一个 -@ 参数文件，由一次 exiftool 调用处理。
+    """
+    def __init__(self, workers: int = EXIFTOOL_WORKERS, batch_size: int = RETAG_BATCH_SIZE, mode: str = RETAG_MODE):
+        if mode not in ("stay_open", "argfile"):
+            raise ValueError(f"未知的重新标记模式: {mode}")
+        self.workers = workers
+        self.batch_size = batch_size
+        self.mode = mode
+        # 队列只保留少量批次，数据库读取速度由处理速度决定
+        self.batches: queue.Queue[Optional[list]] = queue.Queue(workers * 2)
+        self.stats = {"files": 0, "ok": 0, "failed": 0, "missing": 0, "batches": 0}
+        self._lock = threading.Lock()
+        self.pbar: Optional[tqdm] = None
+
+    def run(self, items: Iterable[tuple[Image, Artwork]]) -> dict:
+        """处理所有文件，返回统计信息（含 files_per_sec）"""
+        # 先在主线程启动 exiftool，缺少 exiftool 时直接报错，不会让工作线程悄悄退出
+        workers = [ExifToolWorker() if self.mode == "stay_open" else None for _ in range(self.workers)]
+        threads = [threading.Thread(target=self._worker_loop, args=(worker,), name=f"retag-{i}", daemon=True)
+                   for i, worker in enumerate(workers)]
+        start = time.perf_counter()
+        with tqdm(desc="重新标记", unit="个") as self.pbar:
+            for thread in threads:
+                thread.start()
+            try:
+                batch = []
+                for image, artwork in items:
+                    if not os.path.exists(image.compressed_path):
+                        self.stats["missing"] += 1
+                        continue
+                    batch.append((image, artwork))
+                    if len(batch) >= self.batch_size:
+                        self.batches.put(batch)
+                        batch = []
+                if batch:
+                    self.batches.put(batch)
+            finally:
+                for _ in threads:
+                    self.batches.put(None)
+                for thread in threads:
+                    thread.join()
+        seconds = time.perf_counter() - start
+        self.stats["seconds"] = round(seconds, 2)
+        self.stats["files_per_sec"] = round(self.stats["files"] / seconds, 1) if seconds else 0
+        return self.stats
+
+    def _worker_loop(self, worker: Optional[ExifToolWorker]) -> None:
+        try:
+            while True:
+                batch = self.batches.get()
+                if batch is None:
+                    return
+                self._process(worker, batch)
+        finally:
+            if worker:
+                worker.close()
+
+    def _process(self, worker: Optional[ExifToolWorker], batch: list[tuple[Image, Artwork]]) -> None:
+        try:
+            output = worker.process_batch(batch) if worker else run_argfile(batch)
+            ok = min(count_results(output), len(batch))
+            if ok < len(batch):
+                errors = [line for line in output.splitlines() if line.startswith(("Error", "Warning"))]
+                logger.warning(f"{len(batch) - ok} 个文件重新标记失败：{'; '.join(errors[:3])}")
+        except Exception as e:
+            logger.error(f"批量重新标记出错: {e}", exc_info=True)
+            ok = 0
+        with self._lock:
+            self.stats["batches"] += 1
+            self.stats["files"] += len(batch)
+            self.stats["ok"] += ok
+            self.stats["failed"] += len(batch) - ok
+        self.pbar.update(len(batch))
+
+def retag_library(workers: int = EXIFTOOL_WORKERS, batch_size: int = RETAG_BATCH_SIZE, mode: str = RETAG_MODE) -> dict:
+    """从数据库读取所有已压缩的图片，按当前的标签格式重新写入"""
+    stats = BulkRetagger(workers, batch_size, mode).run(iter_library_files())
+    logger.info(f"重新标记 {stats['files']} 个文件（成功 {stats['ok']}，失败 {stats['failed']}，"
+                f"文件不存在 {stats['missing']}），共 {stats['batches']} 批，用时 {stats['seconds']} 秒，"
+                f"{stats['files_per_sec']} 个/秒")
+    return stats
@@ -0,0 +1,225 @@
+from typing import Callable, Dict, Optional
+from urllib.parse import urlsplit
+import threading
+import asyncio
+import zipfile
+import json
+import random
+import time
+
+import aiohttp
+import requests
+from PIL import UnidentifiedImageError
+
+from config.settings import *
+
+# 错误类别
+RETRYABLE = "retryable"  # 网络中断、超时、限流（429/403）、服务器错误、响应体不完整，稍后重试可能成功
+FATAL = "fatal"          # 作品不存在、已删除、文件损坏，重试不会改变结果
+AUTH = "auth"            # 需要登录（401）或作品被屏蔽，匿名请求应改用 cookies 重新请求，原样重试没有意义
+WAIT = "wait"            # 主机熔断中，等冷却结束后重试，不消耗重试预算
+
+class HTTPStatusError(Exception):
+    """接口或下载返回了非成功的状态码"""
+    def __init__(self, status: int, url: str = ""):
+        super().__init__(f"Request failed, status code: {status}" + (f" ({url})" if url else ""))
+        self.status = status
+        self.url = url
+
+class ApiError(Exception):
+    """Pixiv 接口返回 error: true，例如作品已删除或不存在"""
+
+class AuthRequiredError(Exception):
+    """作品被屏蔽，需要带 cookies 重新请求"""
+
+class CircuitOpenError(Exception):
+    """主机的熔断器处于打开状态"""
+    def __init__(self, host: str, remaining: float):
+        super().__init__(f"{host} 连续失败过多，熔断中，{remaining:.1f} 秒后恢复")
+        self.host = host
+        self.remaining = remaining
+
+def classify(error: BaseException) -> str:
+    """
+    判断错误的类别。
+    403 与 core.ratelimit 一致视为限流：Pixiv 在请求过快时返回 403，限速器降速后重试可以成功。
+    """
+    if isinstance(error, CircuitOpenError):
+        return WAIT
+    if isinstance(error, AuthRequiredError):
+        return AUTH
+    if isinstance(error, ApiError):
+        return FATAL
+    status = getattr(error, "status", None)
+    if isinstance(status, int):
+        if status == 401:
+            return AUTH
+        if status in (403, 408, 429) or status >= 500:
+            return RETRYABLE
+        return FATAL
+    if isinstance(error, (aiohttp.ClientError, requests.RequestException, asyncio.TimeoutError, ConnectionError)):
+        return RETRYABLE
+    # 响应体被截断或返回了 HTML 错误页，重新请求通常能得到完整的 JSON
+    if isinstance(error, json.JSONDecodeError):
+        return RETRYABLE
+    # 文件损坏或格式不支持，重新编码也会失败
+    if isinstance(error, (UnidentifiedImageError, zipfile.BadZipFile, ValueError, SyntaxError, EOFError)):
+        return FATAL
+    return RETRYABLE
+
+def needs_cookies(error: BaseException, use_cookies: bool) -> bool:
+    """匿名请求遇到需要登录的错误时，调用方应改用 cookies 重新请求一次"""
+    return not use_cookies and classify(error) == AUTH
+
+def host_of(url: str) -> str:
+    return urlsplit(url).hostname or ""
+
+class RetryBudget:
+    """一次运行中所有重试共享的总次数，耗尽后失败的请求不再重试，避免故障时成倍放大请求量"""
+    def __init__(self, total: int):
+        self.total = total
+        self.used = 0
+        self._lock = threading.Lock()
+        self._warned = False
+
+    def take(self) -> bool:
+        with self._lock:
+            if self.used < self.total:
+                self.used += 1
+                return True
+            if not self._warned:
+                self._warned = True
+                logger.warning(f"本次运行的重试次数已用完（{self.total} 次），之后的失败不再重试")
+            return False
+
+class CircuitBreaker:
+    """
+    按主机的熔断器：连续 threshold 次可重试的失败后打开，cooldown 秒内对该主机的请求直接失败；
+    冷却结束后只放行一个探测请求，成功则关闭，其余请求继续等待下一个冷却周期。
+    """
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures: Dict[str, int] = {}
+        self.opened: Dict[str, float] = {}
+        self.trips = 0
+        self._lock = threading.Lock()
+
+    def check(self, host: str) -> None:
+        with self._lock:
+            opened = self.opened.get(host)
+            if opened is None:
+                return
+            remaining = opened + self.cooldown - time.monotonic()
+            if remaining > 0:
+                raise CircuitOpenError(host, remaining)
+            # 放行这一个探测请求，其他请求重新开始计时
+            self.opened[host] = time.monotonic()
+
+    def record_success(self, host: str) -> None:
+        with self._lock:
+            self.failures.pop(host, None)
+            if self.opened.pop(host, None) is not None:
+                logger.info(f"{host} 已恢复，熔断关闭")
+
+    def record_failure(self, host: str) -> None:
+        with self._lock:
+            self.failures[host] = self.failures.get(host, 0) + 1
+            if self.failures[host] >= self.threshold and host not in self.opened:
+                self.opened[host] = time.monotonic()
+                self.trips += 1
+                logger.warning(f"{host} 连续失败 {self.failures[host]} 次，暂停请求 {self.cooldown} 秒")
+
+class RetryPolicy:
+    """
+    统一的重试策略：只重试可重试的错误，退避时间按指数增长并加入随机抖动，
+    每次重试消耗共享的重试预算，按主机记录失败次数触发熔断。
+    熔断中的请求等冷却结束后再试，计入尝试次数但不消耗重试预算。
+    同步调用用 run，协程用 run_async。
+    """
+    def __init__(self, name: str, max_attempts: int, budget: RetryBudget, breaker: CircuitBreaker,
+                 base_delay: float = RETRY_BASE_DELAY, max_delay: float = RETRY_MAX_DELAY):
+        self.name = name
+        self.max_attempts = max_attempts
+        self.budget = budget
+        self.breaker = breaker
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retries = 0
+        self.gave_up = 0
+
+    def backoff(self, attempt: int) -> float:
+        """第 attempt 次失败后的等待时间：在 [0, base * 2^attempt] 内均匀随机，不超过 max_delay"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _next_delay(self, error: Exception, attempt: int, host: Optional[str], label: str) -> Optional[float]:
+        """记录一次失败，返回重试前的等待时间；不应重试时返回 None"""
+        kind = classify(error)
+        if host and kind == RETRYABLE:
+            self.breaker.record_failure(host)
+        if kind not in (RETRYABLE, WAIT):
+            return None
+        if attempt + 1 >= self.max_attempts or (kind == RETRYABLE and not self.budget.take()):
+            self.gave_up += 1
+            return None
+        self.retries += 1
+        delay = self.backoff(attempt)
+        if kind == WAIT:
+            delay = max(delay, error.remaining)
+        logger.warning(f"[{label or self.name}][尝试 {attempt + 1}/{self.max_attempts}] {error}，{delay:.1f} 秒后重试")
+        return delay
+
+    def run(self, func: Callable, *args, host: Optional[str] = None, label: str = "", **kwargs):
+        attempt = 0
+        while True:
+            try:
+                if host:
+                    self.breaker.check(host)
+                result = func(*args, **kwargs)
+            except Exception as e:
+                delay = self._next_delay(e, attempt, host, label)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+            if host:
+                self.breaker.record_success(host)
+            return result
+
+    async def run_async(self, func: Callable, *args, host: Optional[str] = None, label: str = "", **kwargs):
+        attempt = 0
+        while True:
+            try:
+                if host:
+                    self.breaker.check(host)
+                result = await func(*args, **kwargs)
+            except Exception as e:
+                delay = self._next_delay(e, attempt, host, label)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            if host:
+                self.breaker.record_success(host)
+            return result
+
+RETRY_BUDGET = RetryBudget(RETRY_BUDGET_TOTAL)
+BREAKER = CircuitBreaker(CIRCUIT_BREAKER_THRESHOLD, CIRCUIT_BREAKER_COOLDOWN)
+POLICIES: Dict[str, RetryPolicy] = {
+    name: RetryPolicy(name, max_attempts, RETRY_BUDGET, BREAKER)
+    for name, max_attempts in RETRY_MAX_ATTEMPTS.items()
+}
+
+def get_policy(name: str) -> RetryPolicy:
+    """获取一类操作（api / download / local）共享的重试策略"""
+    return POLICIES[name]
+
+def retry_stats() -> Dict[str, int]:
+    return {
+        "retries": sum(policy.retries for policy in POLICIES.values()),
+        "gave_up": sum(policy.gave_up for policy in POLICIES.values()),
+        "budget_left": RETRY_BUDGET.total - RETRY_BUDGET.used,
+        "breaker_trips": BREAKER.trips,
+    }
@@ -1,36 +1,34 @@
 from __future__ import annotations
 import os
-import exiftool
 import threading
-import time
 import functools
-from typing import Dict, TYPE_CHECKING
+from typing import Dict, Iterable, Iterator, Union, TYPE_CHECKING
 from PIL import Image as PILImage
 import zipfile
 import io
 
 import imageio
+import numpy as np
 from config.settings import *
+from core.frames import iter_encoder_frames
+from core.xmp import build_exiftool_args
+from core.retry import get_policy
+
+try:
+    import exiftool
+except ImportError:
+    # exiftool 只用于给已有文件重新写入标签，压缩流程不再需要
+    exiftool = None
 
 if TYPE_CHECKING:
     from core.models import Image, Artwork
 
-def retry_on_error(max_retries=5, delay=1):
-    """重试装饰器"""
+def retry_on_error(policy: str = "local"):
+    """按重试策略重试的装饰器，文件损坏、格式不支持等不可重试的错误直接抛出"""
     def decorator(func):
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
-            for attempt in range(max_retries + 1):
-                try:
-                    return func(*args, **kwargs)
-                except Exception as e:
-                    if attempt == max_retries:
-                        logger.error(f"函数 {func.__name__} 在重试 {max_retries} 次后仍然失败: {e}", exc_info=True)
-                        raise
-                    else:
-                        logger.warning(f"函数 {func.__name__} 第 {attempt + 1} 次尝试失败: {e}，将在 {delay} 秒后重试")
-                        time.sleep(delay)
-            return None
+            return get_policy(policy).run(func, *args, label=func.__name__, **kwargs)
         return wrapper
     return decorator
 
@@ -47,105 +45,137 @@ def load_cookies_from_file(file_path: str) -> Dict[str, str]:
     return cookies
 
 @retry_on_error()    
-def compress_to_webp(input_image_path, output_image_path, quality=85):
+def compress_to_webp(input_image_path, output_image_path, quality=85, xmp=b"", exif=b""):
     """
-    将图像压缩为 WebP 格式并保存
+    将图像压缩为 WebP 格式并保存，xmp / exif 在编码时一并写入。
+    input_image_path 也可以是已读入内存的文件内容
     """
-    img = PILImage.open(input_image_path)
-    img.save(output_image_path, format='WEBP', quality=quality, method=6)
+    if isinstance(input_image_path, (bytes, bytearray, memoryview)):
+        img = PILImage.open(io.BytesIO(input_image_path))
+    else:
+        img = PILImage.open(input_image_path)
+    img.save(output_image_path, format='WEBP', quality=quality, method=6, xmp=xmp, exif=exif)
     return input_image_path, output_image_path
 
 
-@retry_on_error()    
-def zip_to_webp(zip_path, webp_path, metadata, quality=85):
-    # 获取文件名
-    durations = [i['delay'] for i in metadata.get('frames', [])]
-    
-    # 打开 ZIP 文件
-    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-        # 获取 ZIP 文件中的所有文件列表
-        file_list = zip_ref.namelist()
-        
-        # 过滤出图像文件（假设所有文件都是图像）
-        image_files = [f for f in file_list if f.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.gif'))]
-        # logger.info(f"ZIP文件中找到 {len(image_files)} 个图像文件")
-        
-        # 读取第一帧作为背景
-        first_frame_data = zip_ref.read(image_files[0])
-        background = PILImage.open(io.BytesIO(first_frame_data)).convert("RGBA")
-        
-        # 读取所有帧并保存帧数据和持续时间
-        frames = []
-        
-        for image_file in image_files:
-            frame_data = zip_ref.read(image_file)
-            pil_image = PILImage.open(io.BytesIO(frame_data)).convert("RGBA")
-            
-            # 使用第一帧作为背景合成
-            frame_with_background = PILImage.alpha_composite(background, pil_image)
-            frames.append(frame_with_background)
-        return True
+class FrameSequence(PILImage.Image):
+    """
+    按需解码的多帧图像。
+    Pillow 保存动图时会对 append_images 中的图像依次 seek 每一帧，这里在 seek 时才从迭代器取出下一帧，
+    编码器同一时间只持有当前帧，内存占用与帧数无关。只支持按顺序读取。
+    """
+    def __init__(self, frames: Iterator[PILImage.Image], n_frames: int, size: tuple[int, int], mode: str = "RGBA"):
+        super().__init__()
+        self._frames = frames
+        self.n_frames = n_frames
+        self._size = size
+        self._mode = mode
+        self._index = -1
 
-    
-    # 保存为 WebP 格式，保持每帧的持续时间
-    frames[0].save(
-        webp_path,
+    def seek(self, frame: int) -> None:
+        if frame == self._index:
+            return
+        if frame != self._index + 1:
+            raise EOFError("FrameSequence 只能按顺序读取")
+        image = next(self._frames)
+        if image.mode != self._mode:
+            image = image.convert(self._mode)
+        self.im = image.im
+        self._index = frame
+
+    def tell(self) -> int:
+        return self._index
+
+def open_ugoira_zip(zip_source: Union[str, bytes, bytearray, memoryview]) -> zipfile.ZipFile:
+    """打开动图压缩包，zip_source 可以是文件路径，也可以是下载得到的内存数据"""
+    if isinstance(zip_source, (bytes, bytearray, memoryview)):
+        return zipfile.ZipFile(io.BytesIO(zip_source), 'r')
+    return zipfile.ZipFile(zip_source, 'r')
+
+def ugoira_frame_list(zip_ref: zipfile.ZipFile, metadata: dict) -> list[tuple[str, int]]:
+    """
+    返回 [(帧文件名, 持续时间毫秒)]。
+    帧顺序和持续时间以 ugoiraInfo['frames'] 为准，元数据缺失时按压缩包内文件名排序，每帧 100 毫秒。
+    """
+    names = {name for name in zip_ref.namelist() if name.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.gif'))}
+    frames = [(frame['file'], int(frame.get('delay', 100))) for frame in metadata.get('frames', [])
+              if frame.get('file') in names]
+    if not frames:
+        frames = [(name, 100) for name in sorted(names)]
+    return frames
+
+def iter_ugoira_arrays(zip_ref: zipfile.ZipFile, names: Iterable[str]) -> Iterator[np.ndarray]:
+    """逐帧解码为 RGBA 数组"""
+    for name in names:
+        with zip_ref.open(name) as f:
+            yield np.asarray(PILImage.open(f).convert("RGBA"))
+
+def save_animated_webp(frames: Iterator[PILImage.Image], n_frames: int, durations: list[int], webp_path, quality=85,
+                       xmp=b"", exif=b""):
+    """把逐帧产生的图像编码为动画 WebP，先写临时文件，编码失败时不会留下不完整的输出"""
+    first = next(frames)
+    rest = FrameSequence(frames, n_frames - 1, first.size)
+    tmp_path = webp_path + ".tmp"
+    first.save(
+        tmp_path,
         format="WebP",
         save_all=True,
-        append_images=frames[1:],  # 追加后续帧
+        append_images=[rest] if rest.n_frames else [],  # 其余帧在编码时逐个解码
         loop=0,  # 循环播放
         lossless=False,  # 使用有损压缩
-        quality=75,
+        quality=quality,
         duration=durations,  # 每帧的持续时间
-        method=6
+        method=6,
+        xmp=xmp,
+        exif=exif
     )
+    os.replace(tmp_path, webp_path)
+
+@retry_on_error()    
+def zip_to_webp(zip_source, webp_path, metadata, quality=85, xmp=b"", exif=b""):
+    """
+    将动图压缩包编码为动画 WebP。
+    逐帧解码、合成到第一帧上后直接交给编码器，内存中只保留当前帧和上一个保留的帧；
+    连续的重复帧重复上一帧的图像，由编码器合并为一帧。
+    zip_source 可以是文件路径或内存中的压缩包数据。
+    """
+    with open_ugoira_zip(zip_source) as zip_ref:
+        frame_list = ugoira_frame_list(zip_ref, metadata)
+        if not frame_list:
+            raise ValueError(f"压缩包中没有图像帧: {webp_path}")
+        frames = iter_encoder_frames(iter_ugoira_arrays(zip_ref, [name for name, _ in frame_list]))
+        save_animated_webp(frames, len(frame_list), [delay for _, delay in frame_list], webp_path, quality, xmp, exif)
+    return webp_path
     
 
 @retry_on_error()    
-def gif_to_webp(gif_path, webp_path, quality=85):
+def gif_to_webp(gif_path, webp_path, quality=85, xmp=b"", exif=b""):
+    """
+    将 GIF 编码为动画 WebP，重复帧合并、帧合成与 zip_to_webp 相同。
+    gif_path 也可以是已读入内存的文件内容
+    """
     # 使用 imageio.get_reader 读取 GIF 文件
     reader = imageio.get_reader(gif_path, format='GIF')
-    
-    # 获取每一帧的持续时间
-    durations = []
-    frames_data = []
-    
-    for frame_idx in range(len(reader)):  # 遍历所有帧
-        frame_meta = reader.get_meta_data(frame_idx)
-        durations.append(frame_meta.get('duration', 100))  # 默认持续时间100ms
-        frames_data.append(reader.get_data(frame_idx))  # 保存帧数据
-    
-    # 使用第一帧作为背景
-    background = PILImage.fromarray(frames_data[0]).convert("RGBA")  # 将第一帧作为背景
-    
-    # 合成帧
-    frames = []
-    for i, frame in enumerate(frames_data):
-        pil_image = PILImage.fromarray(frame).convert("RGBA")
-        
-        # 使用第一帧作为背景合成
-        frame_with_background = PILImage.alpha_composite(background, pil_image)
-        frames.append(frame_with_background)
-    
-    # 保存为 WebP 格式，保持每帧的持续时间
-    frames[0].save(
-        webp_path,
-        format="WebP",
-        save_all=True,
-        append_images=frames[1:],  # 追加后续帧
-        loop=0,  # 循环播放
-        lossless=False,  # 使用有损压缩
-        quality=75,  # 设置质量
-        duration=durations,  # 每帧的持续时间
-        method=6
-    )
+    try:
+        # 获取每一帧的持续时间，默认持续时间100ms
+        durations = [reader.get_meta_data(frame_idx).get('duration', 100) for frame_idx in range(len(reader))]
+        arrays = (np.asarray(PILImage.fromarray(reader.get_data(frame_idx)).convert("RGBA"))
+                  for frame_idx in range(len(durations)))
+        # 以第一帧作为背景
+        save_animated_webp(iter_encoder_frames(arrays), len(durations), durations, webp_path, quality, xmp, exif)
+    finally:
+        reader.close()
+    return webp_path
     
     
 class ExifToolWorker:
     """
     每个线程独立持有一个 ExifTool 实例，重复使用。
+    压缩时已经写入 XMP，这里只用于给已有的文件重新写入标签。
     """
     def __init__(self):
+        if exiftool is None:
+            raise RuntimeError("重新写入标签需要安装 pyexiftool 和 exiftool")
         self.lock = threading.Lock()
         self.et = exiftool.ExifTool(encoding='utf-8')
         self.et.__enter__()
@@ -153,38 +183,27 @@ class ExifToolWorker:
     @retry_on_error()
     def process_image(self, image: Image, artwork: Artwork):
         try:
-            tags = ["[pixiv]", f"id:{image.idNum}", f"user:{artwork.user_id}"]
-            if image.is_deleted:
-                tags.append("[已删除]")
-            if artwork.aiType == 2:
-                tags.append("AI生成")
-            tags.extend([tag.display_tag for tag in artwork.tags])
-            args = [
-                f'-XMP-dc:title={str(image.index).zfill(3)} {artwork.title}'.encode('utf-8'),
-                f'-XMP-dc:description={artwork.comment}'.encode('utf-8'),
-                f'-XMP-dc:Creator={artwork.user_name}'.encode('utf-8'),
-                f'-XMP-dc:source=https://www.pixiv.net/artworks/{image.idNum}'.encode('utf-8'),
-            ]
-            
-            if artwork.timestamp:
-                dt_original_str = artwork.timestamp.strftime('%Y:%m:%d %H:%M:%S')
-                args.append(f'-DateTimeOriginal={dt_original_str}'.encode('utf-8'))
-            else:
-                args.append(f'-DateTimeOriginal=2007:09:10 00:00:00'.encode('utf-8'))
-                
-            
-            args.extend([f'-XMP-dc:Subject={tag}'.encode('utf-8') for tag in tags])
-            args.extend([
-                f'-overwrite_original'.encode('utf-8'),
-                image.compressed_path.encode('utf-8')
-            ])
-
+            args = build_exiftool_args(image, artwork)
             with self.lock:
                 self.et.execute(*args)
         except Exception as e:
             logger.error(f"处理 {image.compressed_path} 出错: {e}", exc_info=True)
             raise
 
+    def process_batch(self, items: list[tuple[Image, Artwork]]) -> str:
+        """
+        一次 execute 处理一批文件：每个文件的参数之间用 -execute 分隔，
+        exiftool 在同一个进程中依次执行，整批只需要一次往返。返回 exiftool 的输出。
+        """
+        args = []
+        for index, (image, artwork) in enumerate(items):
+            if index:
+                args.append(b"-execute")
+            args.extend(build_exiftool_args(image, artwork))
+        with self.lock:
+            output = self.et.execute(*args)
+            return output + (self.et.last_stderr or "")
+
     def close(self):
         self.et.__exit__(None, None, None)
         
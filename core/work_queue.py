@@ -0,0 +1,224 @@
+from contextlib import contextmanager
+from typing import Iterable, Iterator, Optional
+import threading
+import asyncio
+import sqlite3
+import socket
+import json
+import os
+
+from config.settings import *
+
+WORK_QUEUE_TABLE = "work_queue"
+
+class _MySQLBackend:
+    """共享 MySQL 数据库中的队列表，多台机器用 SELECT ... FOR UPDATE SKIP LOCKED 互不阻塞地领取任务"""
+    param = "%s"
+    now = "UNIX_TIMESTAMP(NOW(6))"
+    insert_ignore = "INSERT IGNORE"
+    skip_locked = " FOR UPDATE SKIP LOCKED"
+    create_sql = (
+        f"CREATE TABLE IF NOT EXISTS {WORK_QUEUE_TABLE} ("
+        "`artwork_id` BIGINT PRIMARY KEY, `payload` TEXT NOT NULL, `status` VARCHAR(8) NOT NULL DEFAULT 'pending', "
+        "`owner` VARCHAR(128), `lease_until` DOUBLE, `attempts` INT NOT NULL DEFAULT 0, "
+        "KEY `idx_status_lease` (`status`, `lease_until`))"
+    )
+
+    def __init__(self):
+        # 只在使用 MySQL 时才导入，SQLite 替身不需要数据库配置
+        import core.database as db
+        self._db = db
+
+    @contextmanager
+    def transaction(self) -> Iterator:
+        with self._db.get_db_cursor() as (conn, cursor):
+            yield cursor
+            conn.commit()
+
+class _SQLiteBackend:
+    """
+    单机测试用的 SQLite 替身。SQLite 没有行锁，领取时用 BEGIN IMMEDIATE 取得写锁，
+    多个工作进程的领取操作依次执行，效果与 SKIP LOCKED 相同。
+    """
+    param = "?"
+    now = "((julianday('now') - 2440587.5) * 86400.0)"
+    insert_ignore = "INSERT OR IGNORE"
+    skip_locked = ""
+    create_sql = (
+        f"CREATE TABLE IF NOT EXISTS {WORK_QUEUE_TABLE} ("
+        "artwork_id INTEGER PRIMARY KEY, payload TEXT NOT NULL, status TEXT NOT NULL DEFAULT 'pending', "
+        "owner TEXT, lease_until REAL, attempts INTEGER NOT NULL DEFAULT 0)"
+    )
+
+    def __init__(self, path: str = WORK_QUEUE_SQLITE_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def transaction(self) -> Iterator:
+        with self._lock:
+            cursor = self.conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                yield cursor
+                cursor.execute("COMMIT")
+            except BaseException:
+                cursor.execute("ROLLBACK")
+                raise
+            finally:
+                cursor.close()
+
+class WorkQueue:
+    """
+    基于租约的作品任务队列，多台机器或多个进程共享同一张表分担同步任务。
+    工作进程按批领取作品并获得 lease_seconds 秒的租约，处理期间定时续约；
+    进程崩溃或失联后租约过期，作品重新回到队列由其他进程领取。
+    失败或租约过期的作品重新排队，领取次数达到 max_attempts 后标记为 failed，
+    反复导致进程崩溃的作品不会无限次地被领取。
+    完成、失败和续约只对本进程仍持有租约的作品生效，租约已被其他进程接手时不会改动对方的状态。
+    """
+    def __init__(self, backend: str = WORK_QUEUE_BACKEND, lease_seconds: float = WORK_QUEUE_LEASE_SECONDS,
+                 max_attempts: int = WORK_QUEUE_MAX_ATTEMPTS, owner: Optional[str] = None,
+                 sqlite_path: str = WORK_QUEUE_SQLITE_PATH):
+        if backend == "mysql":
+            self.backend = _MySQLBackend()
+        elif backend == "sqlite":
+            self.backend = _SQLiteBackend(sqlite_path)
+        else:
+            raise ValueError(f"未知的任务队列后端: {backend}")
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+        with self.backend.transaction() as cursor:
+            cursor.execute(self.backend.create_sql)
+
+    def _in(self, ids: list) -> str:
+        return ", ".join([self.backend.param] * len(ids))
+
+    def enqueue(self, bookmarks: Iterable[dict]) -> int:
+        """加入待处理的收藏，已在队列中的作品保持原状态，返回新加入的数量"""
+        rows = [(int(bookmark["id"]), json.dumps(bookmark, ensure_ascii=False)) for bookmark in bookmarks]
+        if not rows:
+            return 0
+        p = self.backend.param
+        with self.backend.transaction() as cursor:
+            cursor.executemany(
+                f"{self.backend.insert_ignore} INTO {WORK_QUEUE_TABLE} (artwork_id, payload) VALUES ({p}, {p})", rows
+            )
+            return cursor.rowcount
+
+    def _release_expired(self, limit: int) -> None:
+        """
+        租约已过期的作品放回队列，领取次数用完的标记为 failed。
+        单独用一个短事务执行，先用 SKIP LOCKED 锁定过期的行，再按主键只更新这些行，
+        不会在领取事务中对整个租约范围加锁，多个进程同时领取时互不阻塞。
+        """
+        p, now = self.backend.param, self.backend.now
+        with self.backend.transaction() as cursor:
+            cursor.execute(
+                f"SELECT artwork_id FROM {WORK_QUEUE_TABLE} WHERE status = 'leased' AND lease_until < {now} "
+                f"LIMIT {p}{self.backend.skip_locked}",
+                (limit,)
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+            if not ids:
+                return
+            cursor.execute(
+                f"UPDATE {WORK_QUEUE_TABLE} SET status = CASE WHEN attempts >= {p} THEN 'failed' ELSE 'pending' END, "
+                f"owner = NULL, lease_until = NULL "
+                f"WHERE status = 'leased' AND lease_until < {now} AND artwork_id IN ({self._in(ids)})",
+                (self.max_attempts, *ids)
+            )
+            released = cursor.rowcount
+        if released:
+            logger.warning(f"{released} 个作品的租约已过期，重新排队（领取次数用完的标记为失败）")
+
+    def claim(self, limit: int = WORK_QUEUE_BATCH_SIZE) -> list[dict]:
+        """领取一批待处理的作品（包括租约已过期的），返回收藏信息列表"""
+        self._release_expired(limit)
+        p, now = self.backend.param, self.backend.now
+        with self.backend.transaction() as cursor:
+            cursor.execute(
+                f"SELECT artwork_id, payload FROM {WORK_QUEUE_TABLE} WHERE status = 'pending' "
+                f"ORDER BY artwork_id LIMIT {p}{self.backend.skip_locked}",
+                (limit,)
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                return []
+            ids = [row[0] for row in rows]
+            cursor.execute(
+                f"UPDATE {WORK_QUEUE_TABLE} SET status = 'leased', owner = {p}, lease_until = {now} + {p}, "
+                f"attempts = attempts + 1 WHERE artwork_id IN ({self._in(ids)})",
+                (self.owner, self.lease_seconds, *ids)
+            )
+        return [json.loads(payload) for _, payload in rows]
+
+    def heartbeat(self, artwork_ids: list) -> list[int]:
+        """延长本进程持有的租约，返回仍由本进程持有的作品 ID，其余的租约已过期或被其他进程接手"""
+        if not artwork_ids:
+            return []
+        p, now = self.backend.param, self.backend.now
+        ids = [int(i) for i in artwork_ids]
+        with self.backend.transaction() as cursor:
+            cursor.execute(
+                f"UPDATE {WORK_QUEUE_TABLE} SET lease_until = {now} + {p} "
+                f"WHERE status = 'leased' AND owner = {p} AND artwork_id IN ({self._in(ids)})",
+                (self.lease_seconds, self.owner, *ids)
+            )
+            cursor.execute(
+                f"SELECT artwork_id FROM {WORK_QUEUE_TABLE} "
+                f"WHERE status = 'leased' AND owner = {p} AND artwork_id IN ({self._in(ids)})",
+                (self.owner, *ids)
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def complete(self, artwork_ids: list) -> int:
+        """把本进程持有的作品标记为已完成，返回实际更新的数量"""
+        if not artwork_ids:
+            return 0
+        p = self.backend.param
+        with self.backend.transaction() as cursor:
+            cursor.execute(
+                f"UPDATE {WORK_QUEUE_TABLE} SET status = 'done', lease_until = NULL "
+                f"WHERE status = 'leased' AND owner = {p} AND artwork_id IN ({self._in(artwork_ids)})",
+                (self.owner, *[int(i) for i in artwork_ids])
+            )
+            return cursor.rowcount
+
+    def fail(self, artwork_ids: list) -> int:
+        """本进程持有的作品处理失败，重新排队，领取次数用完的标记为 failed，返回实际更新的数量"""
+        if not artwork_ids:
+            return 0
+        p = self.backend.param
+        with self.backend.transaction() as cursor:
+            cursor.execute(
+                f"UPDATE {WORK_QUEUE_TABLE} SET status = CASE WHEN attempts >= {p} THEN 'failed' ELSE 'pending' END, "
+                f"owner = NULL, lease_until = NULL "
+                f"WHERE status = 'leased' AND owner = {p} AND artwork_id IN ({self._in(artwork_ids)})",
+                (self.max_attempts, self.owner, *[int(i) for i in artwork_ids])
+            )
+            return cursor.rowcount
+
+    def stats(self) -> dict:
+        with self.backend.transaction() as cursor:
+            cursor.execute(f"SELECT status, COUNT(*) FROM {WORK_QUEUE_TABLE} GROUP BY status")
+            counts = dict(cursor.fetchall())
+        return {status: counts.get(status, 0) for status in ("pending", "leased", "done", "failed")}
+
+async def keep_leases(engine, queue: WorkQueue, artwork_ids: list, interval: float, lost: set) -> None:
+    """处理一批作品期间定时续约，直到被取消。租约已失效的作品 ID 加入 lost，之后不再续约"""
+    while True:
+        await asyncio.sleep(interval)
+        held = [artwork_id for artwork_id in artwork_ids if artwork_id not in lost]
+        try:
+            renewed = set(await engine.run_blocking(queue.heartbeat, held))
+        except Exception as e:
+            logger.error(f"续约失败: {e}")
+            continue
+        expired = [artwork_id for artwork_id in held if artwork_id not in renewed]
+        if expired:
+            lost.update(expired)
+            logger.warning(f"{len(expired)} 个作品的租约已失效，可能已被其他进程接手，本进程不再更新其状态")
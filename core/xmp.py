@@ -0,0 +1,86 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+from xml.sax.saxutils import escape
+import re
+
+from PIL import Image as PILImage
+
+if TYPE_CHECKING:
+    from core.models import Image, Artwork
+
+# 没有上传时间的作品使用的默认拍摄时间（Pixiv 上线日期）
+DEFAULT_DATETIME = "2007:09:10 00:00:00"
+# XML 1.0 不允许出现的控制字符
+_INVALID_XML_CHARS = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+
+def make_subjects(image: Image, artwork: Artwork) -> list[str]:
+    """图片的关键词：来源标记、作品和作者 ID、删除和 AI 标记以及作品标签"""
+    tags = ["[pixiv]", f"id:{image.idNum}", f"user:{artwork.user_id}"]
+    if image.is_deleted:
+        tags.append("[已删除]")
+    if artwork.aiType == 2:
+        tags.append("AI生成")
+    tags.extend([tag.display_tag for tag in artwork.tags])
+    return tags
+
+def make_title(image: Image, artwork: Artwork) -> str:
+    return f"{str(image.index).zfill(3)} {artwork.title}"
+
+def make_source(image: Image) -> str:
+    return f"https://www.pixiv.net/artworks/{image.idNum}"
+
+def make_datetime_original(artwork: Artwork) -> str:
+    return artwork.timestamp.strftime('%Y:%m:%d %H:%M:%S') if artwork.timestamp else DEFAULT_DATETIME
+
+def _text(value) -> str:
+    return escape(_INVALID_XML_CHARS.sub("", str(value if value is not None else "")))
+
+def build_xmp(image: Image, artwork: Artwork) -> bytes:
+    """
+    构建 XMP 数据包，字段与 ExifToolWorker 写入的 XMP-dc 标签一致：
+    title、description、creator、source 和 subject。
+    """
+    subjects = "".join(f"<rdf:li>{_text(tag)}</rdf:li>" for tag in make_subjects(image, artwork))
+    packet = (
+        '<?xpacket begin="\ufeff" id="W5M0MpCehiHzreSzNTczkc9d"?>'
+        '<x:xmpmeta xmlns:x="adobe:ns:meta/">'
+        '<rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">'
+        '<rdf:Description rdf:about="" xmlns:dc="http://purl.org/dc/elements/1.1/">'
+        f'<dc:title><rdf:Alt><rdf:li xml:lang="x-default">{_text(make_title(image, artwork))}</rdf:li></rdf:Alt></dc:title>'
+        f'<dc:description><rdf:Alt><rdf:li xml:lang="x-default">{_text(artwork.comment)}</rdf:li></rdf:Alt></dc:description>'
+        f'<dc:creator><rdf:Seq><rdf:li>{_text(artwork.user_name)}</rdf:li></rdf:Seq></dc:creator>'
+        f'<dc:source>{_text(make_source(image))}</dc:source>'
+        f'<dc:subject><rdf:Bag>{subjects}</rdf:Bag></dc:subject>'
+        '</rdf:Description>'
+        '</rdf:RDF>'
+        '</x:xmpmeta>'
+        '<?xpacket end="w"?>'
+    )
+    return packet.encode("utf-8")
+
+def build_exif(artwork: Artwork) -> bytes:
+    """构建只包含 DateTimeOriginal 的 EXIF 数据"""
+    exif = PILImage.Exif()
+    # 0x8769：Exif 子 IFD，0x9003：DateTimeOriginal
+    exif.get_ifd(0x8769)[0x9003] = make_datetime_original(artwork)
+    return exif.tobytes()
+
+def build_exiftool_args(image: Image, artwork: Artwork) -> list[bytes]:
+    """
+    用 exiftool 给已有文件写入与 build_xmp 相同标签的参数。
+    exiftool 的参数按行分隔，值中的换行替换为空格。
+    """
+    def arg(name: str, value) -> bytes:
+        value = str(value if value is not None else "").replace("\r\n", " ").replace("\n", " ").replace("\r", " ")
+        return f"-{name}={value}".encode("utf-8")
+
+    args = [
+        arg("XMP-dc:title", make_title(image, artwork)),
+        arg("XMP-dc:description", artwork.comment),
+        arg("XMP-dc:Creator", artwork.user_name),
+        arg("XMP-dc:source", make_source(image)),
+        arg("DateTimeOriginal", make_datetime_original(artwork)),
+    ]
+    args.extend([arg("XMP-dc:Subject", tag) for tag in make_subjects(image, artwork)])
+    args.extend([b"-overwrite_original", image.compressed_path.encode("utf-8")])
+    return args
@@ -0,0 +1,13 @@
+import importlib
+import sys
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+try:
+    import config.settings  # noqa: F401
+except ImportError:
+    # 未创建 settings.py 时使用模板中的默认配置
+    sys.modules["config.settings"] = importlib.import_module("config.settings_tmp")
@@ -0,0 +1,133 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import json
+import time
+import os
+
+import pytest
+
+from core.aria2 import Aria2Daemon, Aria2Error
+
+SECRET = "test-secret"
+
+class FakeAria2:
+    """本地 aria2 JSON-RPC 替身：addUri 立即“下载”完成，URL 含 missing 时返回错误码 3，含 hang 时一直不完成"""
+    def __init__(self):
+        self.tasks = {}
+        self.calls = []
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def handle(self, method: str, params: list):
+        token, *params = params
+        if token != f"token:{SECRET}":
+            raise PermissionError("Unauthorized")
+        self.calls.append(method)
+        if method == "aria2.getVersion":
+            return {"version": "fake"}
+        if method == "aria2.addUri":
+            (url,), options = params
+            with self._lock:
+                self._next += 1
+                gid = f"{self._next:016x}"
+            if "missing" in url:
+                self.tasks[gid] = {"gid": gid, "status": "error", "errorCode": "3", "errorMessage": "Resource not found"}
+            elif "hang" in url:
+                self.tasks[gid] = {"gid": gid, "status": "active"}
+            else:
+                with open(os.path.join(options["dir"], options["out"]), "wb") as f:
+                    f.write(url.encode())
+                self.tasks[gid] = {"gid": gid, "status": "complete", "errorCode": "0"}
+            return gid
+        if method == "aria2.tellStatus":
+            return self.tasks[params[0]]
+        if method == "aria2.forceRemove":
+            self.tasks[params[0]]["status"] = "removed"
+            return params[0]
+        if method == "aria2.removeDownloadResult":
+            self.tasks.pop(params[0], None)
+            return "OK"
+        raise ValueError(f"unknown method {method}")
+
+    def dispatch(self, request: dict) -> dict:
+        if request["method"] == "system.multicall":
+            results = []
+            for call in request["params"][0]:
+                try:
+                    results.append([self.handle(call["methodName"], call["params"])])
+                except Exception as e:
+                    results.append({"code": 1, "message": str(e)})
+            return {"jsonrpc": "2.0", "id": request["id"], "result": results}
+        try:
+            return {"jsonrpc": "2.0", "id": request["id"], "result": self.handle(request["method"], request["params"])}
+        except Exception as e:
+            return {"jsonrpc": "2.0", "id": request["id"], "error": {"code": 1, "message": str(e)}}
+
+@pytest.fixture
+def fake_aria2():
+    fake = FakeAria2()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+            data = json.dumps(fake.dispatch(json.loads(body))).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield fake, f"http://127.0.0.1:{server.server_address[1]}/jsonrpc"
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def daemon(fake_aria2):
+    _, rpc_url = fake_aria2
+    daemon = Aria2Daemon(rpc_url, SECRET, poll_interval=0.02)
+    daemon.start()
+    yield daemon
+    daemon.close()
+
+def test_download_complete(fake_aria2, daemon, tmp_path):
+    fake, _ = fake_aria2
+    save_path = tmp_path / "1_p0.jpg"
+    daemon.download("https://i.pximg.net/img-original/1_p0.jpg", str(save_path))
+    assert save_path.read_bytes() == b"https://i.pximg.net/img-original/1_p0.jpg"
+    assert "aria2.tellStatus" in fake.calls
+    assert daemon._pending == {} and daemon._results == {}
+
+def test_error_code_maps_to_status(daemon, tmp_path):
+    with pytest.raises(Aria2Error) as excinfo:
+        daemon.download("https://i.pximg.net/missing.jpg", str(tmp_path / "missing.jpg"))
+    assert excinfo.value.status == 404
+    assert daemon._pending == {} and daemon._results == {}
+
+def test_timeout_cleans_up(fake_aria2, daemon, tmp_path):
+    fake, _ = fake_aria2
+    with pytest.raises(Aria2Error, match="下载超时"):
+        daemon.download("https://i.pximg.net/hang.jpg", str(tmp_path / "hang.jpg"), timeout=0.1)
+    assert "aria2.forceRemove" in fake.calls
+    time.sleep(0.1)
+    assert daemon._pending == {} and daemon._results == {}
+
+def test_concurrent_downloads(daemon, tmp_path):
+    paths = [tmp_path / f"{i}.jpg" for i in range(20)]
+    threads = [threading.Thread(target=daemon.download, args=(f"https://i.pximg.net/{i}.jpg", str(path)))
+               for i, path in enumerate(paths)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(path.exists() for path in paths)
+    assert daemon._pending == {} and daemon._results == {}
+
+def test_wrong_secret(fake_aria2):
+    _, rpc_url = fake_aria2
+    with pytest.raises(Aria2Error):
+        Aria2Daemon(rpc_url, "wrong").call("aria2.getVersion")
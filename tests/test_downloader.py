@@ -0,0 +1,166 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import asyncio
+import os
+import re
+import socket
+
+import aiohttp
+import pytest
+
+from core.engine import CrawlEngine
+from core.downloader import DownloadError
+from core.download_scheduler import BandwidthLimiter
+
+DATA = bytes(range(256)) * 3906 + bytes(64)  # 1,000,000 字节
+CUT = 262144
+
+class FakeImageServer:
+    """本地图片服务器替身，支持 Range；cut 大于 0 时第一次完整请求只发送 cut 字节就断开连接"""
+    def __init__(self, data: bytes, cut: int = 0, ranges: bool = True):
+        self.data = data
+        self.cut = cut
+        self.ranges = ranges
+        self.requests = []
+
+@pytest.fixture
+def server():
+    state = FakeImageServer(DATA)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            range_header = self.headers.get("Range")
+            state.requests.append(range_header)
+            if self.path == "/missing.jpg":
+                self.send_response(404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            start = 0
+            match = re.match(r"bytes=(\d+)-", range_header or "")
+            if match and state.ranges:
+                start = int(match.group(1))
+                if start >= len(state.data):
+                    self.send_response(416)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_response(206)
+                self.send_header("Content-Range", f"bytes {start}-{len(state.data) - 1}/{len(state.data)}")
+            else:
+                self.send_response(200)
+            body = state.data[start:]
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if state.cut and start == 0:
+                state.cut, cut = 0, state.cut
+                self.wfile.write(body[:cut])
+                self.wfile.flush()
+                self.close_connection = True
+                return
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    state.url = f"http://127.0.0.1:{httpd.server_address[1]}"
+    yield state
+    httpd.shutdown()
+    httpd.server_close()
+
+class EngineDownloader:
+    """在一个 CrawlEngine 中执行 stream 后端实际运行的下载协程"""
+    def __init__(self):
+        self.bandwidth = BandwidthLimiter(0)
+
+    def __call__(self, url: str, save_path: str, **kwargs) -> int:
+        async def run():
+            async with CrawlEngine(max_concurrency=4, host_limits={}, blocking_workers=2) as engine:
+                # 本机请求不走配置中的代理，流量统计与全局带宽限制器分开
+                engine.proxy = None
+                engine.bandwidth = self.bandwidth
+                return await engine.stream_download(url, save_path, **kwargs)
+        return asyncio.run(run())
+
+@pytest.fixture
+def download():
+    return EngineDownloader()
+
+def test_download(server, download, tmp_path):
+    save_path = str(tmp_path / "1_p0.jpg")
+    buffer = bytearray()
+    assert download(f"{server.url}/1_p0.jpg", save_path, buffer=buffer) == len(DATA)
+    with open(save_path, "rb") as f:
+        assert f.read() == DATA
+    assert bytes(buffer) == DATA
+    assert not os.path.exists(save_path + ".part")
+    assert server.requests == [None]
+    assert download.bandwidth.total == len(DATA)
+
+def test_resume_after_disconnect(server, download, tmp_path):
+    server.cut = CUT
+    save_path = str(tmp_path / "1_p0.jpg")
+    buffer = bytearray()
+    assert download(f"{server.url}/1_p0.jpg", save_path, buffer=buffer) == len(DATA)
+    with open(save_path, "rb") as f:
+        assert f.read() == DATA
+    # 从临时文件中已写入的位置续传，断开前最后一块不完整的数据可能没有写入
+    assert len(server.requests) == 2 and server.requests[0] is None
+    offset = int(re.match(r"bytes=(\d+)-", server.requests[1]).group(1))
+    assert 0 < offset <= CUT
+    assert not os.path.exists(save_path + ".part")
+    # 续传后内存中的数据不完整，调用方应改为读取文件
+    assert not buffer
+    assert download.bandwidth.total == len(DATA)
+
+def test_resume_existing_part(server, download, tmp_path):
+    save_path = str(tmp_path / "1_p0.jpg")
+    with open(save_path + ".part", "wb") as f:
+        f.write(DATA[:CUT])
+    download(f"{server.url}/1_p0.jpg", save_path)
+    with open(save_path, "rb") as f:
+        assert f.read() == DATA
+    assert server.requests == [f"bytes={CUT}-"]
+    assert download.bandwidth.total == len(DATA) - CUT
+
+def test_server_without_range(server, download, tmp_path):
+    server.ranges = False
+    save_path = str(tmp_path / "1_p0.jpg")
+    with open(save_path + ".part", "wb") as f:
+        f.write(b"stale")
+    buffer = bytearray()
+    download(f"{server.url}/1_p0.jpg", save_path, buffer=buffer)
+    with open(save_path, "rb") as f:
+        assert f.read() == DATA
+    # 服务器从头返回了完整内容，内存中的数据仍然可用
+    assert bytes(buffer) == DATA
+
+def test_complete_part_file(server, download, tmp_path):
+    save_path = str(tmp_path / "1_p0.jpg")
+    with open(save_path + ".part", "wb") as f:
+        f.write(DATA)
+    # 临时文件已完整时服务器返回 416，重新下载
+    download(f"{server.url}/1_p0.jpg", save_path)
+    with open(save_path, "rb") as f:
+        assert f.read() == DATA
+    assert server.requests == [f"bytes={len(DATA)}-", None]
+
+def test_error_status(server, download, tmp_path):
+    save_path = str(tmp_path / "missing.jpg")
+    with pytest.raises(DownloadError) as excinfo:
+        download(f"{server.url}/missing.jpg", save_path)
+    assert excinfo.value.status == 404
+    assert not os.path.exists(save_path)
+
+def test_refused_connection_not_resumed(download, tmp_path):
+    # 没有收到任何数据的失败直接抛出，由下载重试策略决定是否重试
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    save_path = str(tmp_path / "1_p0.jpg")
+    with pytest.raises(aiohttp.ClientConnectionError):
+        download(f"http://127.0.0.1:{port}/1_p0.jpg", save_path)
@@ -0,0 +1,68 @@
+import zipfile
+import io
+
+import numpy as np
+from PIL import Image as PILImage
+
+from core.frames import iter_encoder_frames
+from core.utils import zip_to_webp, gif_to_webp
+
+def make_frame(key: int, size: int = 64, alpha: bool = False, noise: int = 0) -> np.ndarray:
+    frame = np.zeros((size, size, 4), dtype=np.uint8)
+    frame[..., key % 3] = 200
+    frame[key * 4:key * 4 + 16, :, :3] = 255
+    frame[..., 3] = 255
+    if noise:
+        frame[..., :3] = np.clip(frame[..., :3].astype(np.int16) + noise, 0, 255)
+    if alpha:
+        frame[size // 2:, :, 3] = 128
+    return frame
+
+def read_durations(path) -> list[int]:
+    durations = []
+    with PILImage.open(path) as image:
+        for index in range(image.n_frames):
+            image.seek(index)
+            image.load()
+            durations.append(image.info["duration"])
+    return durations
+
+def test_duplicates_repeat_previous_image():
+    frames = [make_frame(0), make_frame(0, noise=1), make_frame(1), make_frame(1), make_frame(2)]
+    images = list(iter_encoder_frames(frames, threshold=2))
+    assert len(images) == 5
+    assert images[1] is images[0]
+    assert images[3] is images[2]
+    assert images[4] is not images[2]
+
+def test_threshold_zero_keeps_noisy_frames():
+    images = list(iter_encoder_frames([make_frame(0), make_frame(0, noise=1)], threshold=0))
+    assert images[1] is not images[0]
+
+def test_transparent_frames_composited_on_first_frame():
+    background, frame = make_frame(0), make_frame(1, alpha=True)
+    images = list(iter_encoder_frames([background, frame]))
+    expected = PILImage.alpha_composite(PILImage.fromarray(background), PILImage.fromarray(frame))
+    assert np.array_equal(np.asarray(images[1]), np.asarray(expected))
+
+def test_zip_to_webp_merges_duplicates(tmp_path):
+    frames = [make_frame(0), make_frame(0, noise=1), make_frame(0), make_frame(1), make_frame(2, alpha=True)]
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zip_ref:
+        for index, frame in enumerate(frames):
+            png = io.BytesIO()
+            PILImage.fromarray(frame).save(png, "PNG")
+            zip_ref.writestr(f"{index:06d}.png", png.getvalue())
+    metadata = {"frames": [{"file": f"{index:06d}.png", "delay": 50} for index in range(len(frames))]}
+    webp_path = str(tmp_path / "ugoira.webp")
+    zip_to_webp(buffer.getvalue(), webp_path, metadata)
+    # 重复帧由编码器合并，持续时间累加
+    assert read_durations(webp_path) == [150, 50, 50]
+
+def test_gif_to_webp_from_bytes(tmp_path):
+    images = [PILImage.fromarray(make_frame(key)[..., :3]) for key in (0, 0, 1)]
+    buffer = io.BytesIO()
+    images[0].save(buffer, "GIF", save_all=True, append_images=images[1:], duration=40, loop=0)
+    webp_path = str(tmp_path / "anim.webp")
+    gif_to_webp(buffer.getvalue(), webp_path)
+    assert read_durations(webp_path) == [80, 40]
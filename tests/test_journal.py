@@ -0,0 +1,53 @@
+import pytest
+
+from core.journal import Journal
+
+BOOKMARKS = [
+    {"id": "101", "userId": "7", "title": "晴れ", "tags": ["風景", "オリジナル"], "xRestrict": 0},
+    {"id": "102", "userId": "", "title": "-----", "tags": []},
+    {"id": "103", "userId": "8", "title": "夜", "tags": ["夜景"], "xRestrict": 1},
+]
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = Journal(str(tmp_path / "journal.sqlite3"))
+    yield journal
+    journal.close()
+
+def test_unfinished_returns_stored_bookmarks(journal):
+    journal.add_bookmarks(BOOKMARKS)
+    journal.mark_fetched(101, {"illust_details": {"id": "101"}}, ["101_p0"])
+    journal.mark_committed([103])
+    # 恢复时返回登记时保存的收藏信息，已删除作品的空 userId 原样保留
+    assert journal.unfinished() == BOOKMARKS[:2]
+
+def test_reopen_after_crash(tmp_path):
+    path = str(tmp_path / "journal.sqlite3")
+    journal = Journal(path)
+    journal.add_bookmarks(BOOKMARKS)
+    journal.mark_fetched(101, {"illust_details": {"id": "101"}}, ["101_p0", "101_p1"])
+    journal.mark_image("101_p0", 101, "downloaded", "/remote/101_p0.jpg")
+    journal.close()
+
+    journal = Journal(path)
+    assert journal.unfinished() == BOOKMARKS
+    assert journal.get_details(101) == {"illust_details": {"id": "101"}}
+    assert journal.image_state("101_p0") == ("downloaded", "/remote/101_p0.jpg", None)
+    journal.close()
+
+def test_re_adding_keeps_progress(journal):
+    journal.add_bookmarks(BOOKMARKS)
+    journal.mark_fetched(101, {"illust_details": {"id": "101"}}, ["101_p0"])
+    updated = dict(BOOKMARKS[0], title="晴れ（改）")
+    journal.add_bookmarks([updated])
+    assert journal.get_details(101) == {"illust_details": {"id": "101"}}
+    assert journal.unfinished()[0] == updated
+    assert journal.stats()["unfinished"] == 3
+
+def test_purge_committed(journal):
+    journal.add_bookmarks(BOOKMARKS)
+    journal.mark_fetched(103, {"illust_details": {"id": "103"}}, ["103_p0"])
+    journal.mark_committed([103])
+    assert journal.purge_committed() == 1
+    assert journal.image_state("103_p0") is None
+    assert [bookmark["id"] for bookmark in journal.unfinished()] == ["101", "102"]
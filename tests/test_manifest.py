@@ -0,0 +1,58 @@
+import os
+
+import pytest
+
+from core.manifest import OutputManifest
+
+ENCODER = "webp:q85:m6"
+
+@pytest.fixture
+def manifest(tmp_path):
+    manifest = OutputManifest(str(tmp_path / "manifest.sqlite"))
+    yield manifest
+    manifest.close()
+
+@pytest.fixture
+def files(tmp_path):
+    original = tmp_path / "1_p0.jpg"
+    compressed = tmp_path / "1_p0.webp"
+    original.write_bytes(b"original")
+    compressed.write_bytes(b"webp")
+    return str(original), str(compressed)
+
+def test_skip_unchanged(manifest, files):
+    original, compressed = files
+    manifest.record(1, original, "hash", compressed, ENCODER)
+    assert manifest.original_ok(1, original)
+    assert manifest.compressed_ok(1, original, compressed, ENCODER)
+    assert manifest.stats() == {"skipped_downloads": 1, "skipped_encodes": 1}
+
+def test_encoder_changed(manifest, files):
+    original, compressed = files
+    manifest.record(1, original, "hash", compressed, ENCODER)
+    assert not manifest.compressed_ok(1, original, compressed, "webp:q90:m6")
+
+def test_original_redownloaded(manifest, files):
+    original, compressed = files
+    manifest.record(1, original, "hash", compressed, ENCODER)
+    # 原图重新下载后内容和修改时间变化，旧的 WebP 需要重新编码
+    with open(original, "wb") as f:
+        f.write(b"new original")
+    assert not manifest.original_ok(1, original)
+    assert not manifest.compressed_ok(1, original, compressed, ENCODER)
+
+def test_original_touched(manifest, files):
+    original, compressed = files
+    manifest.record(1, original, "hash", compressed, ENCODER)
+    st = os.stat(original)
+    os.utime(original, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    assert not manifest.compressed_ok(1, original, compressed, ENCODER)
+
+def test_compressed_replaced(manifest, files):
+    original, compressed = files
+    manifest.record(1, original, "hash", compressed, ENCODER)
+    with open(compressed, "wb") as f:
+        f.write(b"other webp")
+    assert not manifest.compressed_ok(1, original, compressed, ENCODER)
+    os.remove(compressed)
+    assert not manifest.compressed_ok(1, original, compressed, ENCODER)
@@ -0,0 +1,204 @@
+from datetime import datetime
+import functools
+import json
+import stat
+import sys
+import os
+
+import pytest
+
+import core.retag as retag
+import core.utils as utils
+from core.models import Artwork, Image, Tag
+from core.retag import BulkRetagger, write_argfile, run_argfile, count_results
+
+# exiftool 替身：支持 -stay_open 常驻模式（pyexiftool 使用的 -echo4 / {readyNUM} 同步协议）和 -@ 参数文件。
+# 每个文件收到的参数以 JSON 记录到 FAKE_EXIFTOOL_LOG，文件名含 "broken" 时按写入失败输出。
+FAKE_EXIFTOOL = r'''
+import json
+import sys
+import os
+import re
+
+LOG = os.environ["FAKE_EXIFTOOL_LOG"]
+
+def process(args):
+    """处理一条命令，返回 (stdout, stderr, 退出码)"""
+    if "-ver" in args:
+        return "12.76\n", "", 0
+    files = [arg for arg in args if not arg.startswith("-")]
+    with open(LOG, "a", encoding="utf-8") as log:
+        log.write(json.dumps(args, ensure_ascii=False) + "\n")
+    path = files[-1]
+    if not os.path.exists(path):
+        return "    1 files weren't updated due to errors\n", f"Error: File not found - {path}\n", 1
+    if "broken" in os.path.basename(path):
+        return "    1 files weren't updated due to errors\n", f"Error: Not a valid WEBP - {path}\n", 1
+    return "    1 image files updated\n", "", 0
+
+def split_commands(lines):
+    command = []
+    for line in lines:
+        if line == "-execute":
+            yield command
+            command = []
+        else:
+            command.append(line)
+    if command:
+        yield command
+
+def argfile(path):
+    with open(path, encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    status = 0
+    for command in split_commands(lines):
+        out, err, code = process(command)
+        sys.stdout.write(out)
+        sys.stderr.write(err)
+        status = max(status, code)
+    return status
+
+def stay_open(common_args):
+    command = []
+    for raw in sys.stdin.buffer:
+        line = raw.decode("utf-8").rstrip("\n")
+        if line == "-stay_open":
+            continue
+        if line == "False":
+            return 0
+        match = re.fullmatch(r"-execute(\d*)", line)
+        if not match:
+            command.append(line)
+            continue
+        echo = None
+        if "-echo4" in command:
+            index = command.index("-echo4")
+            echo = command[index + 1]
+            del command[index:index + 2]
+        out, err, code = process(command + common_args)
+        sys.stdout.write(out + "{ready" + match.group(1) + "}\n")
+        if echo is not None:
+            err += echo.replace("${status}", str(code)) + "\n"
+        sys.stderr.write(err)
+        sys.stdout.flush()
+        sys.stderr.flush()
+        command = []
+    return 0
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if args[:2] == ["-stay_open", "True"]:
+        common = args[args.index("-common_args") + 1:] if "-common_args" in args else []
+        sys.exit(stay_open(common))
+    sys.exit(argfile(args[args.index("-@") + 1]))
+'''
+
+@pytest.fixture
+def fake_exiftool(tmp_path, monkeypatch):
+    path = tmp_path / "exiftool"
+    path.write_text(f"#!{sys.executable}\n" + FAKE_EXIFTOOL, encoding="utf-8")
+    path.chmod(path.stat().st_mode | stat.S_IXUSR)
+    log = tmp_path / "exiftool.log"
+    monkeypatch.setenv("FAKE_EXIFTOOL_LOG", str(log))
+
+    def calls() -> list[list[str]]:
+        if not log.exists():
+            return []
+        return [json.loads(line) for line in log.read_text(encoding="utf-8").splitlines()]
+
+    return str(path), calls
+
+def make_item(directory, index: int, name: str = None) -> tuple[Image, Artwork]:
+    artwork = Artwork(
+        id=1000 + index,
+        title=f"夏の海 {index}",
+        comment="一行目\n二行目",
+        user_id=42,
+        user_name="作者さん",
+        timestamp=datetime(2023, 7, 1, 12, 34, 56),
+        tags=[Tag("風景", "landscape"), Tag("オリジナル", "オリジナル")],
+    )
+    image = Image(id=f"{artwork.id}_p0", idNum=artwork.id, index=0, url="", width=1, height=1, ext="png")
+    image.compressed_path = str(directory / (name or f"作品_{index}.webp"))
+    with open(image.compressed_path, "wb") as f:
+        f.write(b"RIFF")
+    return image, artwork
+
+def split_commands(lines: list[bytes]) -> list[list[bytes]]:
+    commands = [[]]
+    for line in lines:
+        if line == b"-execute":
+            commands.append([])
+        else:
+            commands[-1].append(line)
+    return commands
+
+def test_write_argfile(tmp_path):
+    items = [make_item(tmp_path, 0), make_item(tmp_path, 1)]
+    path = tmp_path / "batch.args"
+    write_argfile(items, str(path))
+    commands = split_commands(path.read_bytes().splitlines())
+    assert len(commands) == 2
+    for (image, artwork), command in zip(items, commands):
+        assert command[-2:] == [b"-overwrite_original", image.compressed_path.encode("utf-8")]
+        text = [arg.decode("utf-8") for arg in command]
+        assert f"-XMP-dc:title=000 {artwork.title}" in text
+        # 参数文件按行分隔，值中的换行替换为空格
+        assert "-XMP-dc:description=一行目 二行目" in text
+        assert "-XMP-dc:Creator=作者さん" in text
+        assert "-DateTimeOriginal=2023:07:01 12:34:56" in text
+        assert "-XMP-dc:Subject=風景(landscape)" in text
+        assert "-XMP-dc:Subject=オリジナル" in text
+
+def test_run_argfile(tmp_path, fake_exiftool):
+    executable, calls = fake_exiftool
+    items = [make_item(tmp_path, 0), make_item(tmp_path, 1, "broken_1.webp"), make_item(tmp_path, 2)]
+    output = run_argfile(items, executable=executable)
+    assert count_results(output) == 2
+    assert "Not a valid WEBP" in output
+    assert [call[-1] for call in calls()] == [image.compressed_path for image, _ in items]
+    assert "-XMP-dc:Subject=風景(landscape)" in calls()[0]
+
+def test_process_batch_args(tmp_path, fake_exiftool, monkeypatch):
+    executable, calls = fake_exiftool
+    monkeypatch.setattr(utils.exiftool, "ExifTool", functools.partial(utils.exiftool.ExifTool, executable=executable))
+    items = [make_item(tmp_path, 0), make_item(tmp_path, 1)]
+    with utils.ExifToolWorker() as worker:
+        output = worker.process_batch(items)
+    assert count_results(output) == 2
+    # 启动时的 -ver 之外，一批文件在一次往返中按 -execute 分成每个文件一条命令
+    commands = [call for call in calls() if "-ver" not in call]
+    assert len(commands) == 2
+    for (image, artwork), command in zip(items, commands):
+        assert command[command.index("-overwrite_original") + 1] == image.compressed_path
+        assert f"-XMP-dc:title=000 {artwork.title}" in command
+        assert "-XMP-dc:Subject=オリジナル" in command
+
+@pytest.mark.parametrize("mode", ["argfile", "stay_open"])
+def test_bulk_retag_counts_failures_per_batch(tmp_path, fake_exiftool, monkeypatch, mode):
+    executable, calls = fake_exiftool
+    monkeypatch.setattr(retag, "run_argfile", functools.partial(run_argfile, executable=executable))
+    monkeypatch.setattr(utils.exiftool, "ExifTool", functools.partial(utils.exiftool.ExifTool, executable=executable))
+    items = [make_item(tmp_path, index) for index in range(5)]
+    items.append(make_item(tmp_path, 5, "broken_5.webp"))
+    missing = make_item(tmp_path, 6)
+    os.remove(missing[0].compressed_path)
+    items.append(missing)
+
+    stats = BulkRetagger(workers=2, batch_size=2, mode=mode).run(items)
+    assert stats["files"] == 6
+    assert stats["ok"] == 5
+    assert stats["failed"] == 1
+    assert stats["missing"] == 1
+    assert stats["batches"] == 3
+
+def test_bulk_retag_batch_error(tmp_path, monkeypatch):
+    # exiftool 无法启动时整批计为失败，其他批次继续处理
+    monkeypatch.setattr(retag, "run_argfile",
+                        functools.partial(run_argfile, executable=str(tmp_path / "missing-exiftool")))
+    items = [make_item(tmp_path, index) for index in range(3)]
+    stats = BulkRetagger(workers=1, batch_size=2, mode="argfile").run(items)
+    assert stats["files"] == 3
+    assert stats["ok"] == 0
+    assert stats["failed"] == 3
+    assert stats["batches"] == 2
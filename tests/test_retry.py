@@ -0,0 +1,69 @@
+import json
+
+import pytest
+import requests
+
+from core.retry import (RetryPolicy, RetryBudget, CircuitBreaker, HTTPStatusError, ApiError, AuthRequiredError,
+                        CircuitOpenError, classify, needs_cookies, RETRYABLE, FATAL, AUTH, WAIT)
+
+def make_policy(max_attempts=3, budget=10, threshold=100, cooldown=0.05):
+    return RetryPolicy("test", max_attempts, RetryBudget(budget), CircuitBreaker(threshold, cooldown),
+                       base_delay=0, max_delay=0)
+
+@pytest.mark.parametrize("error, kind", [
+    (HTTPStatusError(403), RETRYABLE),
+    (HTTPStatusError(429), RETRYABLE),
+    (HTTPStatusError(503), RETRYABLE),
+    (HTTPStatusError(404), FATAL),
+    (HTTPStatusError(401), AUTH),
+    (AuthRequiredError("被屏蔽"), AUTH),
+    (ApiError("作品已删除"), FATAL),
+    (json.JSONDecodeError("Expecting value", "<html>", 0), RETRYABLE),
+    (requests.ConnectionError(), RETRYABLE),
+    (CircuitOpenError("i.pximg.net", 1.0), WAIT),
+])
+def test_classify(error, kind):
+    assert classify(error) == kind
+
+def test_needs_cookies_only_for_anonymous_auth_errors():
+    assert needs_cookies(AuthRequiredError("被屏蔽"), use_cookies=False)
+    assert not needs_cookies(AuthRequiredError("被屏蔽"), use_cookies=True)
+    assert not needs_cookies(HTTPStatusError(403), use_cookies=False)
+
+def test_auth_error_is_not_retried():
+    policy = make_policy()
+    calls = []
+
+    def func():
+        calls.append(1)
+        raise AuthRequiredError("被屏蔽")
+
+    with pytest.raises(AuthRequiredError):
+        policy.run(func)
+    assert len(calls) == 1
+    assert policy.budget.used == 0
+
+def test_circuit_open_waits_without_spending_budget():
+    policy = make_policy(threshold=1, budget=0)
+    policy.breaker.record_failure("example.com")
+    calls = []
+
+    def func():
+        calls.append(1)
+        return "ok"
+
+    assert policy.run(func, host="example.com") == "ok"
+    assert calls == [1]
+    assert policy.budget.used == 0
+    assert policy.retries == 1
+
+def test_retryable_error_spends_budget():
+    policy = make_policy(max_attempts=5, budget=2)
+
+    def func():
+        raise HTTPStatusError(403)
+
+    with pytest.raises(HTTPStatusError):
+        policy.run(func)
+    assert policy.budget.used == 2
+    assert policy.retries == 2
@@ -0,0 +1,106 @@
+import multiprocessing
+import time
+import os
+
+import pytest
+
+from core.work_queue import WorkQueue
+
+LEASE = 0.3
+
+def bookmarks(count: int) -> list[dict]:
+    return [{"id": str(artwork_id), "userId": "1"} for artwork_id in range(1, count + 1)]
+
+@pytest.fixture
+def path(tmp_path):
+    path = str(tmp_path / "work_queue.sqlite3")
+    WorkQueue("sqlite", sqlite_path=path).enqueue(bookmarks(10))
+    return path
+
+def make_queue(path: str, owner: str, **kwargs) -> WorkQueue:
+    return WorkQueue("sqlite", lease_seconds=LEASE, owner=owner, sqlite_path=path, **kwargs)
+
+def ids(batch: list[dict]) -> list[int]:
+    return [int(bookmark["id"]) for bookmark in batch]
+
+def test_enqueue_is_idempotent(path):
+    queue = make_queue(path, "a")
+    assert queue.enqueue(bookmarks(12)) == 2
+    assert queue.stats() == {"pending": 12, "leased": 0, "done": 0, "failed": 0}
+
+def test_active_lease_is_not_claimed_twice(path):
+    a, b = make_queue(path, "a"), make_queue(path, "b")
+    assert ids(a.claim(6)) == [1, 2, 3, 4, 5, 6]
+    assert ids(b.claim(6)) == [7, 8, 9, 10]
+    assert b.claim(6) == []
+
+def test_stale_owner_cannot_change_taken_over_rows(path):
+    a, b, c = make_queue(path, "a"), make_queue(path, "b"), make_queue(path, "c")
+    batch = ids(a.claim(5))
+    time.sleep(LEASE * 1.5)
+    assert ids(b.claim(5)) == batch
+    # a 的租约已过期并被 b 接手，a 的续约、失败和完成都不生效
+    assert a.heartbeat(batch) == []
+    assert a.fail(batch) == 0
+    assert a.complete(batch) == 0
+    assert ids(c.claim(5)) == [6, 7, 8, 9, 10]
+    assert sorted(b.heartbeat(batch)) == batch
+    assert b.complete(batch) == 5
+    assert c.stats() == {"pending": 0, "leased": 5, "done": 5, "failed": 0}
+
+def test_fail_requeues_until_attempts_run_out(path):
+    a = make_queue(path, "a", max_attempts=2)
+    assert a.fail(ids(a.claim(1))) == 1
+    assert ids(a.claim(1)) == [1]
+    assert a.fail([1]) == 1
+    assert a.stats()["failed"] == 1
+    assert ids(a.claim(1)) == [2]
+
+def test_expired_leases_stop_after_max_attempts(path):
+    queue = make_queue(path, "a", max_attempts=2)
+    for _ in range(2):
+        assert ids(queue.claim(1)) == [1]
+        # 进程在处理中崩溃，没有调用 complete 或 fail
+        time.sleep(LEASE * 1.5)
+    assert ids(queue.claim(1)) == [2]
+    assert queue.stats()["failed"] == 1
+
+def crash_worker(path: str) -> None:
+    """领取一批后不续约也不完成就退出，模拟进程崩溃"""
+    make_queue(path, "crashed").claim(4)
+    os._exit(1)
+
+def drain_worker(path: str, owner: str, results) -> None:
+    queue = make_queue(path, owner)
+    while True:
+        batch = ids(queue.claim(2))
+        if not batch:
+            if queue.stats()["leased"] == 0:
+                break
+            time.sleep(LEASE / 3)
+            continue
+        time.sleep(0.05)
+        held = set(queue.heartbeat(batch))
+        queue.complete([artwork_id for artwork_id in batch if artwork_id in held])
+        for artwork_id in batch:
+            results.put((owner, artwork_id))
+
+def test_processes_take_over_crashed_lease(path):
+    context = multiprocessing.get_context("fork")
+    crashed = context.Process(target=crash_worker, args=(path,))
+    crashed.start()
+    crashed.join()
+    assert make_queue(path, "check").stats()["leased"] == 4
+
+    results = context.Queue()
+    workers = [context.Process(target=drain_worker, args=(path, f"worker-{i}", results)) for i in range(3)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(timeout=30)
+        assert worker.exitcode == 0
+    processed = [results.get(timeout=5) for _ in range(10)]
+    assert results.empty()
+    # 崩溃进程领取的 4 个作品在租约过期后被其他进程接手，每个作品只处理一次
+    assert sorted(artwork_id for _, artwork_id in processed) == list(range(1, 11))
+    assert make_queue(path, "check").stats() == {"pending": 0, "leased": 0, "done": 10, "failed": 0}
@@ -0,0 +1,103 @@
+from datetime import datetime
+import xml.etree.ElementTree as ET
+import zipfile
+import io
+
+from PIL import Image as PILImage
+
+from core.models import Artwork, ArtworkType, Image, Tag
+from core.xmp import build_xmp, build_exif, DEFAULT_DATETIME
+from core.compressor import CompressJob, run_compress_job
+
+NS = {
+    "rdf": "http://www.w3.org/1999/02/22-rdf-syntax-ns#",
+    "dc": "http://purl.org/dc/elements/1.1/",
+}
+
+def make_artwork(**kwargs) -> Artwork:
+    values = dict(
+        id=123456,
+        title="夏の海 <sketch> & ラフ",
+        comment="説明\n二行目\x07",
+        user_id=42,
+        user_name="作者さん",
+        aiType=2,
+        timestamp=datetime(2023, 7, 1, 12, 34, 56),
+        tags=[Tag("風景", "landscape"), Tag("オリジナル", "オリジナル"), Tag("女の子", "girl")],
+    )
+    values.update(kwargs)
+    return Artwork(**values)
+
+def make_image(artwork: Artwork, index: int = 0, ext: str = "png") -> Image:
+    return Image(id=f"{artwork.id}_p{index}", idNum=artwork.id, index=index, url="", width=32, height=32, ext=ext)
+
+def read_metadata(path: str) -> tuple[ET.Element, PILImage.Exif]:
+    with PILImage.open(path) as image:
+        return ET.fromstring(image.info["xmp"]), image.getexif()
+
+def subjects(xmp: ET.Element) -> list[str]:
+    return [li.text for li in xmp.findall(".//dc:subject/rdf:Bag/rdf:li", NS)]
+
+def title(xmp: ET.Element) -> str:
+    return xmp.find(".//dc:title/rdf:Alt/rdf:li", NS).text
+
+def date_time_original(exif: PILImage.Exif) -> str:
+    return exif.get_ifd(0x8769)[0x9003]
+
+def png_bytes(color=(200, 30, 30, 255)) -> bytes:
+    buffer = io.BytesIO()
+    PILImage.new("RGBA", (32, 32), color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+EXPECTED_SUBJECTS = ["[pixiv]", "id:123456", "user:42", "AI生成", "風景(landscape)", "オリジナル", "女の子(girl)"]
+
+def test_build_xmp_escapes_and_keeps_unicode():
+    artwork = make_artwork()
+    xmp = ET.fromstring(build_xmp(make_image(artwork), artwork))
+    assert title(xmp) == "000 夏の海 <sketch> & ラフ"
+    assert subjects(xmp) == EXPECTED_SUBJECTS
+    # XML 不允许的控制字符被去掉
+    assert xmp.find(".//dc:description/rdf:Alt/rdf:li", NS).text == "説明\n二行目"
+    assert xmp.find(".//dc:creator/rdf:Seq/rdf:li", NS).text == "作者さん"
+
+def test_deleted_image_subject():
+    artwork = make_artwork(aiType=None)
+    image = make_image(artwork)
+    image.is_deleted = True
+    xmp = ET.fromstring(build_xmp(image, artwork))
+    assert subjects(xmp)[:4] == ["[pixiv]", "id:123456", "user:42", "[已删除]"]
+
+def test_build_exif_without_timestamp():
+    exif = PILImage.Exif()
+    exif.load(build_exif(make_artwork(timestamp=None)))
+    assert date_time_original(exif) == DEFAULT_DATETIME
+
+def test_encode_image_with_metadata(tmp_path):
+    artwork = make_artwork()
+    image = make_image(artwork)
+    output = str(tmp_path / "夏の海_p0.webp")
+    job = CompressJob("image", str(tmp_path / "夏の海_p0.png"), output, input_bytes=png_bytes(),
+                      xmp=build_xmp(image, artwork), exif=build_exif(artwork))
+    run_compress_job(job)
+    xmp, exif = read_metadata(output)
+    assert title(xmp) == "000 夏の海 <sketch> & ラフ"
+    assert subjects(xmp) == EXPECTED_SUBJECTS
+    assert date_time_original(exif) == "2023:07:01 12:34:56"
+
+def test_encode_ugoira_with_metadata(tmp_path):
+    artwork = make_artwork(type=ArtworkType.UGOIRA)
+    image = make_image(artwork, ext="zip")
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zf:
+        zf.writestr("000000.png", png_bytes((200, 30, 30, 255)))
+        zf.writestr("000001.png", png_bytes((30, 200, 30, 255)))
+    metadata = {"frames": [{"file": "000000.png", "delay": 100}, {"file": "000001.png", "delay": 200}]}
+    output = str(tmp_path / "123456_ugoira.webp")
+    job = CompressJob("ugoira", str(tmp_path / "123456_ugoira.zip"), output, metadata=metadata,
+                      input_bytes=buffer.getvalue(), xmp=build_xmp(image, artwork), exif=build_exif(artwork))
+    run_compress_job(job)
+    xmp, exif = read_metadata(output)
+    assert subjects(xmp) == EXPECTED_SUBJECTS
+    assert date_time_original(exif) == "2023:07:01 12:34:56"
+    with PILImage.open(output) as webp:
+        assert webp.n_frames == 2